@@ -0,0 +1,351 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Throughput/latency benchmark of the lab topologies
+#
+# Starts one of the lab topologies in Mininet, runs ping RTT and iperf TCP/UDP throughput
+# tests for a set of traffic patterns, with all host pairs of a pattern running in parallel,
+# and writes the samples as JSON and CSV (see results.py). The controller is not started
+# here, run it separately and pass its name with --controller so results can be told apart:
+#
+#   ryu-manager lab2/ft_routing.py &
+#   sudo python3 bench/netbench.py fattree -k 4 --controller ft_routing \
+#       --tests ping,tcp --patterns permutation,stride --baseline bench/baselines/fattree.json
+#
+# A run is saved as a baseline with --save-baseline, later runs are compared against it with
+# --baseline. With --max-regression the exit code is 1 if any median got worse by more than
+# the given percentage, so a controller change can be checked in one command.
+
+import argparse
+import importlib.util
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+
+from mininet.clean import cleanup
+from mininet.link import TCLink
+from mininet.log import info, setLogLevel
+from mininet.net import Mininet
+from mininet.node import OVSBridge, OVSKernelSwitch, RemoteController
+
+import results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IPERF_PORT = 5201
+
+
+# The topology files are not packages (and fat-tree.py is not a valid module name)
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def add_remote_controller(net, args):
+    net.addController('c0', controller=RemoteController, ip=args.controller_ip, port=args.controller_port)
+
+
+def make_bridge(args):
+    topo = load_module('network_topo', os.path.join(ROOT, 'lab0', 'network_topo.py'))
+    # lab0 runs without a controller, so the switches have to be standalone learning bridges
+    return Mininet(topo=topo.BridgeTopo(), switch=OVSBridge, link=TCLink, controller=None)
+
+
+def make_network(args):
+    topo = load_module('run_network', os.path.join(ROOT, 'lab1', 'run_network.py'))
+    net = Mininet(topo=topo.NetworkTopo(), switch=OVSKernelSwitch, link=TCLink, controller=None)
+    add_remote_controller(net, args)
+    return net
+
+
+def make_fattree(args):
+    # fat-tree.py imports topo.py and bringup.py from its own directory
+    sys.path.insert(0, os.path.join(ROOT, 'lab2'))
+    fat_tree = load_module('fat_tree', os.path.join(ROOT, 'lab2', 'fat-tree.py'))
+    return fat_tree.make_mininet_instance(fat_tree.Fattree(num_ports=args.k),
+                                          controller_ip=args.controller_ip, controller_port=args.controller_port,
+                                          bw=args.bw)
+
+
+TOPOLOGIES = {
+    'bridge': make_bridge,
+    'network': make_network,
+    'fattree': make_fattree,
+}
+
+
+# Traffic patterns, each returns a list of (src, dst) host pairs
+
+def pattern_all(hosts, args, rng):
+    return [(src, dst) for src in hosts for dst in hosts if src is not dst]
+
+
+# Every host sends to exactly one other host and receives from exactly one (a derangement)
+def pattern_permutation(hosts, args, rng):
+    dsts = list(hosts)
+    while True:
+        rng.shuffle(dsts)
+        if all(src is not dst for src, dst in zip(hosts, dsts)):
+            return list(zip(hosts, dsts))
+
+
+# Host i sends to host (i + stride) mod n, with hosts ordered by address like in the fat-tree paper
+def pattern_stride(hosts, args, rng):
+    stride = args.stride or len(hosts) // 2
+    return [(hosts[i], hosts[(i + stride) % len(hosts)]) for i in range(len(hosts))
+            if (i + stride) % len(hosts) != i]
+
+
+# Every host sends to a uniformly chosen other host, receivers may get several flows
+def pattern_random(hosts, args, rng):
+    return [(src, rng.choice([dst for dst in hosts if dst is not src])) for src in hosts]
+
+
+PATTERNS = {
+    'all': pattern_all,
+    'permutation': pattern_permutation,
+    'stride': pattern_stride,
+    'random': pattern_random,
+}
+
+
+def output_of(popen, timeout):
+    try:
+        out, _ = popen.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        popen.kill()
+        out, _ = popen.communicate()
+    return out.decode(errors='replace') if isinstance(out, bytes) else out
+
+
+RTT_RE = re.compile(r'time=([\d.]+) ms')
+LOSS_RE = re.compile(r'([\d.]+)% packet loss')
+
+
+def run_ping(pairs, args, result, pattern):
+    procs = [(src, dst, src.popen(['ping', '-c', str(args.count), '-i', str(args.interval), dst.IP()],
+                                  stderr=subprocess.STDOUT))
+             for src, dst in pairs]
+    timeout = args.count * args.interval + 10
+    for src, dst, proc in procs:
+        out = output_of(proc, timeout)
+        for rtt in RTT_RE.findall(out):
+            result.add(pattern, 'ping', 'rtt_ms', src.name, dst.name, float(rtt))
+        loss = LOSS_RE.search(out)
+        result.add(pattern, 'ping', 'loss_pct', src.name, dst.name, float(loss.group(1)) if loss else 100.0)
+
+
+# iperf2 CSV report (-y C):
+# time,src_ip,src_port,dst_ip,dst_port,id,interval,bytes,bits_per_second[,jitter_ms,lost,total,loss_pct,ooo]
+def parse_iperf_csv(out):
+    reports = [line.split(',') for line in out.splitlines() if line.count(',') >= 8]
+    return reports[-1] if reports else None
+
+
+# One server per receiver, iperf2 serves concurrent clients
+def start_iperf_servers(pairs, proto):
+    servers = [dst.popen(['iperf', '-s', '-p', str(IPERF_PORT)] + proto,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+               for dst in {dst.name: dst for _, dst in pairs}.values()]
+    time.sleep(1)
+    return servers
+
+
+def stop_iperf_servers(servers):
+    for server in servers:
+        server.terminate()
+        server.wait()
+
+
+def run_iperf(pairs, args, result, pattern, udp):
+    test = 'udp' if udp else 'tcp'
+    proto = ['-u'] if udp else []
+
+    servers = start_iperf_servers(pairs, proto)
+
+    rate = ['-b', args.udp_rate] if udp else []
+    procs = [(src, dst, src.popen(['iperf', '-c', dst.IP(), '-p', str(IPERF_PORT), '-t', str(args.duration),
+                                   '-y', 'C'] + proto + rate))
+             for src, dst in pairs]
+    try:
+        for src, dst, proc in procs:
+            report = parse_iperf_csv(output_of(proc, args.duration + 15))
+            if report is None:
+                # Nothing got through, counted as zero throughput instead of being dropped
+                result.add(pattern, test, 'throughput_mbps', src.name, dst.name, 0.0)
+                continue
+            result.add(pattern, test, 'throughput_mbps', src.name, dst.name, float(report[8]) / 1e6)
+            # For UDP the last line is the server report with the receiver side jitter and loss
+            if udp and len(report) >= 13:
+                result.add(pattern, test, 'jitter_ms', src.name, dst.name, float(report[9]))
+                result.add(pattern, test, 'loss_pct', src.name, dst.name, float(report[12]))
+    finally:
+        stop_iperf_servers(servers)
+
+
+# Mouse transfers one after the other until the elephants are done, one line per completed transfer
+MOUSE_LOOP = ('end=$(($(date +%s) + {duration})); while [ $(date +%s) -lt $end ]; do '
+              'start=$(date +%s.%N); iperf -c {ip} -p {port} -n {size} >/dev/null 2>&1 && '
+              'echo "fct $start $(date +%s.%N)"; done')
+FCT_RE = re.compile(r'^fct ([\d.]+) ([\d.]+)$', re.MULTILINE)
+
+
+# Elephants and mice at the same time: the first --elephants pairs send TCP for --duration seconds,
+# the other pairs send --mouse-size transfers meanwhile. Records the elephant throughput and the
+# completion time of every mouse transfer, both suffer when ECMP hashes elephants onto the same port.
+def run_skewed(pairs, args, result, pattern):
+    elephants = pairs[:args.elephants]
+    mice = pairs[args.elephants:]
+    servers = start_iperf_servers(pairs, [])
+    procs = [(src, dst, src.popen(['iperf', '-c', dst.IP(), '-p', str(IPERF_PORT), '-t', str(args.duration),
+                                   '-y', 'C']))
+             for src, dst in elephants]
+    mouse_procs = [(src, dst, src.popen(['sh', '-c', MOUSE_LOOP.format(duration=args.duration, ip=dst.IP(),
+                                                                       port=IPERF_PORT, size=args.mouse_size)]))
+                   for src, dst in mice]
+    try:
+        for src, dst, proc in procs:
+            report = parse_iperf_csv(output_of(proc, args.duration + 15))
+            result.add(pattern, 'skewed', 'throughput_mbps', src.name, dst.name,
+                       float(report[8]) / 1e6 if report is not None else 0.0)
+        for src, dst, proc in mouse_procs:
+            for start, end in FCT_RE.findall(output_of(proc, args.duration + 30)):
+                result.add(pattern, 'skewed', 'fct_s', src.name, dst.name, float(end) - float(start))
+    finally:
+        stop_iperf_servers(servers)
+
+
+TESTS = {
+    'ping': lambda pairs, args, result, pattern: run_ping(pairs, args, result, pattern),
+    'tcp': lambda pairs, args, result, pattern: run_iperf(pairs, args, result, pattern, udp=False),
+    'udp': lambda pairs, args, result, pattern: run_iperf(pairs, args, result, pattern, udp=True),
+    'skewed': run_skewed,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def host_key(host):
+    return tuple(int(part) for part in host.IP().split('.'))
+
+
+def run(args):
+    tests = args.tests.split(',')
+    patterns = args.patterns.split(',')
+    for name in tests:
+        if name not in TESTS:
+            raise SystemExit(f"unknown test {name}, choose from {', '.join(TESTS)}")
+    for name in patterns:
+        if name not in PATTERNS:
+            raise SystemExit(f"unknown pattern {name}, choose from {', '.join(PATTERNS)}")
+
+    meta = {
+        'topology': args.topology,
+        'k': args.k if args.topology == 'fattree' else None,
+        'controller': args.controller,
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'tests': tests,
+        'patterns': patterns,
+        'seed': args.seed,
+        'count': args.count,
+        'duration': args.duration,
+        'udp_rate': args.udp_rate,
+        'bw': args.bw,
+        'elephants': args.elephants,
+        'mouse_size': args.mouse_size,
+    }
+    result = results.BenchResult(meta)
+    rng = random.Random(args.seed)
+
+    cleanup()
+    net = TOPOLOGIES[args.topology](args)
+    net.start()
+    try:
+        if net.controllers and not net.waitConnected(timeout=args.connect_timeout):
+            raise SystemExit('switches did not connect to the controller')
+        hosts = sorted(net.hosts, key=host_key)
+        if args.hosts:
+            hosts = [net.get(name) for name in args.hosts.split(',')]
+        if args.warmup:
+            # Lets reactive controllers learn the hosts before anything is measured
+            net.ping(hosts, timeout=1)
+
+        for pattern in patterns:
+            pairs = PATTERNS[pattern](hosts, args, rng)
+            for test in tests:
+                info(f"*** {pattern} {test}: {len(pairs)} pairs\n")
+                TESTS[test](pairs, args, result, pattern)
+    finally:
+        net.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput/latency benchmark of the lab topologies')
+    parser.add_argument('topology', choices=TOPOLOGIES)
+    parser.add_argument('-k', type=int, default=4, help='number of ports per fat-tree switch')
+    parser.add_argument('--controller', default='', help='name of the running controller, stored with the results')
+    parser.add_argument('--controller-ip', default='127.0.0.1')
+    parser.add_argument('--controller-port', type=int, default=6653)
+    parser.add_argument('--connect-timeout', type=float, default=30)
+    parser.add_argument('--tests', default='ping,tcp,udp', help=f"comma separated, from {', '.join(TESTS)}")
+    parser.add_argument('--patterns', default='permutation', help=f"comma separated, from {', '.join(PATTERNS)}")
+    parser.add_argument('--hosts', help='comma separated host names, default all hosts')
+    parser.add_argument('--stride', type=int, default=0, help='stride pattern offset, default half the hosts')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the permutation and random patterns')
+    parser.add_argument('--count', type=int, default=20, help='pings per pair')
+    parser.add_argument('--interval', type=float, default=0.2, help='seconds between pings')
+    parser.add_argument('--duration', type=int, default=10, help='seconds per iperf run')
+    parser.add_argument('--udp-rate', default='10M', help='iperf UDP sending rate per pair')
+    parser.add_argument('--bw', type=float, help='bandwidth of every fat-tree link in Mbit/s, default unlimited')
+    parser.add_argument('--elephants', type=int, default=4, help='long TCP pairs of the skewed test')
+    parser.add_argument('--mouse-size', default='100K', help='bytes per mouse transfer of the skewed test')
+    parser.add_argument('--no-warmup', dest='warmup', action='store_false')
+    parser.add_argument('--out', help='output path without extension, default bench/results/<topology>-<time>')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--save-baseline', help='also write the results JSON to this path')
+    parser.add_argument('--max-regression', type=float,
+                        help='exit with 1 if a median got worse than the baseline by more than this percentage')
+    args = parser.parse_args()
+
+    setLogLevel('info')
+    result = run(args)
+
+    out = args.out or os.path.join(ROOT, 'bench', 'results', f"{args.topology}-{time.strftime('%Y%m%d-%H%M%S')}")
+    sys.exit(results.report(result, out, args.save_baseline, args.baseline, args.max_regression))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,660 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Controller benchmark with simulated OpenFlow 1.3 switches (like cbench)
+#
+# Many simulated datapaths connect to the controller and send synthetic packet-ins, no
+# Mininet, Open vSwitch or root rights are needed. The simulated switches have no flow
+# tables, every packet is a packet-in, so this measures the packet-in path of the controller:
+# packet-ins/s answered, flow-mods/s, the latency until the first flow-mod and until the
+# packet-out of a packet-in, and the memory growth of the controller process.
+#
+#   python3 bench/ofbench.py fattree --app lab2/ft_routing.py --stream ip
+#   python3 bench/ofbench.py l2 --switches 32 --app lab1/ans_controller.py --stream mac --window 1
+#   python3 bench/ofbench.py lab1 --port 6653 --pid $(pgrep -f ryu-manager)   # running controller
+#
+# Packet-ins are matched with the responses in order per switch, so latencies are exact with
+# --window 1 (one outstanding packet-in per switch) and approximate with larger windows.
+# LLDP packet-outs are looped back to the neighbor of the fabric as packet-ins, so
+# controllers relying on link discovery (ryu-manager --observe-links) see the topology.
+#
+# Like a switch with packet buffers, a simulated switch keeps the frame and only sends the
+# first miss_send_len bytes (OFPT_SET_CONFIG) with a buffer_id once the controller asks for
+# it. --buffers 0 truncates without buffering like Open vSwitch. The bytes on the control
+# channel are measured, --payload 1470 sends iperf sized packets:
+#
+#   python3 bench/ofbench.py l2 --app lab1/ans_controller.py --stream mac --payload 1470
+# Results are written and compared against a baseline like the ones of netbench.py.
+
+import argparse
+import asyncio
+import collections
+import ipaddress
+import os
+import random
+import struct
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'lab2'))
+
+from common.packet_headers import checksum
+
+import results
+
+
+# OpenFlow 1.3 wire format, only the messages a switch has to answer or send
+OFP_VERSION = 0x04
+OFPT_HELLO = 0
+OFPT_ERROR = 1
+OFPT_ECHO_REQUEST = 2
+OFPT_ECHO_REPLY = 3
+OFPT_FEATURES_REQUEST = 5
+OFPT_FEATURES_REPLY = 6
+OFPT_GET_CONFIG_REQUEST = 7
+OFPT_GET_CONFIG_REPLY = 8
+OFPT_SET_CONFIG = 9
+OFPT_PACKET_IN = 10
+OFPT_PACKET_OUT = 13
+OFPT_FLOW_MOD = 14
+OFPT_MULTIPART_REQUEST = 18
+OFPT_MULTIPART_REPLY = 19
+OFPT_BARRIER_REQUEST = 20
+OFPT_BARRIER_REPLY = 21
+OFPT_ROLE_REQUEST = 24
+OFPT_ROLE_REPLY = 25
+
+OFPMP_PORT_DESC = 13
+OFPAT_OUTPUT = 0
+OFP_NO_BUFFER = 0xffffffff
+OFPCML_NO_BUFFER = 0xffff
+OFPR_NO_MATCH = 0
+
+OFP_HEADER = struct.Struct('!BBHI')
+ETH_TYPE_IP = 0x0800
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_LLDP = 0x88cc
+BROADCAST = b'\xff' * 6
+
+
+def mac_bytes(mac):
+    return bytes.fromhex(mac.replace(':', ''))
+
+
+def ofp_msg(msg_type, xid, body=b''):
+    return OFP_HEADER.pack(OFP_VERSION, msg_type, OFP_HEADER.size + len(body), xid) + body
+
+
+def features_reply(xid, dpid):
+    return ofp_msg(OFPT_FEATURES_REPLY, xid, struct.pack('!QIBB2xII', dpid, 0, 254, 0, 0x4f, 0))
+
+
+def port_desc_reply(xid, dpid, ports):
+    body = b''
+    for port in ports:
+        hw_addr = struct.pack('!HI', dpid & 0xffff, port)
+        name = f"s{dpid:x}-eth{port}".encode()[:15]
+        # 10 Gb/s copper full duplex, link up
+        body += struct.pack('!I4x6s2x16sIIIIIIII', port, hw_addr, name, 0, 0, 0x800, 0x800, 0x800, 0,
+                            10000000, 10000000)
+    return ofp_msg(OFPT_MULTIPART_REPLY, xid, struct.pack('!HH4x', OFPMP_PORT_DESC, 0) + body)
+
+
+# OXM match with only the in_port field, padded to a multiple of 8 bytes.
+# The frame is truncated to max_len bytes, total_len stays the length of the whole frame.
+def packet_in(dpid_xid, in_port, frame, buffer_id=OFP_NO_BUFFER, max_len=OFPCML_NO_BUFFER):
+    match = struct.pack('!HHII4x', 1, 12, 0x80000004, in_port)
+    data = frame if max_len == OFPCML_NO_BUFFER else frame[:max_len]
+    body = struct.pack('!IHBBQ', buffer_id, len(frame), OFPR_NO_MATCH, 0, 0) + match + b'\x00\x00' + data
+    return ofp_msg(OFPT_PACKET_IN, dpid_xid, body)
+
+
+# Buffer ID, output ports and data of a packet-out
+def parse_packet_out(body):
+    buffer_id, _, actions_len = struct.unpack_from('!IIH', body)
+    ports = []
+    offset = 16
+    end = offset + actions_len
+    while offset < end:
+        action_type, action_len = struct.unpack_from('!HH', body, offset)
+        if action_type == OFPAT_OUTPUT:
+            ports.append(struct.unpack_from('!I', body, offset + 4)[0])
+        offset += max(action_len, 8)
+    return buffer_id, ports, body[end:]
+
+
+# Synthetic frames
+
+def eth_frame(dst, src, ethertype, payload):
+    frame = dst + src + struct.pack('!H', ethertype) + payload
+    return frame + b'\x00' * (60 - len(frame)) if len(frame) < 60 else frame
+
+
+def arp_request(src_mac, src_ip, dst_ip):
+    payload = struct.pack('!HHBBH6s4s6s4s', 1, ETH_TYPE_IP, 6, 4, 1, src_mac, ipaddress.IPv4Address(src_ip).packed,
+                          b'\x00' * 6, ipaddress.IPv4Address(dst_ip).packed)
+    return eth_frame(BROADCAST, src_mac, ETH_TYPE_ARP, payload)
+
+
+def udp_packet(dst_mac, src_mac, src_ip, dst_ip, sport, dport, payload=18):
+    udp = struct.pack('!HHHH', sport, dport, 8 + payload, 0) + b'\x00' * payload
+    header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                         ipaddress.IPv4Address(src_ip).packed, ipaddress.IPv4Address(dst_ip).packed)
+    header = header[:10] + struct.pack('!H', checksum(header)) + header[12:]
+    return eth_frame(dst_mac, src_mac, ETH_TYPE_IP, header + udp)
+
+
+# A simulated network: switch ports, the links between them and where the hosts are attached
+
+Host = collections.namedtuple('Host', 'name ip mac dpid port gateway') # gateway: (dpid, port, mac) or None
+
+
+class Fabric:
+
+    def __init__(self):
+        self.ports = {} # {dpid: [port]}
+        self.links = {} # {(dpid, port): (dpid, port)}
+        self.hosts = []
+        self.payload = 18 # UDP payload bytes of the IP streams
+
+    def add_switch(self, dpid, num_ports):
+        self.ports[dpid] = list(range(1, num_ports + 1))
+
+    def add_link(self, a, a_port, b, b_port):
+        self.links[(a, a_port)] = (b, b_port)
+        self.links[(b, b_port)] = (a, a_port)
+
+
+# The lab 1 network of run_network.py, s1 and s2 are switches, s3 is the router
+def lab1_fabric(args):
+    fabric = Fabric()
+    fabric.add_switch(1, 3)
+    fabric.add_switch(2, 2)
+    fabric.add_switch(3, 3)
+    fabric.add_link(1, 3, 3, 1)
+    fabric.add_link(2, 2, 3, 2)
+    gateways = {1: (3, 1, mac_bytes('00:00:00:00:01:01')), 2: (3, 2, mac_bytes('00:00:00:00:01:02'))}
+    fabric.hosts = [
+        Host('h1', '10.0.1.2', mac_bytes('00:00:00:00:00:01'), 1, 1, gateways[1]),
+        Host('h2', '10.0.1.3', mac_bytes('00:00:00:00:00:02'), 1, 2, gateways[1]),
+        Host('ser', '10.0.2.2', mac_bytes('00:00:00:00:00:03'), 2, 1, gateways[2]),
+    ]
+    return fabric
+
+
+# cbench style: independent switches (dpids from 0x100, dpid 3 is the lab 1 router) with
+# --macs hosts each, spread over the ports
+def l2_fabric(args):
+    fabric = Fabric()
+    for i in range(args.switches):
+        dpid = 0x100 + i
+        fabric.add_switch(dpid, args.ports)
+        for j in range(args.macs):
+            mac = struct.pack('!HI', dpid, j + 1)
+            ip = f"10.{(dpid >> 8) & 0xff}.{dpid & 0xff}.{j % 250 + 1}"
+            fabric.hosts.append(Host(f"{dpid:x}-{j}", ip, mac, dpid, j % args.ports + 1, None))
+    return fabric
+
+
+# The fat-tree of lab2/topo.py with its addresses and port numbers
+def fattree_fabric(args):
+    import topo
+    ft = topo.Fattree(args.k)
+    fabric = Fabric()
+    index = ft.index
+    for switch in ft.switches:
+        fabric.add_switch(index.get_by_id(switch.id).dpid, args.k)
+    for server in ft.servers:
+        address = index.get_by_id(server.id)
+        ((edge_id, edge_port),) = ft.port_map.get_ports(server.id).values()
+        fabric.hosts.append(Host(server.id, address.ip, mac_bytes(address.mac),
+                                 index.get_by_id(edge_id).dpid, edge_port, None))
+    for lnode, lport, rnode, rport in ft.port_map.links:
+        left, right = index.get_by_id(lnode), index.get_by_id(rnode)
+        if left.dpid is not None and right.dpid is not None:
+            fabric.add_link(left.dpid, lport, right.dpid, rport)
+    return fabric
+
+
+FABRICS = {
+    'lab1': lab1_fabric,
+    'l2': l2_fabric,
+    'fattree': fattree_fabric,
+}
+
+
+# Packet-in streams, each yields (dpid, in_port, frame) for one switch forever, or is None
+# if the switch has no traffic of that kind
+
+
+# New source MACs: every host of the switch sends to the next one, so each packet-in
+# teaches the controller a MAC and (after the first round) installs a flow
+def stream_mac(fabric, dpid, rng):
+    hosts = [host for host in fabric.hosts if host.dpid == dpid]
+    if len(hosts) < 2:
+        return None
+    def frames():
+        sport = 1024
+        while True:
+            for i, src in enumerate(hosts):
+                dst = hosts[(i + 1) % len(hosts)]
+                yield src.dpid, src.port, udp_packet(dst.mac, src.mac, src.ip, dst.ip, sport, 5001, fabric.payload)
+            sport = sport % 60000 + 1
+    return frames()
+
+
+# ARP misses: the hosts of the switch ask for addresses nobody has answered for yet
+def stream_arp(fabric, dpid, rng):
+    hosts = [host for host in fabric.hosts if host.dpid == dpid]
+    if not hosts:
+        return None
+    def frames():
+        while True:
+            src = rng.choice(hosts)
+            network = ipaddress.IPv4Network(f"{src.ip}/24", strict=False)
+            target = network.network_address + rng.randrange(2, 254)
+            yield src.dpid, src.port, arp_request(src.mac, src.ip, str(target))
+    return frames()
+
+
+# IP flows: hosts send UDP to random hosts, through their gateway if the destination is in
+# another subnet. Every flow has a new source port.
+def stream_ip(fabric, dpid, rng):
+    def subnet(host):
+        return host.ip.rsplit('.', 1)[0]
+    # (src, destinations, gateway) of the flows entering the network at this switch
+    senders = []
+    for src in fabric.hosts:
+        if src.gateway is None:
+            if src.dpid == dpid:
+                senders.append((src, fabric.hosts, None))
+            continue
+        if src.dpid == dpid:
+            senders.append((src, [dst for dst in fabric.hosts if subnet(dst) == subnet(src)], None))
+        if src.gateway[0] == dpid:
+            senders.append((src, [dst for dst in fabric.hosts if subnet(dst) != subnet(src)], src.gateway))
+    senders = [(src, dsts, gateway) for src, dsts, gateway in senders if [dst for dst in dsts if dst is not src]]
+    if not senders:
+        return None
+    def frames():
+        sport = 1024
+        while True:
+            src, dsts, gateway = rng.choice(senders)
+            dst = rng.choice(dsts)
+            if dst is src:
+                continue
+            if gateway is None:
+                yield src.dpid, src.port, udp_packet(dst.mac, src.mac, src.ip, dst.ip, sport, 5001, fabric.payload)
+            else:
+                yield gateway[0], gateway[1], udp_packet(gateway[2], src.mac, src.ip, dst.ip, sport, 5001, fabric.payload)
+            sport = sport % 60000 + 1
+    return frames()
+
+
+STREAMS = {
+    'mac': stream_mac,
+    'arp': stream_arp,
+    'ip': stream_ip,
+}
+
+
+class SwitchStats:
+
+    def __init__(self):
+        self.packet_ins = 0
+        self.packet_outs = 0
+        self.flow_mods = 0
+        self.unanswered = 0
+        self.buffered = 0 # packet-ins sent with a buffer_id
+        self.to_controller_bytes = 0
+        self.from_controller_bytes = 0
+        self.latency = [] # packet-in -> packet-out [ms]
+        self.flow_mod_latency = [] # packet-in -> first flow-mod [ms]
+
+
+class SimulatedSwitch:
+    """
+    One datapath connected to the controller
+
+    Answers the handshake, echo, barrier and multipart requests like Open vSwitch, sends the
+    packet-ins of its stream with at most window unanswered and loops LLDP back to the fabric.
+    Buffers up to num_buffers frames once the controller sets a miss_send_len, a packet-out
+    or flow-mod with their buffer_id releases them.
+    """
+
+    def __init__(self, bench, dpid, ports, stream, num_buffers=256):
+        self.bench = bench
+        self.dpid = dpid
+        self.ports = ports
+        self.stream = stream
+        self.num_buffers = num_buffers
+        self.miss_send_len = OFPCML_NO_BUFFER
+        self.buffers = collections.OrderedDict() # {buffer_id: frame}, the oldest is reused first
+        self.buffer_id = 0
+        self.reader = None
+        self.writer = None
+        self.ready = asyncio.Event()
+        self.answered = asyncio.Event()
+        self.outstanding = collections.deque() # [[sent, got flow-mod]]
+        self.stats = SwitchStats()
+        self.measuring = False
+        self.xid = 0
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.send(ofp_msg(OFPT_HELLO, self.next_xid()))
+
+    def next_xid(self):
+        self.xid = (self.xid + 1) & 0xffffffff
+        return self.xid
+
+    def send(self, data):
+        if self.measuring:
+            self.stats.to_controller_bytes += len(data)
+        self.writer.write(data)
+
+    async def receive_loop(self):
+        try:
+            while True:
+                header = await self.reader.readexactly(OFP_HEADER.size)
+                _, msg_type, length, xid = OFP_HEADER.unpack(header)
+                body = await self.reader.readexactly(length - OFP_HEADER.size)
+                if self.measuring:
+                    self.stats.from_controller_bytes += length
+                self.handle(msg_type, xid, body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.bench.disconnected(self)
+
+    def handle(self, msg_type, xid, body):
+        if msg_type == OFPT_PACKET_OUT:
+            buffer_id, ports, data = parse_packet_out(body)
+            if buffer_id != OFP_NO_BUFFER:
+                data = self.buffers.pop(buffer_id, b'')
+            if data[12:14] == struct.pack('!H', ETH_TYPE_LLDP):
+                for port in ports:
+                    self.bench.loop_lldp(self.dpid, port, data)
+            else:
+                self.packet_out()
+        elif msg_type == OFPT_FLOW_MOD:
+            self.flow_mod()
+            # A flow-mod with a buffer_id also forwards the buffered packet
+            buffer_id, = struct.unpack_from('!I', body, 24)
+            if buffer_id != OFP_NO_BUFFER and self.buffers.pop(buffer_id, None) is not None:
+                self.packet_out()
+        elif msg_type == OFPT_SET_CONFIG:
+            _, self.miss_send_len = struct.unpack_from('!HH', body)
+        elif msg_type == OFPT_ECHO_REQUEST:
+            self.send(ofp_msg(OFPT_ECHO_REPLY, xid, body))
+        elif msg_type == OFPT_FEATURES_REQUEST:
+            self.send(features_reply(xid, self.dpid))
+        elif msg_type == OFPT_GET_CONFIG_REQUEST:
+            self.send(ofp_msg(OFPT_GET_CONFIG_REPLY, xid, struct.pack('!HH', 0, self.miss_send_len)))
+        elif msg_type == OFPT_BARRIER_REQUEST:
+            self.send(ofp_msg(OFPT_BARRIER_REPLY, xid))
+        elif msg_type == OFPT_ROLE_REQUEST:
+            self.send(ofp_msg(OFPT_ROLE_REPLY, xid, body))
+        elif msg_type == OFPT_MULTIPART_REQUEST:
+            mp_type, = struct.unpack_from('!H', body)
+            if mp_type == OFPMP_PORT_DESC:
+                self.send(port_desc_reply(xid, self.dpid, self.ports))
+                # The controller moves the switch to MAIN_DISPATCHER with this reply
+                self.ready.set()
+            else:
+                # Statistics are answered empty, there is no traffic to count
+                self.send(ofp_msg(OFPT_MULTIPART_REPLY, xid, struct.pack('!HH4x', mp_type, 0)))
+        elif msg_type == OFPT_ERROR:
+            self.bench.errors += 1
+
+    def flow_mod(self):
+        if not self.measuring:
+            return
+        self.stats.flow_mods += 1
+        for entry in self.outstanding:
+            if not entry[1]:
+                entry[1] = True
+                self.stats.flow_mod_latency.append((time.perf_counter() - entry[0]) * 1000)
+                break
+
+    def packet_out(self):
+        if not self.measuring:
+            return
+        self.stats.packet_outs += 1
+        if self.outstanding:
+            sent, _ = self.outstanding.popleft()
+            self.stats.latency.append((time.perf_counter() - sent) * 1000)
+            self.answered.set()
+
+    # Drop packet-ins that were not answered in time, e.g. because the controller dropped them
+    def expire(self, timeout):
+        now = time.perf_counter()
+        while self.outstanding and now - self.outstanding[0][0] > timeout:
+            self.outstanding.popleft()
+            self.stats.unanswered += 1
+
+    async def send_loop(self, window, timeout):
+        while True:
+            self.expire(timeout)
+            if len(self.outstanding) >= window:
+                self.answered.clear()
+                try:
+                    await asyncio.wait_for(self.answered.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            dpid, in_port, frame = next(self.stream)
+            self.outstanding.append([time.perf_counter(), False])
+            self.stats.packet_ins += 1
+            self.send(self.packet_in(in_port, frame))
+            await self.writer.drain()
+
+    def inject(self, in_port, frame):
+        self.send(self.packet_in(in_port, frame))
+
+    # Packet-in of a table miss, buffered and truncated if the controller set a miss_send_len
+    def packet_in(self, in_port, frame):
+        if self.miss_send_len == OFPCML_NO_BUFFER or len(frame) <= self.miss_send_len:
+            return packet_in(self.next_xid(), in_port, frame)
+        if not self.num_buffers:
+            return packet_in(self.next_xid(), in_port, frame, max_len=self.miss_send_len)
+        if len(self.buffers) >= self.num_buffers:
+            self.buffers.popitem(last=False)
+        self.buffer_id = (self.buffer_id + 1) % OFP_NO_BUFFER
+        self.buffers[self.buffer_id] = frame
+        if self.measuring:
+            self.stats.buffered += 1
+        return packet_in(self.next_xid(), in_port, frame, self.buffer_id, self.miss_send_len)
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class Bench:
+
+    def __init__(self, args, fabric):
+        self.args = args
+        self.fabric = fabric
+        self.switches = {}
+        self.errors = 0
+        self.lost = 0
+        rng = random.Random(args.seed)
+        for dpid, ports in fabric.ports.items():
+            self.switches[dpid] = SimulatedSwitch(self, dpid, ports, STREAMS[args.stream](fabric, dpid, rng),
+                                                  args.buffers)
+
+    def disconnected(self, switch):
+        self.lost += 1
+
+    # An LLDP packet-out leaves the port and arrives at the other end of the link as packet-in
+    def loop_lldp(self, dpid, port, data):
+        neighbor = self.fabric.links.get((dpid, port))
+        if neighbor is not None and neighbor[0] in self.switches:
+            self.switches[neighbor[0]].inject(neighbor[1], data)
+
+    async def run(self, pid):
+        args = self.args
+        for switch in self.switches.values():
+            await switch.connect(args.host, args.port)
+        receivers = [asyncio.ensure_future(switch.receive_loop()) for switch in self.switches.values()]
+        await asyncio.wait_for(asyncio.gather(*(switch.ready.wait() for switch in self.switches.values())),
+                               args.connect_timeout)
+        # Time for the proactive flows and, with --observe-links, the link discovery
+        await asyncio.sleep(args.settle)
+
+        senders = [switch for switch in self.switches.values() if switch.stream is not None]
+        if not senders:
+            raise SystemExit(f"no switch has traffic for the {args.stream} stream")
+        rss_start = rss_mb(pid) if pid else None
+        for switch in senders:
+            switch.measuring = True
+        tasks = [asyncio.ensure_future(switch.send_loop(args.window, args.timeout)) for switch in senders]
+        start = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - start
+        for switch in senders:
+            switch.measuring = False
+        rss_end = rss_mb(pid) if pid else None
+
+        for task in tasks + receivers:
+            task.cancel()
+        for switch in self.switches.values():
+            switch.writer.close()
+        return senders, elapsed, rss_start, rss_end
+
+
+# Start ryu-manager with the app in its own directory, so the lab imports (topo, common) resolve
+def start_controller(args):
+    app = os.path.abspath(args.app)
+    cmd = ['ryu-manager', '--ofp-tcp-listen-port', str(args.port)] + args.ryu_args.split() + [os.path.basename(app)]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(app), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(args.startup)
+    if proc.poll() is not None:
+        raise SystemExit(f"{' '.join(cmd)} exited with {proc.returncode}")
+    return proc
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Controller benchmark with simulated OpenFlow 1.3 switches')
+    parser.add_argument('fabric', choices=FABRICS)
+    parser.add_argument('--stream', choices=STREAMS, default='ip', help='kind of packet-ins to send')
+    parser.add_argument('-k', type=int, default=4, help='fat-tree size, has to match the controller')
+    parser.add_argument('--switches', type=int, default=16, help='number of l2 switches')
+    parser.add_argument('--ports', type=int, default=8, help='ports per l2 switch')
+    parser.add_argument('--macs', type=int, default=64, help='hosts per l2 switch')
+    parser.add_argument('--payload', type=int, default=18, help='UDP payload bytes of the mac and ip streams')
+    parser.add_argument('--buffers', type=int, default=256,
+                        help='packet buffers per switch, 0 truncates without buffering like Open vSwitch')
+    parser.add_argument('--app', help='controller app to start with ryu-manager, otherwise connect to a running one')
+    parser.add_argument('--ryu-args', default='', help='extra ryu-manager arguments, e.g. --observe-links')
+    parser.add_argument('--startup', type=float, default=3, help='seconds to wait for ryu-manager')
+    parser.add_argument('--pid', type=int, help='pid of a running controller, for the memory numbers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6653)
+    parser.add_argument('--connect-timeout', type=float, default=30)
+    parser.add_argument('--settle', type=float, default=2, help='seconds between the handshake and the traffic')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of traffic')
+    parser.add_argument('--window', type=int, default=1, help='unanswered packet-ins per switch')
+    parser.add_argument('--timeout', type=float, default=0.5, help='seconds until a packet-in counts as unanswered')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='output path without extension, default bench/results/of-<fabric>-<time>')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--save-baseline', help='also write the results JSON to this path')
+    parser.add_argument('--max-regression', type=float,
+                        help='exit with 1 if a median got worse than the baseline by more than this percentage')
+    args = parser.parse_args()
+
+    fabric = FABRICS[args.fabric](args)
+    fabric.payload = args.payload
+    controller = start_controller(args) if args.app else None
+    pid = controller.pid if controller else args.pid
+    try:
+        bench = Bench(args, fabric)
+        senders, elapsed, rss_start, rss_end = asyncio.run(bench.run(pid))
+    finally:
+        if controller:
+            controller.terminate()
+            controller.wait()
+
+    meta = {
+        'fabric': args.fabric,
+        'stream': args.stream,
+        'app': args.app,
+        'switches': len(fabric.ports),
+        'window': args.window,
+        'payload': args.payload,
+        'buffers': args.buffers,
+        'duration': elapsed,
+        'seed': args.seed,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'errors': bench.errors,
+        'disconnects': bench.lost,
+    }
+    result = results.BenchResult(meta)
+    for switch in senders:
+        stats = switch.stats
+        name = f"{switch.dpid:016x}"
+        result.add(args.stream, 'of', 'pkt_in_per_s', name, '', stats.packet_ins / elapsed)
+        result.add(args.stream, 'of', 'answered_per_s', name, '', stats.packet_outs / elapsed)
+        result.add(args.stream, 'of', 'flow_mod_per_s', name, '', stats.flow_mods / elapsed)
+        result.add(args.stream, 'of', 'unanswered', name, '', stats.unanswered)
+        channel_bytes = stats.to_controller_bytes + stats.from_controller_bytes
+        result.add(args.stream, 'of', 'ctl_bytes_per_s', name, '', channel_bytes / elapsed)
+        if stats.packet_ins:
+            result.add(args.stream, 'of', 'ctl_bytes_per_pkt_in', name, '', channel_bytes / stats.packet_ins)
+        for value in stats.latency:
+            result.add(args.stream, 'of', 'latency_ms', name, '', value)
+        for value in stats.flow_mod_latency:
+            result.add(args.stream, 'of', 'flow_mod_latency_ms', name, '', value)
+    if rss_start is not None and rss_end is not None:
+        result.add(args.stream, 'of', 'rss_growth_mb', 'controller', '', rss_end - rss_start)
+        meta['rss_mb'] = rss_end
+
+    total = sum(switch.stats.packet_outs for switch in senders)
+    print(f"{len(senders)} switches, {sum(s.stats.packet_ins for s in senders) / elapsed:.0f} packet-ins/s sent, "
+          f"{total / elapsed:.0f}/s answered, {sum(s.stats.flow_mods for s in senders) / elapsed:.0f} flow-mods/s, "
+          f"{sum(s.stats.unanswered for s in senders)} unanswered, {bench.errors} errors")
+    to_controller = sum(s.stats.to_controller_bytes for s in senders)
+    from_controller = sum(s.stats.from_controller_bytes for s in senders)
+    print(f"control channel {to_controller / elapsed / 1e3:.1f} kB/s to and {from_controller / elapsed / 1e3:.1f} kB/s "
+          f"from the controller, {sum(s.stats.buffered for s in senders)} packet-ins buffered")
+    if rss_start is not None and rss_end is not None:
+        print(f"controller RSS {rss_start:.1f} MB -> {rss_end:.1f} MB")
+
+    out = args.out or os.path.join(ROOT, 'bench', 'results', f"of-{args.fabric}-{time.strftime('%Y%m%d-%H%M%S')}")
+    sys.exit(results.report(result, out, args.save_baseline, args.baseline, args.max_regression))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Summaries, result files and baseline comparison of the network benchmarks (see netbench.py).
+# Nothing here needs Mininet, results can be compared on any machine.
+
+import csv
+import json
+import math
+import os
+
+
+# Percentile with linear interpolation between the closest ranks, like numpy.percentile
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'min': min(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': max(values),
+    }
+
+
+class BenchResult:
+    """
+    Samples of one benchmark run, grouped by traffic pattern, test (e.g. 'ping', 'tcp', 'udp')
+    and metric
+
+    samples is a list of rows {'pattern', 'test', 'metric', 'src', 'dst', 'value', ...}, the
+    summary holds the percentiles of every (pattern, test, metric) over all host pairs.
+    """
+
+    def __init__(self, meta):
+        self.meta = meta # topology, controller, commit, ...
+        self.samples = []
+
+    def add(self, pattern, test, metric, src, dst, value, **extra):
+        row = {'pattern': pattern, 'test': test, 'metric': metric, 'src': src, 'dst': dst, 'value': value}
+        row.update(extra)
+        self.samples.append(row)
+
+    def summary(self):
+        groups = {}
+        for row in self.samples:
+            if row['value'] is not None:
+                groups.setdefault(f"{row['pattern']}.{row['test']}.{row['metric']}", []).append(row['value'])
+        return {key: summarize(values) for key, values in sorted(groups.items())}
+
+    def to_dict(self):
+        return {'meta': self.meta, 'summary': self.summary(), 'samples': self.samples}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_csv(self, path):
+        fields = ['pattern', 'test', 'metric', 'src', 'dst', 'value']
+        for row in self.samples:
+            fields += [key for key in row if key not in fields]
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.samples)
+
+
+def load_summary(path):
+    with open(path) as f:
+        return json.load(f)['summary']
+
+
+# Metrics where a lower value is better, all others (throughput) are better when higher
+LOWER_IS_BETTER = ('rtt_ms', 'loss_pct', 'jitter_ms', 'fct_s', 'latency_ms', 'flow_mod_latency_ms',
+                   'rss_growth_mb', 'unanswered', 'ctl_bytes_per_s', 'ctl_bytes_per_pkt_in')
+
+
+# Compare the medians of two summaries, returns [(key, baseline, current, change in %, better)]
+def compare(baseline, current, stat='p50'):
+    rows = []
+    for key in sorted(set(baseline) & set(current)):
+        old = baseline[key].get(stat)
+        new = current[key].get(stat)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        better = new <= old if key.split('.')[-1] in LOWER_IS_BETTER else new >= old
+        rows.append((key, old, new, change, better))
+    return rows
+
+
+def format_comparison(rows, stat='p50'):
+    lines = [f"{'metric':<32} {'baseline ' + stat:>14} {'current ' + stat:>14} {'change':>9}"]
+    for key, old, new, change, better in rows:
+        mark = '' if abs(change) < 5 else ('  better' if better else '  WORSE')
+        lines.append(f"{key:<32} {old:>14.3f} {new:>14.3f} {change:>+8.1f}%{mark}")
+    return '\n'.join(lines)
+
+
+# Write the result files, print the summary and the comparison with the baseline.
+# Returns the exit code, 1 if a median got worse by more than max_regression percent.
+def report(result, out, save_baseline=None, baseline=None, max_regression=None):
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    result.write_json(out + '.json')
+    result.write_csv(out + '.csv')
+    print(f"results written to {out}.json and {out}.csv")
+
+    summary = result.summary()
+    for key, stats in summary.items():
+        if stats['count']:
+            print(f"{key:<32} n={stats['count']:<5} p50={stats['p50']:.3f} p90={stats['p90']:.3f} p99={stats['p99']:.3f}")
+
+    if save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(save_baseline)), exist_ok=True)
+        result.write_json(save_baseline)
+
+    if baseline:
+        rows = compare(load_summary(baseline), summary)
+        print(format_comparison(rows))
+        if max_regression is not None:
+            worse = [key for key, _, _, change, better in rows if not better and abs(change) > max_regression]
+            if worse:
+                print(f"regression above {max_regression}% in: {', '.join(worse)}")
+                return 1
+    return 0
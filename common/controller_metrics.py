@@ -0,0 +1,258 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+
+#!/usr/bin/env python3
+
+# Counters and latency histograms of the Ryu apps, served in the Prometheus text format.
+# See: https://ryu.readthedocs.io/en/latest/writing_ryu_app.html (WSGI) and
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+
+import bisect
+import functools
+import json
+import time
+
+from ryu.app.wsgi import ControllerBase, Response, route
+
+METRICS_INSTANCE = 'controller_metrics'
+PREFIX = 'ryu_'
+
+# Upper bounds of the latency buckets [s]
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+ETHERTYPES = {0x0800: 'ipv4', 0x0806: 'arp', 0x86dd: 'ipv6', 0x88cc: 'lldp'}
+
+HELP = {
+    'packet_in_total': 'Packet-ins received, by datapath and ethertype',
+    'handler_seconds': 'Time spent in the event handlers of the app',
+    'packet_in_latency_seconds': 'Time from the arrival of a packet-in until its handler returned',
+    'flow_mods_queued_total': 'Flow-mods handed to the flow installer',
+    'flow_mods_sent_total': 'Flow-mods written to the switch',
+    'flow_mods_acked_total': 'Flow-mods confirmed by a barrier reply',
+    'flow_mods_pending': 'Flow-mods queued or waiting for their barrier reply',
+    'switch_errors_total': 'Error messages received from the switch',
+    'packet_in_rate_limited_total': 'Packet-ins dropped by the token bucket of their source MAC',
+    'meter_dropped_total': 'Table misses dropped by the packet-in meter of the switch',
+    'packet_in_bytes_total': 'Bytes of the packet-in messages received',
+    'packet_out_bytes_total': 'Bytes of the packet-out messages sent for packet-ins',
+    'buffering_saved_bytes_total': 'Frame bytes kept off the control channel by switch buffers',
+}
+
+
+def dpid_label(dpid):
+    return f"{dpid:016x}"
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, the counts are per bucket and summed up when rendered
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # [(upper bound, observations <= upper bound)], the last upper bound is +Inf
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class ControllerMetrics:
+    """
+    Metrics of one app: counters and histograms updated on the hot path, and collectors
+
+    Counting a packet-in or timing a handler is a dictionary lookup and an addition. Values
+    the components already count themselves (flow installer, limits, buffering)
+    and table sizes are only read by the collectors when the metrics are requested.
+    A collector is a function returning [(name, 'counter' or 'gauge', {label: value}, value)].
+    """
+
+    def __init__(self):
+        self.counters = {} # {(name, labels): value}
+        self.histograms = {} # {(name, labels): Histogram}
+        self.collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    # Count a packet-in by datapath and ethertype and stamp its arrival for packet_in_latency_seconds
+    def packet_in(self, ev):
+        msg = ev.msg
+        ethertype = int.from_bytes(msg.data[12:14], 'big')
+        self.inc('packet_in_total', dpid=dpid_label(msg.datapath.id), type=ETHERTYPES.get(ethertype, 'other'))
+        ev.metrics_received = time.perf_counter()
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    # Serve /metrics (Prometheus text) and /metrics/json through the WSGI application of Ryu
+    def serve(self, wsgi):
+        wsgi.register(MetricsController, {METRICS_INSTANCE: self})
+
+    # {name: (type, [(labels, value)])} of the counters and collectors
+    def samples(self):
+        samples = {}
+        for (name, labels), value in list(self.counters.items()):
+            samples.setdefault(name, ('counter', []))[1].append((dict(labels), value))
+        for collector in self.collectors:
+            for name, metric_type, labels, value in collector():
+                samples.setdefault(name, (metric_type, []))[1].append((labels, value))
+        return samples
+
+    def render_prometheus(self):
+        lines = []
+        for name, (metric_type, values) in sorted(self.samples().items()):
+            _header(lines, name, metric_type)
+            for labels, value in values:
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {_number(value)}")
+
+        histograms = {}
+        for (name, labels), histogram in list(self.histograms.items()):
+            histograms.setdefault(name, []).append((dict(labels), histogram))
+        for name, values in sorted(histograms.items()):
+            _header(lines, name, 'histogram')
+            for labels, histogram in values:
+                for bound, count in histogram.cumulative():
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(dict(labels, le=_number(bound)))} {count}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+                lines.append(f"{PREFIX}{name}_count{_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        result = {}
+        for name, (metric_type, values) in self.samples().items():
+            result[name] = [{'labels': labels, 'value': value} for labels, value in values]
+        for (name, labels), histogram in list(self.histograms.items()):
+            result.setdefault(name, []).append({
+                'labels': dict(labels),
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'buckets': [[_number(bound), count] for bound, count in histogram.cumulative()],
+            })
+        return result
+
+
+def _header(lines, name, metric_type):
+    if name in HELP:
+        lines.append(f"# HELP {PREFIX}{name} {HELP[name]}")
+    lines.append(f"# TYPE {PREFIX}{name} {metric_type}")
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# Time a handler method of an app with a metrics attribute, in handler_seconds{handler=<name>}.
+# Events stamped by ControllerMetrics.packet_in() also report their packet_in_latency_seconds.
+def timed(handler):
+    name = handler.__name__.strip('_')
+
+    @functools.wraps(handler)
+    def wrapper(self, ev, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return handler(self, ev, *args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            self.metrics.observe('handler_seconds', end - start, handler=name)
+            received = getattr(ev, 'metrics_received', None)
+            if received is not None:
+                self.metrics.observe('packet_in_latency_seconds', end - received)
+    return wrapper
+
+
+# Samples of the shared components of common/, for the collector of an app
+def component_samples(flow_installer=None, limiter=None, buffering=None):
+    samples = []
+    if flow_installer is not None:
+        for dpid, stats in list(flow_installer.stats.items()):
+            labels = {'dpid': dpid_label(dpid)}
+            samples += [
+                ('flow_mods_queued_total', 'counter', labels, stats.queued),
+                ('flow_mods_sent_total', 'counter', labels, stats.sent),
+                ('flow_mods_acked_total', 'counter', labels, stats.acked),
+                ('flow_mods_pending', 'gauge', labels, stats.queued - stats.acked),
+                ('switch_errors_total', 'counter', labels, stats.errors),
+            ]
+    if limiter is not None:
+        for dpid, stats in list(limiter.stats.items()):
+            labels = {'dpid': dpid_label(dpid)}
+            samples += [
+                ('packet_in_rate_limited_total', 'counter', labels, stats.dropped),
+                ('meter_dropped_total', 'counter', labels, stats.meter_dropped),
+            ]
+    if buffering is not None:
+        for dpid, stats in list(buffering.stats.items()):
+            labels = {'dpid': dpid_label(dpid)}
+            samples += [
+                ('packet_in_bytes_total', 'counter', labels, stats.packet_in_bytes),
+                ('packet_out_bytes_total', 'counter', labels, stats.packet_out_bytes),
+                ('buffering_saved_bytes_total', 'counter', labels, stats.saved_bytes),
+            ]
+    return samples
+
+
+class MetricsController(ControllerBase):
+    """
+    REST endpoints of ControllerMetrics, registered by ControllerMetrics.serve()
+    """
+
+    def __init__(self, req, link, data, **config):
+        super(MetricsController, self).__init__(req, link, data, **config)
+        self.metrics = data[METRICS_INSTANCE]
+
+    @route('metrics', '/metrics', methods=['GET'])
+    def get_metrics(self, req, **kwargs):
+        return Response(content_type='text/plain', charset='utf-8', text=self.metrics.render_prometheus())
+
+    @route('metrics', '/metrics/json', methods=['GET'])
+    def get_metrics_json(self, req, **kwargs):
+        return Response(content_type='application/json', charset='utf-8', text=json.dumps(self.metrics.to_json()))
@@ -0,0 +1,143 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Shared flow installation for the Ryu apps of all labs.
+# See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#barrier-message
+
+import time
+
+
+class InstallStats:
+    """
+    Flow installation counters of one datapath
+    """
+
+    def __init__(self):
+        self.queued = 0 # flow-mods handed to the installer
+        self.sent = 0 # flow-mods written to the switch
+        self.acked = 0 # flow-mods confirmed by a barrier reply
+        self.errors = 0 # error messages received from the switch
+        self.batches = 0
+        self.started = None # time of the first flow-mod since the table was last complete
+        self.burst = 0 # flow-mods acknowledged since then
+        self.rate = 0.0 # flow-mods per second of the last completed install burst
+
+
+class FlowInstaller:
+    """
+    Queues flow-mods per datapath and sends them in batches closed by a barrier request
+
+    A batch is serialized into a single buffer and written to the switch at once.
+    When the barrier reply arrives, the switch has processed all flow-mods of the batch,
+    so the installer knows exactly when the flow table of a switch is complete.
+    The app has to forward EventOFPBarrierReply and EventOFPErrorMsg to
+    barrier_reply() and error().
+    """
+
+    def __init__(self, logger, batch_size=64):
+        self.logger = logger
+        self.batch_size = batch_size
+        self.queues = {} # {dpid: (datapath, [flow_mod])}
+        self.pending = {} # {dpid: {barrier_xid: number of flow-mods}}
+        self.stats = {} # {dpid: InstallStats}
+
+    # Queue a flow entry, the batch is sent once it is full or flush() is called
+    def add_flow(self, datapath, priority, match, actions, **kwargs):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
+                                match=match, instructions=inst, **kwargs)
+        self.add_msg(datapath, mod)
+
+    # Queue an already built flow-mod (or any other message that should be confirmed by the barrier)
+    def add_msg(self, datapath, mod):
+        stats = self.stats.setdefault(datapath.id, InstallStats())
+        if stats.started is None:
+            stats.started = time.time()
+        stats.queued += 1
+
+        queue = self.queues.setdefault(datapath.id, (datapath, []))[1]
+        queue.append(mod)
+        if len(queue) >= self.batch_size:
+            self.flush(datapath)
+
+    # Send all queued flow-mods of a datapath followed by a barrier request
+    def flush(self, datapath):
+        _, queue = self.queues.pop(datapath.id, (datapath, []))
+        if not queue:
+            return
+
+        buf = bytearray()
+        for mod in queue:
+            datapath.set_xid(mod)
+            mod.serialize()
+            buf += mod.buf
+        barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        xid = datapath.set_xid(barrier)
+        barrier.serialize()
+        buf += barrier.buf
+        datapath.send(bytes(buf))
+
+        self.pending.setdefault(datapath.id, {})[xid] = len(queue)
+        stats = self.stats[datapath.id]
+        stats.sent += len(queue)
+        stats.batches += 1
+
+    def flush_all(self):
+        for datapath, _ in list(self.queues.values()):
+            self.flush(datapath)
+
+    # Handle an OFPBarrierReply, all flow-mods sent before the barrier are installed
+    def barrier_reply(self, msg):
+        dpid = msg.datapath.id
+        count = self.pending.get(dpid, {}).pop(msg.xid, None)
+        if count is None:
+            return
+        stats = self.stats[dpid]
+        stats.acked += count
+        stats.burst += count
+        if self.is_complete(dpid):
+            elapsed = time.time() - stats.started
+            stats.rate = stats.burst / elapsed if elapsed > 0 else 0.0
+            # Single reactive flows are only worth a debug message
+            log = self.logger.info if stats.burst >= self.batch_size else self.logger.debug
+            log("Flow table of switch %016x complete: %d flows in %.3fs (%.0f flows/s), %d errors",
+                dpid, stats.burst, elapsed, stats.rate, stats.errors)
+            stats.started = None
+            stats.burst = 0
+
+    # Handle an OFPErrorMsg sent by the switch
+    def error(self, msg):
+        dpid = msg.datapath.id
+        self.stats.setdefault(dpid, InstallStats()).errors += 1
+        self.logger.warning("Switch %016x rejected message xid=%d: type=0x%02x code=0x%02x",
+                            dpid, msg.xid, msg.type, msg.code)
+
+    # True if no flow-mod of the datapath is queued or waiting for its barrier reply
+    def is_complete(self, dpid):
+        return dpid not in self.queues and not self.pending.get(dpid)
+
+    def get_stats(self, dpid):
+        return self.stats.get(dpid)
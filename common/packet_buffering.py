@@ -0,0 +1,166 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+
+#!/usr/bin/env python3
+
+# Switch-side packet buffering, the controller only gets the headers of a table miss.
+# See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#ryu.ofproto.ofproto_v1_3_parser.OFPPacketIn
+
+import time
+
+from ryu.lib import hub
+
+
+class ChannelStats:
+    """
+    Packet-in and packet-out bytes of one datapath
+    """
+
+    def __init__(self):
+        self.packet_ins = 0
+        self.buffered = 0 # packet-ins the switch kept a buffer for
+        self.packet_in_bytes = 0 # packet-in messages as received
+        self.packet_out_bytes = 0 # packet-out messages as sent
+        self.saved_bytes = 0 # frame bytes that did not cross the control channel thanks to buffering
+        self.full_frames = False # the switch does not buffer, misses are sent in full
+
+
+class PacketBuffering:
+    """
+    Lets the switches buffer table misses and send only their first miss_send_len bytes
+
+    With miss_send_len=None the table-miss flow sends full frames without buffer (OFPCML_NO_BUFFER)
+    and every packet-out carries the frame back, as before. With e.g. miss_send_len=128, the
+    switch keeps the frame and the packet-in only carries the headers and a buffer_id, the
+    packet-out or flow-mod for the packet references the buffer instead of the frame.
+
+    Switches that do not buffer (Open vSwitch since 2.7) truncate without buffer_id, such a
+    packet cannot be forwarded by the controller. packet_in() then returns False and the
+    switch is moved back to full frames, only that one packet is lost. Frames built from
+    packet-in data (e.g. ARP forwarded to another switch) need to fit into miss_send_len.
+
+    The app has to install its table-miss flow with install_miss_flow(), check packet_in()
+    for every packet-in and send the packet-outs of packet-ins through packet_out().
+    """
+
+    def __init__(self, logger, packet_in_limiter, miss_send_len=None, interval=10.0):
+        self.logger = logger
+        self.packet_in_limiter = packet_in_limiter
+        self.miss_send_len = miss_send_len
+        self.interval = interval
+        self.stats = {} # {dpid: ChannelStats}
+        self.thread = hub.spawn(self._report_loop)
+
+    # Bytes of a table miss sent to the controller, OFPCML_NO_BUFFER for full frames
+    def max_len(self, datapath):
+        stats = self.stats.get(datapath.id)
+        if self.miss_send_len is None or stats is None or stats.full_frames:
+            return datapath.ofproto.OFPCML_NO_BUFFER
+        return self.miss_send_len
+
+    # Install the table-miss flow through the packet-in limiter, full_frames=True never buffers
+    def install_miss_flow(self, datapath, full_frames=False):
+        stats = self.stats[datapath.id] = ChannelStats()
+        stats.full_frames = full_frames
+        self._set_config(datapath)
+        self.packet_in_limiter.install_miss_flow(datapath, self._miss_actions(datapath))
+
+    def _miss_actions(self, datapath):
+        return [datapath.ofproto_parser.OFPActionOutput(datapath.ofproto.OFPP_CONTROLLER, self.max_len(datapath))]
+
+    # miss_send_len of packet-ins that are not sent by a flow (e.g. invalid TTL)
+    def _set_config(self, datapath):
+        if self.miss_send_len is not None:
+            datapath.send_msg(datapath.ofproto_parser.OFPSetConfig(
+                datapath, datapath.ofproto.OFPC_FRAG_NORMAL, self.max_len(datapath)))
+
+    def remove_datapath(self, dpid):
+        self.stats.pop(dpid, None)
+
+    # Count a packet-in, False if it was truncated without buffer and cannot be forwarded
+    def packet_in(self, msg):
+        datapath = msg.datapath
+        stats = self.stats.get(datapath.id)
+        if stats is None:
+            stats = self.stats[datapath.id] = ChannelStats()
+        stats.packet_ins += 1
+        stats.packet_in_bytes += msg.msg_len
+        if msg.buffer_id != datapath.ofproto.OFP_NO_BUFFER:
+            stats.buffered += 1
+            stats.saved_bytes += msg.total_len - len(msg.data)
+            return True
+        if len(msg.data) >= msg.total_len:
+            return True
+        if not stats.full_frames:
+            self.logger.info("Switch %016x truncates table misses without buffering them, "
+                             "falling back to full frames", datapath.id)
+            stats.full_frames = True
+            self._set_config(datapath)
+            self.packet_in_limiter.set_miss_actions(datapath, self._miss_actions(datapath))
+        return False
+
+    # buffer_id for a flow-mod that should also forward the packet of msg, OFP_NO_BUFFER if the
+    # switch did not buffer it and a packet-out is still needed
+    def flow_mod_buffer_id(self, msg):
+        if msg.buffer_id != msg.datapath.ofproto.OFP_NO_BUFFER:
+            self.stats[msg.datapath.id].saved_bytes += msg.total_len
+        return msg.buffer_id
+
+    # Forward the packet of msg, through its switch buffer if there is one
+    def packet_out(self, msg, actions, in_port=None):
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        if in_port is None:
+            in_port = msg.match['in_port']
+        stats = self.stats.setdefault(datapath.id, ChannelStats())
+        if msg.buffer_id != ofproto.OFP_NO_BUFFER:
+            out = datapath.ofproto_parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
+                                                       in_port=in_port, actions=actions)
+            stats.saved_bytes += msg.total_len
+        else:
+            out = datapath.ofproto_parser.OFPPacketOut(datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER,
+                                                       in_port=in_port, actions=actions, data=msg.data)
+        datapath.send_msg(out)
+        stats.packet_out_bytes += len(out.buf)
+
+    # Packet-in and packet-out bytes/s of all switches, and the bytes/s buffering saved
+    def _report_loop(self):
+        last = None
+        start = time.time()
+        while True:
+            hub.sleep(self.interval)
+            now = time.time()
+            current = [sum(getattr(stats, field) for stats in list(self.stats.values()))
+                       for field in ('packet_ins', 'buffered', 'packet_in_bytes', 'packet_out_bytes', 'saved_bytes')]
+            if last is not None and current[0] > last[0]:
+                elapsed = now - start
+                packet_ins, buffered, in_bytes, out_bytes, saved = [new - old for new, old in zip(current, last)]
+                sent = in_bytes + out_bytes
+                self.logger.info("Control channel: %d packet-ins (%d buffered), packet-in %.0f B/s, "
+                                 "packet-out %.0f B/s, saved %.0f B/s (%.0f%%)",
+                                 packet_ins, buffered, in_bytes / elapsed, out_bytes / elapsed,
+                                 saved / elapsed, 100.0 * saved / (sent + saved) if sent + saved else 0.0)
+            last = current
+            start = now
+
+    def get_stats(self, dpid):
+        return self.stats.get(dpid)
@@ -0,0 +1,196 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Decode the few header fields the controllers need straight from the packet-in data,
+# without building a ryu.lib.packet.Packet with one object per protocol.
+# See: https://en.wikipedia.org/wiki/Ethernet_frame, https://en.wikipedia.org/wiki/Address_Resolution_Protocol
+
+import socket
+import struct
+
+ETH_TYPE_IP = 0x0800
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_8021Q = 0x8100
+
+ETH_HEADER_LEN = 14
+ETH_MIN_LEN = 60 # without the frame check sequence
+VLAN_HEADER_LEN = 4
+ARP_LEN = 28 # Ethernet/IPv4 ARP
+IPV4_MIN_LEN = 20
+
+_ethertype = struct.Struct('!H')
+_arp = struct.Struct('!6xH6s4s6x4s') # opcode, sender MAC, sender IP, target IP
+
+
+class PacketHeaders:
+    """
+    Ethernet, IPv4 and ARP header fields of a packet, None if the packet does not have them
+    """
+
+    __slots__ = ('eth_dst', 'eth_src', 'ethertype', 'l3_offset',
+                 'ip_src', 'ip_dst', 'ip_proto',
+                 'arp_opcode', 'arp_src_mac', 'arp_src_ip', 'arp_dst_ip')
+
+    def __init__(self):
+        self.eth_dst = None
+        self.eth_src = None
+        self.ethertype = None
+        self.l3_offset = None # offset of the IPv4/ARP header in the packet
+        self.ip_src = None
+        self.ip_dst = None
+        self.ip_proto = None
+        self.arp_opcode = None
+        self.arp_src_mac = None
+        self.arp_src_ip = None
+        self.arp_dst_ip = None
+
+
+# MAC and IP addresses are returned as strings in the notation ryu uses
+def mac_to_str(buf):
+    return bytes(buf).hex(':')
+
+
+def parse_headers(data):
+    # Returns None for packets shorter than an Ethernet header
+    if len(data) < ETH_HEADER_LEN:
+        return None
+    view = memoryview(data)
+    hdr = PacketHeaders()
+    hdr.eth_dst = mac_to_str(view[0:6])
+    hdr.eth_src = mac_to_str(view[6:12])
+    offset = 12
+    ethertype = _ethertype.unpack_from(data, offset)[0]
+    while ethertype == ETH_TYPE_8021Q and len(data) >= offset + VLAN_HEADER_LEN + 2:
+        offset += VLAN_HEADER_LEN
+        ethertype = _ethertype.unpack_from(data, offset)[0]
+    offset += 2
+    hdr.ethertype = ethertype
+    hdr.l3_offset = offset
+
+    if ethertype == ETH_TYPE_IP and len(data) >= offset + IPV4_MIN_LEN:
+        hdr.ip_proto = data[offset + 9]
+        hdr.ip_src = socket.inet_ntoa(view[offset + 12:offset + 16])
+        hdr.ip_dst = socket.inet_ntoa(view[offset + 16:offset + 20])
+    elif ethertype == ETH_TYPE_ARP and len(data) >= offset + ARP_LEN:
+        opcode, src_mac, src_ip, dst_ip = _arp.unpack_from(data, offset)
+        hdr.arp_opcode = opcode
+        hdr.arp_src_mac = src_mac.hex(':')
+        hdr.arp_src_ip = socket.inet_ntoa(src_ip)
+        hdr.arp_dst_ip = socket.inet_ntoa(dst_ip)
+    return hdr
+
+
+# Internet checksum (RFC 1071) of an even-length header
+def checksum(buf):
+    total = sum(struct.unpack('!%dH' % (len(buf) // 2), buf))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+# Checksum after one 16-bit word changed from old to new (RFC 1624)
+def update_checksum(csum, old, new):
+    total = (~csum & 0xffff) + (~old & 0xffff) + new
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+ARP_OP_REQUEST = 1
+ARP_OP_REPLY = 2
+IPPROTO_ICMP = 1
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+BROADCAST_MAC = b'\xff' * 6
+
+_ipv4 = struct.Struct('!BBHHHBBH4s4s')
+
+
+class ReplyTemplates:
+    """
+    Pre-built frames the router sends from one of its ports
+
+    The constant part of every frame is built once, a reply only copies the template
+    and writes the fields that differ between replies.
+    """
+
+    def __init__(self, mac, ip):
+        self.mac = bytes.fromhex(mac.replace(':', ''))
+        self.ip = socket.inet_aton(ip)
+
+        # Ethernet + ARP padded to the minimum frame length, the target MAC and IP are patched in.
+        # Requests carry the broadcast address as target MAC, like the frames ryu built before.
+        arp_header = struct.pack('!HHBBH', 1, ETH_TYPE_IP, 6, 4, 0)
+        self.arp_request = bytearray(BROADCAST_MAC + self.mac + _ethertype.pack(ETH_TYPE_ARP) + arp_header
+                                     + self.mac + self.ip + BROADCAST_MAC + bytes(4))
+        self.arp_request += bytes(ETH_MIN_LEN - len(self.arp_request))
+        struct.pack_into('!H', self.arp_request, ETH_HEADER_LEN + 6, ARP_OP_REQUEST)
+        self.arp_reply = bytearray(self.arp_request)
+        struct.pack_into('!H', self.arp_reply, ETH_HEADER_LEN + 6, ARP_OP_REPLY)
+
+        # Ethernet + IPv4 header of an ICMP message, the length, destination and checksum are patched in
+        self.icmp = bytearray(bytes(6) + self.mac + _ethertype.pack(ETH_TYPE_IP)
+                              + _ipv4.pack(0x45, 0, 0, 0, 0, 255, IPPROTO_ICMP, 0, self.ip, bytes(4)))
+
+    # Who-has dst_ip? Tell <port IP>
+    def build_arp_request(self, dst_ip):
+        frame = bytearray(self.arp_request)
+        frame[38:42] = socket.inet_aton(dst_ip)
+        return frame
+
+    # <port IP> (or src_ip) is-at <port MAC>, sent to the host that asked
+    def build_arp_reply(self, dst_mac, dst_ip, src_ip=None):
+        frame = bytearray(self.arp_reply)
+        mac = bytes.fromhex(dst_mac.replace(':', ''))
+        frame[0:6] = mac
+        frame[32:38] = mac
+        frame[38:42] = socket.inet_aton(dst_ip)
+        if src_ip is not None:
+            frame[28:32] = socket.inet_aton(src_ip)
+        return frame
+
+    # Echo reply for the echo request in data (decoded into hdr), None if it is no valid echo request
+    def build_echo_reply(self, data, hdr):
+        offset = hdr.l3_offset
+        ihl = (data[offset] & 0x0f) * 4
+        total_len = _ethertype.unpack_from(data, offset + 2)[0]
+        start = offset + ihl
+        end = offset + total_len
+        if ihl < IPV4_MIN_LEN or end > len(data) or end - start < 8 or data[start] != ICMP_ECHO_REQUEST:
+            return None
+
+        frame = bytearray(self.icmp)
+        frame[0:6] = data[6:12] # back to the sender
+        struct.pack_into('!H', frame, ETH_HEADER_LEN + 2, IPV4_MIN_LEN + end - start)
+        frame[ETH_HEADER_LEN + 16:ETH_HEADER_LEN + 20] = data[offset + 12:offset + 16]
+        struct.pack_into('!H', frame, ETH_HEADER_LEN + 10, checksum(frame[ETH_HEADER_LEN:]))
+
+        # Same identifier, sequence number and payload, only the type and the checksum change
+        icmp_start = len(frame)
+        frame += data[start:end]
+        frame[icmp_start] = ICMP_ECHO_REPLY
+        csum = _ethertype.unpack_from(frame, icmp_start + 2)[0]
+        old = (ICMP_ECHO_REQUEST << 8) | data[start + 1]
+        new = (ICMP_ECHO_REPLY << 8) | data[start + 1]
+        struct.pack_into('!H', frame, icmp_start + 2, update_checksum(csum, old, new))
+        return frame
@@ -0,0 +1,200 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Rate limits on the packet-in path, so a scanning host or a broadcast storm cannot saturate the controller.
+# See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#meter-modification-message
+
+import time
+from collections import OrderedDict
+
+from ryu.lib import addrconv, hub
+
+
+class LimiterStats:
+    """
+    Packet-in counters of one datapath
+    """
+
+    def __init__(self):
+        self.allowed = 0 # packet-ins passed to the app
+        self.dropped = 0 # packet-ins dropped by the token bucket of their source MAC
+        self.metered = False # the table-miss flow goes through the meter
+        self.meter_packets = 0 # table misses seen by the meter
+        self.meter_dropped = 0 # table misses dropped by the meter in the switch
+        self.overloads = 0 # statistics intervals in which the meter dropped packets
+
+
+class PacketInLimiter:
+    """
+    Two rate limits on the way from a table miss to the app
+
+    In the switch, the table-miss flow goes through a meter that drops misses above the
+    packet-in budget of the datapath (budgets {dpid: (packets/s, burst)}, default rate/burst).
+    The meter is only used if the switch reports meter support, until then and without it the
+    table-miss flow is installed unmetered. In the controller, every source MAC has a token
+    bucket per datapath of mac_rate packet-ins/s with a depth of mac_burst, packet-ins of a
+    source over its rate are dropped before they reach the app. The buckets of the max_macs most
+    recently seen (datapath, source) pairs are kept, spoofed sources are still bounded by the meter.
+    Sources passed to exempt(), like router ports that all routed traffic comes from, have no bucket.
+
+    The app has to call install_miss_flow() instead of installing its table-miss flow, check
+    allow() for every packet-in and forward EventOFPMeterFeaturesStatsReply and
+    EventOFPMeterStatsReply to meter_features_reply() and meter_stats_reply().
+    """
+
+    MISS_METER_ID = 1
+
+    def __init__(self, logger, flow_installer, rate=1000, burst=200, budgets=None,
+                 mac_rate=100, mac_burst=50, max_macs=4096, interval=5.0):
+        self.logger = logger
+        self.flow_installer = flow_installer
+        self.rate = rate
+        self.burst = burst
+        self.budgets = budgets or {} # {dpid: (packets/s, burst)}
+        self.mac_rate = mac_rate
+        self.mac_burst = mac_burst
+        self.max_macs = max_macs
+        self.interval = interval
+        self.buckets = OrderedDict() # {(dpid, eth_src): [tokens, last update]}
+        self.exempt_macs = set() # {eth_src}, packed
+        self.datapaths = {} # {dpid: datapath}
+        self.miss_flows = {} # {dpid: (table_id, actions)}
+        self.stats = {} # {dpid: LimiterStats}
+        self.thread = hub.spawn(self._poll_loop)
+
+    # Install the table-miss flow of a datapath and ask whether it supports meters
+    def install_miss_flow(self, datapath, actions, table_id=0):
+        self.datapaths[datapath.id] = datapath
+        self.miss_flows[datapath.id] = (table_id, actions)
+        self.stats[datapath.id] = LimiterStats()
+        self.flow_installer.add_flow(datapath, 0, datapath.ofproto_parser.OFPMatch(), actions, table_id=table_id)
+        datapath.send_msg(datapath.ofproto_parser.OFPMeterFeaturesStatsRequest(datapath, 0))
+
+    # Replace the actions of the table-miss flow, e.g. another max_len of the controller output
+    def set_miss_actions(self, datapath, actions):
+        if datapath.id not in self.miss_flows:
+            return
+        table_id, _ = self.miss_flows[datapath.id]
+        self.miss_flows[datapath.id] = (table_id, actions)
+        self.flow_installer.add_msg(datapath, self._miss_flow_mod(datapath))
+        self.flow_installer.flush(datapath)
+
+    def _miss_flow_mod(self, datapath):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        table_id, actions = self.miss_flows[datapath.id]
+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        if self.stats[datapath.id].metered:
+            inst.insert(0, parser.OFPInstructionMeter(self.MISS_METER_ID))
+        return parser.OFPFlowMod(datapath=datapath, table_id=table_id, priority=0,
+                                 match=parser.OFPMatch(), instructions=inst)
+
+    def remove_datapath(self, dpid):
+        self.datapaths.pop(dpid, None)
+        self.miss_flows.pop(dpid, None)
+        self.stats.pop(dpid, None)
+
+    # Switches with packets/s drop meters get the metered table-miss flow, it replaces the unmetered one
+    def meter_features_reply(self, msg):
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        if datapath.id not in self.miss_flows:
+            return
+        supported = any(features.max_meter > 0 and features.band_types & (1 << ofproto.OFPMBT_DROP)
+                        and features.capabilities & ofproto.OFPMF_PKTPS for features in msg.body)
+        if not supported:
+            self.logger.info("Switch %016x has no packet-in meter, misses are only limited per source", datapath.id)
+            return
+
+        rate, burst = self.budgets.get(datapath.id, (self.rate, self.burst))
+        # A meter left from an earlier connection is replaced, deleting it also deletes its flows
+        self.flow_installer.add_msg(datapath, parser.OFPMeterMod(
+            datapath, command=ofproto.OFPMC_DELETE, meter_id=self.MISS_METER_ID))
+        self.flow_installer.add_msg(datapath, parser.OFPMeterMod(
+            datapath, command=ofproto.OFPMC_ADD, flags=ofproto.OFPMF_PKTPS | ofproto.OFPMF_BURST,
+            meter_id=self.MISS_METER_ID, bands=[parser.OFPMeterBandDrop(rate=rate, burst_size=burst)]))
+        self.stats[datapath.id].metered = True
+        self.flow_installer.add_msg(datapath, self._miss_flow_mod(datapath))
+        self.flow_installer.flush(datapath)
+        self.logger.info("Packet-in budget of switch %016x: %d packets/s, burst %d", datapath.id, rate, burst)
+
+    def _poll_loop(self):
+        while True:
+            hub.sleep(self.interval)
+            for dpid, datapath in list(self.datapaths.items()):
+                stats = self.stats.get(dpid)
+                if stats is not None and stats.metered:
+                    datapath.send_msg(datapath.ofproto_parser.OFPMeterStatsRequest(
+                        datapath, 0, self.MISS_METER_ID))
+
+    def meter_stats_reply(self, msg):
+        stats = self.stats.get(msg.datapath.id)
+        if stats is None:
+            return
+        for meter in msg.body:
+            if meter.meter_id != self.MISS_METER_ID:
+                continue
+            dropped = sum(band.packet_band_count for band in meter.band_stats)
+            if dropped > stats.meter_dropped:
+                stats.overloads += 1
+                self.logger.warning("Switch %016x is over its packet-in budget, %d misses dropped by the meter",
+                                    msg.datapath.id, dropped - stats.meter_dropped)
+            stats.meter_packets = meter.packet_in_count
+            stats.meter_dropped = dropped
+
+    # Source MACs that are not limited, e.g. the router ports that all routed traffic comes from
+    def exempt(self, macs):
+        self.exempt_macs.update(addrconv.mac.text_to_bin(mac) for mac in macs)
+
+    # Token bucket of the source MAC of a packet-in on its datapath, False if the packet-in has to be dropped.
+    # A host is charged once per switch, not for every switch its packet-ins cross.
+    def allow(self, msg):
+        dpid = msg.datapath.id
+        stats = self.stats.get(dpid)
+        if stats is None:
+            stats = self.stats[dpid] = LimiterStats()
+        eth_src = bytes(msg.data[6:12])
+        if eth_src in self.exempt_macs:
+            stats.allowed += 1
+            return True
+        key = (dpid, eth_src)
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [self.mac_burst, now]
+            if len(self.buckets) > self.max_macs:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(self.mac_burst, bucket[0] + (now - bucket[1]) * self.mac_rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            stats.dropped += 1
+            return False
+        bucket[0] -= 1
+        stats.allowed += 1
+        return True
+
+    def get_stats(self, dpid):
+        return self.stats.get(dpid)
@@ -0,0 +1,125 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Poll port and flow statistics of all switches to measure link load and find elephant flows.
+# See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#multipart-messages
+
+import time
+from collections import deque
+
+from ryu.lib import hub
+
+
+class TrafficMonitor:
+    """
+    Link utilization time series and flow rates from periodic statistics requests
+
+    Every interval seconds an OFPPortStatsRequest and an OFPFlowStatsRequest is sent to
+    every registered datapath. The app has to forward EventOFPPortStatsReply and
+    EventOFPFlowStatsReply to port_stats_reply() and flow_stats_reply(). Rates are
+    computed from the counter differences of two consecutive replies.
+    A flow is an elephant when it sends at least elephant_bps bits per second.
+    """
+
+    def __init__(self, logger, interval=2.0, history=30, elephant_bps=10e6, flow_match=None):
+        self.logger = logger
+        self.interval = interval
+        self.elephant_bps = elephant_bps
+        self.flow_match = flow_match # only flows covered by this match are polled, None for all
+        self.datapaths = {} # {dpid: datapath}
+        self.port_counters = {} # {(dpid, port): (time, tx_bytes, rx_bytes)}
+        self.link_load = {} # {(dpid, port): deque([(time, tx_bps, rx_bps)])}
+        self.history = history
+        self.flow_counters = {} # {(dpid, table_id, priority, match): (time, byte_count)}
+        self.flow_rates = {} # {(dpid, table_id, priority, match): bps}
+        self.thread = hub.spawn(self._poll_loop)
+
+    def add_datapath(self, datapath):
+        self.datapaths[datapath.id] = datapath
+
+    def remove_datapath(self, dpid):
+        self.datapaths.pop(dpid, None)
+        for table in (self.port_counters, self.link_load, self.flow_counters, self.flow_rates):
+            for key in [key for key in table if key[0] == dpid]:
+                del table[key]
+
+    def _poll_loop(self):
+        while True:
+            for datapath in list(self.datapaths.values()):
+                self.request_stats(datapath)
+            hub.sleep(self.interval)
+
+    def request_stats(self, datapath):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        datapath.send_msg(parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY))
+        match = self.flow_match(parser) if self.flow_match is not None else None
+        datapath.send_msg(parser.OFPFlowStatsRequest(datapath, match=match))
+
+    # Handle an OFPPortStatsReply, the rates of a port are appended to its time series
+    def port_stats_reply(self, msg):
+        dpid = msg.datapath.id
+        now = time.time()
+        for stat in msg.body:
+            key = (dpid, stat.port_no)
+            previous = self.port_counters.get(key)
+            self.port_counters[key] = (now, stat.tx_bytes, stat.rx_bytes)
+            if previous is None or now <= previous[0]:
+                continue
+            elapsed = now - previous[0]
+            tx_bps = max(stat.tx_bytes - previous[1], 0) * 8 / elapsed
+            rx_bps = max(stat.rx_bytes - previous[2], 0) * 8 / elapsed
+            series = self.link_load.setdefault(key, deque(maxlen=self.history))
+            series.append((now, tx_bps, rx_bps))
+
+    # Handle an OFPFlowStatsReply, returns the elephant flows [(dpid, stat, bps)] of the reply
+    def flow_stats_reply(self, msg):
+        dpid = msg.datapath.id
+        now = time.time()
+        elephants = []
+        for stat in msg.body:
+            key = (dpid, stat.table_id, stat.priority, tuple(sorted(stat.match.items())))
+            previous = self.flow_counters.get(key)
+            self.flow_counters[key] = (now, stat.byte_count)
+            # A replaced flow starts counting from zero again
+            if previous is None or now <= previous[0] or stat.byte_count < previous[1]:
+                self.flow_rates.pop(key, None)
+                continue
+            bps = (stat.byte_count - previous[1]) * 8 / (now - previous[0])
+            self.flow_rates[key] = bps
+            if bps >= self.elephant_bps:
+                elephants.append((dpid, stat, bps))
+        return elephants
+
+    # Latest transmit rate of a port in bits per second, 0 if not measured yet
+    def get_tx_bps(self, dpid, port):
+        series = self.link_load.get((dpid, port))
+        return series[-1][1] if series else 0.0
+
+    # (time, tx_bps, rx_bps) samples of a port, oldest first
+    def get_link_load(self, dpid, port):
+        return list(self.link_load.get((dpid, port), ()))
+
+    # Latest rate of a flow in bits per second, None if not measured yet
+    def get_flow_bps(self, dpid, table_id, priority, match):
+        return self.flow_rates.get((dpid, table_id, priority, tuple(sorted(match.items()))))
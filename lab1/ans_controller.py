@@ -29,21 +29,288 @@
 
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
-from ryu.ofproto import ofproto_v1_3, ether
+from ryu.ofproto import ofproto_v1_3
+from ryu.app.wsgi import WSGIApplication
 from ryu.utils import hex_array
-from ryu.lib.packet import packet, ethernet, ether_types, ipv4, arp, icmp
+from ryu.lib.packet import ether_types, ipv4, arp, icmp
+from ryu.lib import hub
+from collections import deque, OrderedDict
 import ipaddress
+import logging
+import socket
+import time
+import os
+import sys
+
+# Shared controller components are in common/ at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from flow_installer import FlowInstaller
+from packet_in_limiter import PacketInLimiter
+from packet_buffering import PacketBuffering
+from controller_metrics import ControllerMetrics, component_samples, dpid_label, timed
+from packet_headers import parse_headers, ReplyTemplates
+
+class RoutingTable:
+    """
+    Longest prefix match over IPv4 prefixes of any length
+
+    Routes are kept in one dict per prefix length keyed by the integer network address,
+    a lookup masks the address once per used prefix length, longest first. The cost
+    depends on the number of distinct prefix lengths (at most 33), not on the number of routes.
+    """
+
+    def __init__(self):
+        self.tables = {} # {prefix_len: {network: out_port}}
+        self.lengths = [] # [(prefix_len, mask, table)], longest prefix first
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+    def add_route(self, prefix, out_port):
+        net = ipaddress.IPv4Network(prefix, strict=False)
+        self.tables.setdefault(net.prefixlen, {})[int(net.network_address)] = out_port
+        self._update_lengths()
+
+    def remove_route(self, prefix):
+        net = ipaddress.IPv4Network(prefix, strict=False)
+        table = self.tables.get(net.prefixlen, {})
+        table.pop(int(net.network_address), None)
+        if not table:
+            self.tables.pop(net.prefixlen, None)
+        self._update_lengths()
+
+    def _update_lengths(self):
+        self.lengths = [(length, (0xffffffff << (32 - length)) & 0xffffffff, self.tables[length])
+                        for length in sorted(self.tables, reverse=True)]
+
+    # Returns the out_port of the longest matching prefix or None
+    def lookup(self, ip):
+        if isinstance(ip, str):
+            ip = int.from_bytes(socket.inet_aton(ip), 'big')
+        for (_, mask, table) in self.lengths:
+            out_port = table.get(ip & mask)
+            if out_port is not None:
+                return out_port
+        return None
+
+class AgingTable:
+    """
+    Dict with a size cap and a maximum entry age
+
+    An entry expires max_age seconds after it was last written, expired entries are
+    dropped when they are read. If the table is full, the least recently used entry is evicted.
+    on_evict(key, value) is called for every entry dropped because of its age or the size cap,
+    not for entries removed with pop().
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_size, max_age, on_evict=None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.on_evict = on_evict
+        self.entries = OrderedDict() # {key: (time, value)}, least recently used first
+        self.evictions = 0 # entries dropped because of the size cap or their age
+
+    def _evict(self, key, value):
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return self.get(key, self._MISSING) is not self._MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, self._MISSING)
+        if value is self._MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.entries[key] = (time.time(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            evicted, (_, evicted_value) = self.entries.popitem(last=False)
+            self._evict(evicted, evicted_value)
+
+    def get(self, key, default=None):
+        item = self.entries.get(key)
+        if item is None:
+            return default
+        if time.time() - item[0] > self.max_age:
+            del self.entries[key]
+            self._evict(key, item[1])
+            return default
+        self.entries.move_to_end(key)
+        return item[1]
+
+    def pop(self, key, default=None):
+        item = self.entries.pop(key, None)
+        return default if item is None else item[1]
+
+    def items(self):
+        self.expire()
+        return [(key, value) for (key, (_, value)) in self.entries.items()]
+
+    # Drop all expired entries
+    def expire(self):
+        deadline = time.time() - self.max_age
+        for key in [key for (key, (written, _)) in self.entries.items() if written < deadline]:
+            _, value = self.entries.pop(key)
+            self._evict(key, value)
+
+class PendingArpEntry:
+    def __init__(self, dp, out_port, now):
+        self.dp = dp
+        self.out_port = out_port # port the ARP requests are sent on
+        self.packets = deque() # [(time, event)]
+        self.retries = 0
+        self.last_request = now
+
+class PendingArpQueue:
+    """
+    Packets that wait for an ARP reply, kept per destination IP
+
+    Every destination buffers at most max_packets packets and at most max_destinations
+    destinations can be pending, so the memory is bounded. The ARP request is repeated
+    every retry_interval seconds up to max_retries times, then the destination is given up.
+    Buffered packets older than ttl seconds are dropped.
+    """
+
+    def __init__(self, max_packets=16, max_destinations=256, ttl=5.0, retry_interval=1.0, max_retries=3):
+        self.max_packets = max_packets
+        self.max_destinations = max_destinations
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self.entries = {} # {dst_ip: PendingArpEntry}
+        self.drops = {'queue_full': 0, 'too_many_destinations': 0, 'expired': 0, 'no_reply': 0}
+
+    def __len__(self):
+        return sum(len(entry.packets) for entry in self.entries.values())
+
+    # Buffer a packet, returns True if this is a new destination and an ARP request has to be sent
+    def add(self, dst_ip, ev, dp, out_port):
+        now = time.time()
+        entry = self.entries.get(dst_ip)
+        is_new = entry is None
+        if is_new:
+            if len(self.entries) >= self.max_destinations:
+                self.drops['too_many_destinations'] += 1
+                return False
+            entry = self.entries[dst_ip] = PendingArpEntry(dp, out_port, now)
+        if len(entry.packets) >= self.max_packets:
+            entry.packets.popleft() # drop the oldest packet
+            self.drops['queue_full'] += 1
+        entry.packets.append((now, ev))
+        return is_new
+
+    # Remove a destination and return its packets that are not expired yet
+    def pop(self, dst_ip):
+        entry = self.entries.pop(dst_ip, None)
+        if entry is None:
+            return []
+        deadline = time.time() - self.ttl
+        events = [ev for (queued, ev) in entry.packets if queued >= deadline]
+        self.drops['expired'] += len(entry.packets) - len(events)
+        return events
+
+    # Drop destinations that ran out of retries, returns the entries whose ARP request is due again
+    def expire(self):
+        now = time.time()
+        retry = []
+        for dst_ip, entry in list(self.entries.items()):
+            if now - entry.last_request < self.retry_interval:
+                continue
+            if entry.retries >= self.max_retries:
+                del self.entries[dst_ip]
+                self.drops['no_reply'] += len(entry.packets)
+                continue
+            entry.retries += 1
+            entry.last_request = now
+            retry.append((dst_ip, entry))
+        return retry
 
 class LearningSwitch(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _CONTEXTS = {'wsgi': WSGIApplication}
+
+    # Proactive router pipeline: subnet flows in the first table,
+    # one neighbor flow per host (the destination MAC) in the second table
+    ROUTER_L3_TABLE = 0
+    ROUTER_NEIGHBOR_TABLE = 1
+    # Two-table switch pipeline: known (in_port, eth_src) pairs in the first table,
+    # forwarding on eth_dst in the second table, unknown destinations are flooded there
+    SWITCH_SRC_TABLE = 0
+    SWITCH_DST_TABLE = 1
+    # Priorities of the proactive router flows, forwarding flows get ROUTE_PRIORITY + prefix length
+    ROUTE_PRIORITY = 100
+    SAME_SUBNET_PRIORITY = 200
+    EXTERNAL_PRIORITY = 300
+    RESPONDER_PRIORITY = 400
+
+    # Learned flows are removed by the switch when they are unused for FLOW_IDLE_TIMEOUT seconds
+    # and at the latest after FLOW_HARD_TIMEOUT seconds, 0 installs permanent flows
+    FLOW_IDLE_TIMEOUT = 60
+    FLOW_HARD_TIMEOUT = 600
+    # Size cap and maximum age [s] of the MAC table of every switch and of the router's ARP table.
+    # A MAC entry outlives the flows installed when it was learned, the flows of an evicted host are
+    # deleted, otherwise a host that moves without being in the table would keep its stale flows.
+    MAC_TABLE_SIZE = 4096
+    MAC_TABLE_AGE = FLOW_HARD_TIMEOUT
+    ARP_TABLE_SIZE = 1024
+    ARP_TABLE_AGE = 300
+    # Seconds between two table statistics requests, the flow-table occupancy of every switch
+    TABLE_STATS_INTERVAL = 10
 
     def __init__(self, *args, **kwargs):
         super(LearningSwitch, self).__init__(*args, **kwargs)
+
+        # Counters and handler latencies, served on http://<controller>:8080/metrics
+        self.metrics = ControllerMetrics()
+        self.metrics.add_collector(self._collect_metrics)
+        self.metrics.serve(kwargs['wsgi'])
+
+        # Flow-mods are queued per switch and sent in batches closed by a barrier
+        self.flow_installer = FlowInstaller(self.logger)
+
+        # Table misses are metered in the switch and limited per source MAC in the controller,
+        # budgets={dpid: (packets/s, burst)} overrides the packet-in budget of single switches
+        self.packet_in_limiter = PacketInLimiter(self.logger, self.flow_installer)
+
+        # With miss_send_len=128 the switches buffer table misses and only send the headers,
+        # packet-outs and flow-mods reference the buffer. None sends full frames.
+        self.packet_buffering = PacketBuffering(self.logger, self.packet_in_limiter, miss_send_len=None)
         
         # Layer 2 switch MAC address table
-        self.mac_port_map = {} # {dp_id: {mac: port}}
+        self.mac_port_map = {} # {dp_id: AgingTable(mac: port)}
+        # In the single-table pipeline, the in_ports of the flows towards every host (None for the
+        # aggregated flow), the host is only forgotten once its last flow is gone
+        self.host_flows = {} # {dp_id: {mac: {in_port}}}
+
+        # Learn sources and forward on destinations in separate tables, the controller only sees
+        # the first packet of every host instead of the first packet of every host pair.
+        # False installs one (in_port, eth_dst) flow per host pair in a single table.
+        self.switch_multi_table = True
+        self.packet_in_counts = {} # {dp_id: packet-ins}, compare with the learned hosts in mac_port_map
+
+        # In the single-table pipeline, install one flow per destination for all ingress ports
+        # (plus a hairpin guard) instead of one per (in_port, eth_dst), so the table grows with
+        # the hosts only. The two-table pipeline forwards on the destination only anyway.
+        # Without a source table nothing detects a host that moves: its packets hit the flows of
+        # other destinations, and the replies keep its stale flow alive, so the host is black-holed
+        # for up to FLOW_HARD_TIMEOUT seconds. Use switch_multi_table for small tables instead.
+        self.switch_compact_flows = False
+
+        # Active flows per table of every switch, from periodic table statistics
+        self.datapaths = {} # {dp_id: datapath}
+        self.flow_table_occupancy = {} # {dp_id: {table_id: active flows}}
+        self.table_stats_thread = hub.spawn(self._table_stats_loop)
 
         # Layer 3 router port MACs and IP addresses
         self.router = 3 # The router is the switch with DPID 3
@@ -54,24 +321,58 @@ class LearningSwitch(app_manager.RyuApp):
             2: "00:00:00:00:01:02",
             3: "00:00:00:00:01:03"
         }
+        # Routed traffic leaves the router with the MAC of its port as source, it must not share one
+        # packet-in budget on the switch behind that port
+        self.packet_in_limiter.exempt(self.router_port_to_own_mac.values())
         # Router port (gateways) IP addresses assumed by the controller
         self.router_port_to_own_ip = {
             1: "10.0.1.1",
             2: "10.0.2.1",
             3: "192.168.1.1"
         }
+        # Subnets reachable through the router ports, any prefix length is allowed
+        self.router_port_to_subnets = {
+            1: ["10.0.1.0/24"],
+            2: ["10.0.2.0/24"],
+            3: ["192.168.1.0/24"]
+        }
+        # Ports towards the external network, no traffic is routed from or to them
+        self.router_external_ports = {3}
+
+        self.routing_table = RoutingTable()
+        for (port, subnets) in self.router_port_to_subnets.items():
+            for subnet in subnets:
+                self.routing_table.add_route(subnet, port)
+
+        # Install subnet flows and in-switch ARP/ICMP responders when the router connects,
+        # the controller only sees packets to hosts whose MAC is still unknown.
+        # Requires Open vSwitch for the Nicira move actions of the responders.
+        self.router_proactive = True
+        
+        # Pre-built ARP and ICMP frames of every router port, only the variable fields are written per reply
+        self.router_port_templates = {
+            port: ReplyTemplates(self.router_port_to_own_mac[port], ip)
+            for (port, ip) in self.router_port_to_own_ip.items()
+        }
         
-        self.router_arp_table = {} # {h1_ip: h1_mac}
+        self.router_arp_table = AgingTable(self.ARP_TABLE_SIZE, self.ARP_TABLE_AGE) # {h1_ip: h1_mac}
         
         # When the router needs to first learn the MAC address of a host,
         # it will buffer the packet (the event) until the ARP reply is received
-        self.router_event_buffer = [] # [(event, dst_ip)]
+        self.arp_pending = PendingArpQueue()
+        self.arp_retry_thread = hub.spawn(self._arp_retry_loop)
 
     
     # Handle the packet_in event
     # See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#packet-in-message
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
+        self.metrics.packet_in(ev)
+        if self.packet_buffering.packet_in(ev.msg) and self.packet_in_limiter.allow(ev.msg):
+            self._process_packet_in(ev)
+
+    @timed
+    def _process_packet_in(self, ev):
         msg = ev.msg
         datapath = msg.datapath
         
@@ -85,40 +386,38 @@ class LearningSwitch(app_manager.RyuApp):
         msg = ev.msg
         dp = msg.datapath
         in_port = msg.match['in_port']
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-        
-        if eth.ethertype == ether_types.ETH_TYPE_IP:
-            ip_pkt = pkt.get_protocol(ipv4.ipv4)
-            src_ip = ip_pkt.src
-            dst_ip = ip_pkt.dst
+        # Only the header fields are decoded, a full parse is done for ICMP echo requests
+        hdr = parse_headers(msg.data)
+        if hdr is None:
+            return
+        
+        if hdr.ethertype == ether_types.ETH_TYPE_IP and hdr.ip_src is not None:
+            src_ip = hdr.ip_src
+            dst_ip = hdr.ip_dst
             
             # check if dstip is a router ip but only the gateway ip of the current host
             if self.router_port_to_own_ip[in_port] == dst_ip:
                 # check if the packet is an ICMP echo request
-                if ip_pkt.proto == ipv4.inet.IPPROTO_ICMP:
-                    self._handle_icmp_request(dp, pkt, in_port)
+                if hdr.ip_proto == ipv4.inet.IPPROTO_ICMP:
+                    self._handle_icmp_request(dp, msg.data, hdr, in_port)
                 else:
                     self.logger.info("unsupported protocol")
             else: # packet is not for the router (actual routing)
                 self.logger.info("IP packet is not for the router, routing required")
 
-                # check to which subnet the dstip belongs to determine the out_port
-                if self._in_same_subnet(dst_ip, self.router_port_to_own_ip.get(1)):
-                    out_port = 1
-                elif self._in_same_subnet(dst_ip, self.router_port_to_own_ip.get(2)):
-                    out_port = 2
-                elif self._in_same_subnet(dst_ip, self.router_port_to_own_ip.get(3)):
+                # look up the subnet the dstip belongs to determine the out_port
+                out_port = self.routing_table.lookup(dst_ip)
+                if out_port is None:
+                    self.logger.info("Target subnet unknown")
+                    # drop the packet
+                    return
+                elif out_port in self.router_external_ports:
                     self.logger.info("IP packet is for the external network, not allowed")
                     # drop the packet, no communication with the external network allowed
                     # could add a flow to the router to drop the packet
                     return
-                else:
-                    self.logger.info("Target subnet unknown")
-                    # drop the packet
-                    return
                 
-                if self._in_same_subnet(src_ip, self.router_port_to_own_ip[3]):
+                if self.routing_table.lookup(src_ip) in self.router_external_ports:
                     self.logger.info("IP packet is from the external network, not allowed")
                     # drop the packet, no communication with the external network allowed
                     # could add a flow to the router to drop the packet
@@ -134,42 +433,41 @@ class LearningSwitch(app_manager.RyuApp):
                 # Check if the destination MAC address is known
                 if dst_ip in self.router_arp_table:
                     self.logger.info("Destination IP %s in ARP table, continue routing", dst_ip)
-                    self._route_packet(dp, in_port, src_ip, out_port, dst_ip, pkt)
+                    self._route_packet(dp, in_port, src_ip, out_port, dst_ip, msg.data)
                     return
                 else:
                     self.logger.info("Destination IP %s not in ARP table, send ARP request first", dst_ip)
-                    # Buffer the packet until the ARP reply is received
-                    self.router_event_buffer.append((ev, dst_ip))
-                    # Send an ARP request to learn the MAC address of the destination IP
-                    self._send_arp_request(dp, out_port, dst_ip)
+                    # Buffer the packet until the ARP reply is received and send an ARP request
+                    # to learn the MAC address of the destination IP, unless one is already pending
+                    if self.arp_pending.add(dst_ip, ev, dp, out_port):
+                        self._send_arp_request(dp, out_port, dst_ip)
                     return
                 
-        elif eth.ethertype == ether_types.ETH_TYPE_ARP:
-            arp_pkt = pkt.get_protocol(arp.arp)
-            
-            if arp_pkt.opcode == arp.ARP_REQUEST:
+        elif hdr.ethertype == ether_types.ETH_TYPE_ARP and hdr.arp_opcode is not None:
+            if hdr.arp_opcode == arp.ARP_REQUEST:
                 # Check if the request is for one of the router's IP addresses
-                if arp_pkt.dst_ip in self.router_port_to_own_ip.values():
-                    self._handle_arp_request(dp, arp_pkt, eth, in_port)
+                if hdr.arp_dst_ip in self.router_port_to_own_ip.values():
+                    self._handle_arp_request(dp, hdr, in_port)
                 else:
                     # drop the packet, not for the router
                     pass
                 # Update own ARP table whenever a new MAC address is learned
-                self.router_arp_table[arp_pkt.src_ip] = arp_pkt.src_mac
-                self.logger.info("Updated ARP table: %s -> %s", arp_pkt.src_ip, arp_pkt.src_mac)
+                self.router_arp_table[hdr.arp_src_ip] = hdr.arp_src_mac
+                self.logger.info("Updated ARP table: %s -> %s", hdr.arp_src_ip, hdr.arp_src_mac)
+                self._release_pending(hdr.arp_src_ip)
                 
-            elif arp_pkt.opcode == arp.ARP_REPLY:
+            elif hdr.arp_opcode == arp.ARP_REPLY:
                 # check if the reply was sent to the router
-                if arp_pkt.dst_ip in self.router_port_to_own_ip.values():
-                    self._handle_arp_reply(arp_pkt)
+                if hdr.arp_dst_ip in self.router_port_to_own_ip.values():
+                    self._handle_arp_reply(hdr)
                 else:
                     # drop the packet, not for the router
                     return
                 
         else:
-            self.logger.debug("Unsupported ethertype: %s", hex(eth.ethertype))
+            self.logger.debug("Unsupported ethertype: %s", hex(hdr.ethertype))
     
-    def _route_packet(self, dp, in_port, src_ip, out_port, dst_ip, pkt):
+    def _route_packet(self, dp, in_port, src_ip, out_port, dst_ip, data):
         # Route the packet to the destination port
         ofp_parser = dp.ofproto_parser
         ofp = dp.ofproto
@@ -194,164 +492,93 @@ class LearningSwitch(app_manager.RyuApp):
             ofp_parser.OFPActionOutput(out_port)
         ]
         
-        self.add_flow(dp, 1, match, actions) # Add a flow to the router
-        self.logger.info("Flow added to router: ETH_TYPE_IP @ in_port %d -> %s: Change MACs and output at out_port %d", in_port, dst_ip, out_port)
+        if self.router_proactive:
+            # The subnet flow already selected the source MAC and the out_port, only the neighbor is missing
+            self._add_neighbor_flow(dp, dst_ip, dst_mac)
+        else:
+            self._add_learned_flow(dp, 1, match, actions) # Add a flow to the router
+            self.logger.info("Flow added to router: ETH_TYPE_IP @ in_port %d -> %s: Change MACs and output at out_port %d", in_port, dst_ip, out_port)
+        self.flow_installer.flush(dp) # the flow must be sent before the packet
         
         msg = ofp_parser.OFPPacketOut(
             datapath=dp, 
             buffer_id=ofp.OFP_NO_BUFFER,
             in_port=in_port, # test: changed this to OFPP_CONTROLLER
             actions=actions,
-            data=pkt.data)
+            data=data)
         dp.send_msg(msg)
     
-    def _send_arp_request(self, dp, out_port, dst_ip):
+    # Send a frame built by the controller on a router port
+    def _send_frame(self, dp, out_port, frame):
         ofp_parser = dp.ofproto_parser
         ofp = dp.ofproto
         
-        router_mac = self.router_port_to_own_mac[out_port]
-        src_ip = self.router_port_to_own_ip[out_port]
-        
-        self.logger.info("Sending ARP Request on port %d: Who-has %s? Tell %s", out_port, dst_ip, src_ip)
-        
-        # Create an Ethernet header for the ARP request
-        # see: https://ryu.readthedocs.io/en/latest/library_packet_ref/packet_ethernet.html#ryu.lib.packet.ethernet.ethernet
-        eth_request = ethernet.ethernet(
-            ethertype=ether_types.ETH_TYPE_ARP,
-            dst='ff:ff:ff:ff:ff:ff',
-            src=router_mac)
-        
-        # Create an ARP request packet
-        # see: https://ryu.readthedocs.io/en/latest/library_packet_ref/packet_arp.html#ryu.lib.packet.arp.arp
-        arp_request = arp.arp(
-            opcode=arp.ARP_REQUEST,
-            src_mac=router_mac,
-            dst_mac='ff:ff:ff:ff:ff:ff',
-            src_ip=src_ip,
-            dst_ip=dst_ip)
-        
-        out_pkt = packet.Packet()
-        out_pkt.add_protocol(eth_request) # Create Ethernet header
-        out_pkt.add_protocol(arp_request) # Add ARP request to the packet
-        out_pkt.serialize()
-        
-        actions = [dp.ofproto_parser.OFPActionOutput(out_port)]
+        actions = [ofp_parser.OFPActionOutput(out_port)]
         
+        # Setting in_port = ofp.OFPP_CONTROLLER is important, packet is generated by the controller
         msg = ofp_parser.OFPPacketOut(
             datapath=dp,
             buffer_id=ofp.OFP_NO_BUFFER,
-            in_port=ofp.OFPP_CONTROLLER, # important: not in_port but OFPP_CONTROLLER
+            in_port=ofp.OFPP_CONTROLLER,
             actions=actions,
-            data=out_pkt)
+            data=bytes(frame))
         
         dp.send_msg(msg)
     
-    def _handle_icmp_request(self, dp, pkt, in_port):
-        ofp_parser = dp.ofproto_parser
-        ofp = dp.ofproto
-        
-        eth = pkt.get_protocol(ethernet.ethernet)
-        ip_pkt = pkt.get_protocol(ipv4.ipv4)
-        icmp_pkt = pkt.get_protocol(icmp.icmp)
-        echo_req = icmp_pkt.data
-
-        self.logger.info("Received ICMP echo request from %s to %s", ip_pkt.src, ip_pkt.dst)
-        self.logger.info("Sending ICMP echo reply to %s on port %d", ip_pkt.src, in_port)
-
-        # Create an Ethernet header for the ICMP reply
-        eth_reply = ethernet.ethernet(
-            dst=eth.src,
-            src=eth.dst,
-            ethertype=ether.ETH_TYPE_IP)
-        
-        # Create an IP header for the ICMP reply
-        # see: https://ryu.readthedocs.io/en/latest/library_packet_ref/packet_ipv4.html#ryu.lib.packet.ipv4.ipv4
-        ip_reply = ipv4.ipv4(
-            dst=ip_pkt.src,
-            src=ip_pkt.dst,
-            proto=ipv4.inet.IPPROTO_ICMP)
+    def _send_arp_request(self, dp, out_port, dst_ip):
+        src_ip = self.router_port_to_own_ip[out_port]
         
-        # Create an ICMP reply packet
-        # see: https://ryu.readthedocs.io/en/latest/library_packet_ref/packet_icmp.html
-        icmp_reply = icmp.icmp( 
-            type_=icmp.ICMP_ECHO_REPLY,
-            code=0, # ICMP code for echo reply
-            csum=0, # checksum will be calculated automatically
-            data=icmp.echo(id_=echo_req.id, seq=echo_req.seq, data=echo_req.data))
+        self.logger.info("Sending ARP Request on port %d: Who-has %s? Tell %s", out_port, dst_ip, src_ip)
         
-        reply_pkt = packet.Packet()
-        reply_pkt.add_protocol(eth_reply)
-        reply_pkt.add_protocol(ip_reply)
-        reply_pkt.add_protocol(icmp_reply)
-        reply_pkt.serialize()
+        frame = self.router_port_templates[out_port].build_arp_request(dst_ip)
+        self._send_frame(dp, out_port, frame)
+    
+    def _handle_icmp_request(self, dp, data, hdr, in_port):
+        self.logger.info("Received ICMP echo request from %s to %s", hdr.ip_src, hdr.ip_dst)
         
-        actions = [dp.ofproto_parser.OFPActionOutput(in_port)]
+        # The request's identifier, sequence number and payload are copied into the reply
+        frame = self.router_port_templates[in_port].build_echo_reply(data, hdr)
+        if frame is None:
+            self.logger.info("ICMP message to %s is no echo request, ignored", hdr.ip_dst)
+            return
         
+        self.logger.info("Sending ICMP echo reply to %s on port %d", hdr.ip_src, in_port)
         # Send the ICMP reply back to the host
-        # Setting in_port = ofp.OFPP_CONTROLLER is important, packet is generated by the controller
-        out = ofp_parser.OFPPacketOut(
-            datapath=dp,
-            buffer_id=ofp.OFP_NO_BUFFER,
-            in_port=ofp.OFPP_CONTROLLER,
-            actions=actions,
-            data=reply_pkt.data)
-        
-        dp.send_msg(out)
+        self._send_frame(dp, in_port, frame)
     
-    def _handle_arp_request(self, dp, arp_pkt, eth, in_port):
-        ofp_parser = dp.ofproto_parser
-        ofp = dp.ofproto
-        
-        self.logger.info("Received ARP Request: Who-has %s? Tell %s", arp_pkt.dst_ip, arp_pkt.src_ip)
-        
-        out_port = in_port
-        router_mac = self.router_port_to_own_mac[out_port]
-        
-        # Create an Ethernet header for the ARP reply
-        eth_reply = ethernet.ethernet(
-            ethertype=ether_types.ETH_TYPE_ARP,
-            dst=eth.src,
-            src=router_mac)
-        
-        # Create an ARP reply packet
-        # see: https://ryu.readthedocs.io/en/latest/library_packet_ref/packet_arp.html#ryu.lib.packet.arp.arp
-        arp_reply = arp.arp(
-            opcode=arp.ARP_REPLY,
-            src_mac=router_mac,
-            src_ip=arp_pkt.dst_ip,
-            dst_mac=arp_pkt.src_mac,
-            dst_ip=arp_pkt.src_ip)
+    def _handle_arp_request(self, dp, hdr, in_port):
+        self.logger.info("Received ARP Request: Who-has %s? Tell %s", hdr.arp_dst_ip, hdr.arp_src_ip)
         
-        out_pkt = packet.Packet()
-        out_pkt.add_protocol(eth_reply) # Create Ethernet header
-        out_pkt.add_protocol(arp_reply) # Add ARP reply to the packet
-        out_pkt.serialize()
+        # Answered with the MAC of the port the request arrived on
+        templates = self.router_port_templates[in_port]
+        frame = templates.build_arp_reply(hdr.arp_src_mac, hdr.arp_src_ip, src_ip=hdr.arp_dst_ip)
+        self._send_frame(dp, in_port, frame)
         
-        actions = [dp.ofproto_parser.OFPActionOutput(in_port)]
-        
-        # Setting in_port = ofp.OFPP_CONTROLLER is important, packet is generated by the controller
-        msg = ofp_parser.OFPPacketOut(
-            datapath=dp,
-            buffer_id=ofp.OFP_NO_BUFFER,
-            in_port=ofp.OFPP_CONTROLLER,
-            actions=actions,
-            data=out_pkt)
-        
-        dp.send_msg(msg)
+        self.logger.info("Sent ARP Reply: %s is at %s", hdr.arp_dst_ip, self.router_port_to_own_mac[in_port])
         
-        self.logger.info("Sent ARP Reply: %s is at %s", arp_pkt.dst_ip, router_mac)
-        
-    def _handle_arp_reply(self, arp_pkt):
+    def _handle_arp_reply(self, hdr):
         # Update the ARP table
-        self.router_arp_table[arp_pkt.src_ip] = arp_pkt.src_mac
-        self.logger.info("Updated ARP table: %s -> %s", arp_pkt.src_ip, arp_pkt.src_mac)
+        self.router_arp_table[hdr.arp_src_ip] = hdr.arp_src_mac
+        self.logger.info("Updated ARP table: %s -> %s", hdr.arp_src_ip, hdr.arp_src_mac)
         
-        # Continue with previously buffered packets (e.g. ICMP echo requests)
-        for (ev, dst_ip) in self.router_event_buffer:
-            if dst_ip in self.router_arp_table:
-                self.logger.info("Continuing with buffered packet for %s", dst_ip)
-                self._packet_in_router_handler(ev)
-                self.router_event_buffer.remove((ev, dst_ip))
+        self._release_pending(hdr.arp_src_ip)
+
+    # Continue with the packets buffered for an IP address (e.g. ICMP echo requests)
+    def _release_pending(self, ip):
+        for ev in self.arp_pending.pop(ip):
+            self.logger.info("Continuing with buffered packet for %s", ip)
+            self._packet_in_router_handler(ev)
+
+    # Repeat unanswered ARP requests and give up on hosts that never answer
+    def _arp_retry_loop(self):
+        while True:
+            hub.sleep(self.arp_pending.retry_interval)
+            for dst_ip, entry in self.arp_pending.expire():
+                self.logger.info("No ARP reply from %s yet, retry %d", dst_ip, entry.retries)
+                self._send_arp_request(entry.dp, entry.out_port, dst_ip)
+            if any(self.arp_pending.drops.values()):
+                self.logger.debug("ARP pending queue: %d packets buffered, drops %s",
+                                  len(self.arp_pending), self.arp_pending.drops)
 
     def _packet_in_switch_handler(self, ev):
         msg = ev.msg
@@ -367,26 +594,46 @@ class LearningSwitch(app_manager.RyuApp):
         else:
             reason = 'not supported yet'
 
-        self.logger.debug('OFPPacketIn received on port %d: '
-                            'buffer_id=%x total_len=%d reason=%s '
-                            'table_id=%d cookie=%d match=%s data=%s',
-                            in_port, msg.buffer_id, msg.total_len, reason,
-                            msg.table_id, msg.cookie, msg.match,
-                            hex_array(msg.data))
-        
-        # Parse the packet
-        # See: https://ryu.readthedocs.io/en/latest/library_packet.html
+        # hex_array() formats the whole packet, only do it if the message is logged
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('OFPPacketIn received on port %d: '
+                                'buffer_id=%x total_len=%d reason=%s '
+                                'table_id=%d cookie=%d match=%s data=%s',
+                                in_port, msg.buffer_id, msg.total_len, reason,
+                                msg.table_id, msg.cookie, msg.match,
+                                hex_array(msg.data))
+        
+        # Decode the Ethernet addresses straight from the packet data
         # See: https://ryu.readthedocs.io/en/latest/library_packet_ref/packet_ethernet.html#module-ryu.lib.packet.ethernet
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
+        hdr = parse_headers(msg.data)
+        if hdr is None:
+            return
         
-        eth_src = eth.src
-        eth_dst = eth.dst
+        eth_src = hdr.eth_src
+        eth_dst = hdr.eth_dst
+        self.packet_in_counts[dp_id] = self.packet_in_counts.get(dp_id, 0) + 1
 
         # Learn the MAC address and port mapping (step 1)
         if dp_id not in self.mac_port_map:
-            self.mac_port_map[dp_id] = {} # Initialize the mapping for this new switch
+            # Initialize the mapping for this new switch
+            self.mac_port_map[dp_id] = AgingTable(self.MAC_TABLE_SIZE, self.MAC_TABLE_AGE,
+                                                  on_evict=lambda mac, port: self._evict_host(dp_id, mac))
+        old_port = self.mac_port_map[dp_id].get(eth_src)
+        if old_port is not None and old_port != in_port:
+            # The host moved, the flows towards its old port are stale
+            self.logger.info("Host %s moved from port %d to port %d on switch %d", eth_src, old_port, in_port, dp_id)
+            self._delete_host_flows(dp, eth_src)
         self.mac_port_map[dp_id][eth_src] = in_port # Memorize the source MAC on the current port
+
+        if self.switch_multi_table:
+            # Only unknown sources miss the first table, the packet is sent back through the pipeline
+            # once the flows of the source are installed, so the switch floods or forwards it
+            self._add_source_flows(dp, in_port, eth_src)
+            self.flow_installer.flush(dp) # the flows must be sent before the packet
+            self.logger.debug("Learned %s on port %d of switch %d: %d hosts, %d packet-ins",
+                              eth_src, in_port, dp_id, len(self.mac_port_map[dp_id]), self.packet_in_counts[dp_id])
+            self.packet_buffering.packet_out(msg, [ofp_parser.OFPActionOutput(ofp.OFPP_TABLE)])
+            return
         # Do not install a flow here, pre-installing flows for hypothetical future packets could create stale routes
         # Only install paths as they are needed, see below.
 
@@ -394,9 +641,18 @@ class LearningSwitch(app_manager.RyuApp):
         # Only install the flow when a packet is sent to a known MAC address to verify the path exists, ensuring the flow is only installed when needed.
         if eth_dst in self.mac_port_map[dp_id]:
             out_port = self.mac_port_map[dp_id][eth_dst] # Forward the packet to the corresponding port
-            match = ofp_parser.OFPMatch(in_port=in_port, eth_dst=eth_dst) # New match rule
             actions = [ofp_parser.OFPActionOutput(out_port)]
-            self.add_flow(dp, 1, match, actions) # Add a flow to the switch
+            # A buffered packet is forwarded by the new flow itself, no packet-out needed
+            buffer_id = self.packet_buffering.flow_mod_buffer_id(msg)
+            if self.switch_compact_flows:
+                self._add_destination_flows(dp, eth_dst, out_port, buffer_id)
+            else:
+                match = ofp_parser.OFPMatch(in_port=in_port, eth_dst=eth_dst) # New match rule
+                self._add_learned_flow(dp, 1, match, actions, buffer_id=buffer_id) # Add a flow to the switch
+                self.host_flows.setdefault(dp_id, {}).setdefault(eth_dst, set()).add(in_port)
+            self.flow_installer.flush(dp) # the flow must be sent before the packet
+            if buffer_id != ofp.OFP_NO_BUFFER:
+                return
         else:
             out_port = ofp.OFPP_FLOOD # Flood on all ports
             actions = [ofp_parser.OFPActionOutput(out_port)]
@@ -405,43 +661,290 @@ class LearningSwitch(app_manager.RyuApp):
 
         # Send the packet out to the switch either to the known port or flood it
         # See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#ryu.ofproto.ofproto_v1_3_parser.OFPPacketOut
-        msg = ofp_parser.OFPPacketOut(
-            datapath=dp,
-            buffer_id=ofp.OFP_NO_BUFFER,
-            in_port=in_port,
-            actions=actions,
-            data=msg.data)
-        
-        dp.send_msg(msg) # 	Queue an OpenFlow message to send to the corresponding switch
+        self.packet_buffering.packet_out(msg, actions, in_port)
         
-    def _in_same_subnet(self, ip1, ip2, netmask='255.255.255.0'):
-        net = ipaddress.IPv4Network(f"0.0.0.0/{netmask}")
-        prefix_len = net.prefixlen
-        network1 = ipaddress.ip_network(f"{ip1}/{prefix_len}", strict=False)
-        network2 = ipaddress.ip_network(f"{ip2}/{prefix_len}", strict=False)
-        return network1.network_address == network2.network_address
-
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    @timed
     def switch_features_handler(self, ev):
         
         datapath = ev.msg.datapath
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
-        # Initial flow entry for matching misses
+        # Initial flow entry for matching misses. The router keeps packets while it waits for
+        # ARP replies and answers echo requests with their payload, so it always gets full frames.
         match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, match, actions)
+        self.packet_buffering.install_miss_flow(datapath, full_frames=datapath.id == self.router)
+        self.datapaths[datapath.id] = datapath
+        if datapath.id == self.router and self.router_proactive:
+            self._install_router_flows(datapath)
+        elif datapath.id != self.router and self.switch_multi_table:
+            # Destinations without a flow are flooded by the switch, not sent to the controller
+            self.add_flow(datapath, 0, match, [parser.OFPActionOutput(ofproto.OFPP_FLOOD)],
+                          table_id=self.SWITCH_DST_TABLE)
+        self.flow_installer.flush(datapath)
+
+    # Two-table switch flows of a new host: its source is known on in_port and it is reached through in_port.
+    # Only the source flow times out, the destination flow is removed with it (see _flow_removed_handler),
+    # otherwise traffic towards a host that keeps sending would be flooded without a packet-in.
+    def _add_source_flows(self, dp, in_port, eth_src):
+        ofp = dp.ofproto
+        parser = dp.ofproto_parser
+        mod = parser.OFPFlowMod(
+            datapath=dp, table_id=self.SWITCH_SRC_TABLE, priority=1,
+            match=parser.OFPMatch(in_port=in_port, eth_src=eth_src),
+            instructions=[parser.OFPInstructionGotoTable(self.SWITCH_DST_TABLE)],
+            idle_timeout=self.FLOW_IDLE_TIMEOUT, hard_timeout=self.FLOW_HARD_TIMEOUT, flags=ofp.OFPFF_SEND_FLOW_REM)
+        self.flow_installer.add_msg(dp, mod)
+        self.add_flow(dp, 1, parser.OFPMatch(eth_dst=eth_src), [parser.OFPActionOutput(in_port)],
+                      table_id=self.SWITCH_DST_TABLE)
+
+    # Aggregated single-table flows of a destination: one flow for all ingress ports, and a guard that
+    # drops packets arriving on the port of the destination instead of sending them back out of it.
+    # Per-port flows of the destination installed before are replaced by the aggregated one.
+    # The guard is removed together with the forwarding flow (see _flow_removed_handler),
+    # a buffered packet (buffer_id) is forwarded by the new flow.
+    def _add_destination_flows(self, dp, eth_dst, out_port, buffer_id):
+        parser = dp.ofproto_parser
+        self._delete_flows(dp, parser.OFPMatch(eth_dst=eth_dst))
+        self._add_learned_flow(dp, 1, parser.OFPMatch(eth_dst=eth_dst), [parser.OFPActionOutput(out_port)],
+                               buffer_id=buffer_id)
+        self.host_flows.setdefault(dp.id, {})[eth_dst] = {None}
+        self.add_flow(dp, 2, parser.OFPMatch(in_port=out_port, eth_dst=eth_dst), [],
+                      hard_timeout=self.FLOW_HARD_TIMEOUT)
+
+    # Proactive router flows, the number of flows depends on the ports and subnets, not on the hosts
+    def _install_router_flows(self, dp):
+        ofp = dp.ofproto
+        parser = dp.ofproto_parser
+
+        for (port, subnets) in self.router_port_to_subnets.items():
+            router_mac = self.router_port_to_own_mac[port]
+            for subnet in subnets:
+                net = ipaddress.IPv4Network(subnet, strict=False)
+                ipv4_net = (str(net.network_address), str(net.netmask))
+
+                if port in self.router_external_ports:
+                    # No communication with the external network in either direction
+                    for field in ('ipv4_src', 'ipv4_dst'):
+                        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, **{field: ipv4_net})
+                        self.add_flow(dp, self.EXTERNAL_PRIORITY, match, [])
+                    continue
+
+                # Packets between hosts of the same subnet are not routed
+                match = parser.OFPMatch(in_port=port, eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=ipv4_net)
+                self.add_flow(dp, self.SAME_SUBNET_PRIORITY, match, [])
+
+                # Set the source MAC and the out_port, the neighbor table adds the destination MAC
+                match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=ipv4_net)
+                inst = [
+                    parser.OFPInstructionActions(ofp.OFPIT_WRITE_ACTIONS, [
+                        parser.OFPActionSetField(eth_src=router_mac),
+                        parser.OFPActionOutput(port)]),
+                    parser.OFPInstructionGotoTable(self.ROUTER_NEIGHBOR_TABLE)
+                ]
+                self.flow_installer.add_msg(dp, parser.OFPFlowMod(
+                    datapath=dp, table_id=self.ROUTER_L3_TABLE, priority=self.ROUTE_PRIORITY + net.prefixlen,
+                    match=match, instructions=inst))
+
+            self._add_responder_flows(dp, port)
+
+        # Unknown neighbor: drop the action set and let the controller resolve the MAC via ARP
+        inst = [
+            parser.OFPInstructionActions(ofp.OFPIT_CLEAR_ACTIONS, []),
+            parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, [
+                parser.OFPActionOutput(ofp.OFPP_CONTROLLER, ofp.OFPCML_NO_BUFFER)])
+        ]
+        self.flow_installer.add_msg(dp, parser.OFPFlowMod(
+            datapath=dp, table_id=self.ROUTER_NEIGHBOR_TABLE, priority=0,
+            match=parser.OFPMatch(), instructions=inst))
+
+        # Neighbors that are already known, e.g. after a reconnect of the router
+        for (ip, mac) in self.router_arp_table.items():
+            self._add_neighbor_flow(dp, ip, mac)
+
+    # ARP replies and ICMP echo replies for the gateway IP of a port, built in the switch
+    def _add_responder_flows(self, dp, port):
+        ofp = dp.ofproto
+        parser = dp.ofproto_parser
+        router_mac = self.router_port_to_own_mac[port]
+        router_ip = self.router_port_to_own_ip[port]
+
+        # Turn the request into a reply: Who-has router_ip? -> router_ip is-at router_mac
+        match = parser.OFPMatch(in_port=port, eth_type=ether_types.ETH_TYPE_ARP,
+                                arp_op=arp.ARP_REQUEST, arp_tpa=router_ip)
+        actions = [
+            parser.NXActionRegMove(src_field='eth_src', dst_field='eth_dst', n_bits=48),
+            parser.OFPActionSetField(eth_src=router_mac),
+            parser.OFPActionSetField(arp_op=arp.ARP_REPLY),
+            parser.NXActionRegMove(src_field='arp_sha', dst_field='arp_tha', n_bits=48),
+            parser.NXActionRegMove(src_field='arp_spa', dst_field='arp_tpa', n_bits=32),
+            parser.OFPActionSetField(arp_sha=router_mac),
+            parser.OFPActionSetField(arp_spa=router_ip),
+            parser.OFPActionOutput(ofp.OFPP_IN_PORT)
+        ]
+        self.add_flow(dp, self.RESPONDER_PRIORITY, match, actions)
+
+        # Echo request to the gateway -> echo reply, the switch updates the checksums
+        match = parser.OFPMatch(in_port=port, eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=router_ip,
+                                ip_proto=ipv4.inet.IPPROTO_ICMP, icmpv4_type=icmp.ICMP_ECHO_REQUEST)
+        actions = [
+            parser.NXActionRegMove(src_field='eth_src', dst_field='eth_dst', n_bits=48),
+            parser.OFPActionSetField(eth_src=router_mac),
+            parser.NXActionRegMove(src_field='ipv4_src', dst_field='ipv4_dst', n_bits=32),
+            parser.OFPActionSetField(ipv4_src=router_ip),
+            parser.OFPActionSetField(icmpv4_type=icmp.ICMP_ECHO_REPLY),
+            parser.OFPActionOutput(ofp.OFPP_IN_PORT)
+        ]
+        self.add_flow(dp, self.RESPONDER_PRIORITY, match, actions)
+
+    # Destination MAC of a host, the out_port comes from the subnet flow
+    def _add_neighbor_flow(self, dp, ip, mac):
+        parser = dp.ofproto_parser
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=ip)
+        actions = [parser.OFPActionSetField(eth_dst=mac)]
+        self._add_learned_flow(dp, 1, match, actions, table_id=self.ROUTER_NEIGHBOR_TABLE)
+        self.logger.info("Neighbor flow added to router: %s -> %s", ip, mac)
 
     # Add a flow entry to the flow-table
+    # The flow-mod is queued by the flow installer and sent with the next flush of the datapath
     # See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#ryu.ofproto.ofproto_v1_3_parser.OFPFlowMod
-    def add_flow(self, datapath, priority, match, actions):
-        ofproto = datapath.ofproto
+    def add_flow(self, datapath, priority, match, actions, **kwargs):
+        self.flow_installer.add_flow(datapath, priority, match, actions, **kwargs)
+
+    # Flows learned from packet-ins time out and report their removal
+    def _add_learned_flow(self, datapath, priority, match, actions, **kwargs):
+        self.add_flow(datapath, priority, match, actions,
+                      idle_timeout=self.FLOW_IDLE_TIMEOUT, hard_timeout=self.FLOW_HARD_TIMEOUT,
+                      flags=datapath.ofproto.OFPFF_SEND_FLOW_REM, **kwargs)
+
+    # Delete the flows matching match from all tables of the switch
+    def _delete_flows(self, datapath, match):
+        ofp = datapath.ofproto
         parser = datapath.ofproto_parser
+        mod = parser.OFPFlowMod(datapath=datapath, table_id=ofp.OFPTT_ALL, command=ofp.OFPFC_DELETE,
+                                out_port=ofp.OFPP_ANY, out_group=ofp.OFPG_ANY, match=match)
+        self.flow_installer.add_msg(datapath, mod)
+
+    # Delete all flows of a host that moved or was evicted from the MAC table
+    def _delete_host_flows(self, dp, mac):
+        parser = dp.ofproto_parser
+        self._delete_flows(dp, parser.OFPMatch(eth_dst=mac))
+        if self.switch_multi_table:
+            self._delete_flows(dp, parser.OFPMatch(eth_src=mac))
+        self.host_flows.get(dp.id, {}).pop(mac, None)
+        self.flow_installer.flush(dp)
+
+    # A host was evicted from the MAC table of a switch, a switch that disconnected has no flows to delete
+    def _evict_host(self, dp_id, mac):
+        dp = self.datapaths.get(dp_id)
+        if dp is not None:
+            self._delete_host_flows(dp, mac)
+
+    # A learned flow timed out (or was deleted), forget the host so it is learned again
+    # See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#flow-removed-message
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    @timed
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        dp = msg.datapath
+        ofp = dp.ofproto
+
+        if msg.reason == ofp.OFPRR_IDLE_TIMEOUT:
+            reason = 'IDLE TIMEOUT'
+        elif msg.reason == ofp.OFPRR_HARD_TIMEOUT:
+            reason = 'HARD TIMEOUT'
+        elif msg.reason == ofp.OFPRR_DELETE:
+            reason = 'DELETE'
+        else:
+            reason = 'unknown'
+        self.logger.debug("Flow removed from switch %d: reason=%s duration=%ds packets=%d match=%s",
+                          dp.id, reason, msg.duration_sec, msg.packet_count, msg.match)
+
+        if dp.id == self.router:
+            dst_ip = msg.match.get('ipv4_dst')
+            if dst_ip is not None and msg.reason != ofp.OFPRR_DELETE:
+                self.router_arp_table.pop(dst_ip)
+        elif self.switch_multi_table:
+            eth_src = msg.match.get('eth_src')
+            # The host went silent, its destination flow goes with the source flow
+            if eth_src is not None and msg.reason != ofp.OFPRR_DELETE and dp.id in self.mac_port_map:
+                self.mac_port_map[dp.id].pop(eth_src)
+                self._delete_flows(dp, dp.ofproto_parser.OFPMatch(eth_dst=eth_src))
+                self.flow_installer.flush(dp)
+        else:
+            eth_dst = msg.match.get('eth_dst')
+            # Flows deleted after a host move belong to the old port, the new entry stays.
+            # Otherwise the host is forgotten when its last flow timed out.
+            if eth_dst is not None and msg.reason != ofp.OFPRR_DELETE and dp.id in self.mac_port_map:
+                in_ports = self.host_flows.get(dp.id, {}).get(eth_dst, set())
+                in_ports.discard(msg.match.get('in_port'))
+                if not in_ports:
+                    self.host_flows.get(dp.id, {}).pop(eth_dst, None)
+                    self.mac_port_map[dp.id].pop(eth_dst)
+                if 'in_port' not in msg.match:
+                    # Aggregated flow, its hairpin guard goes with it
+                    self._delete_flows(dp, dp.ofproto_parser.OFPMatch(eth_dst=eth_dst))
+                    self.flow_installer.flush(dp)
+
+    # Flow-mods are confirmed by the barrier that closes each batch
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _barrier_reply_handler(self, ev):
+        self.flow_installer.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, DEAD_DISPATCHER)
+    def _state_change_handler(self, ev):
+        if ev.datapath.id is not None:
+            self.datapaths.pop(ev.datapath.id, None)
+            self.flow_table_occupancy.pop(ev.datapath.id, None)
+            self.mac_port_map.pop(ev.datapath.id, None)
+            self.host_flows.pop(ev.datapath.id, None)
+            self.packet_in_limiter.remove_datapath(ev.datapath.id)
+            self.packet_buffering.remove_datapath(ev.datapath.id)
+
+    # Ask all switches for their table statistics, the replies hold the number of active flows
+    # See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#table-statistics
+    def _table_stats_loop(self):
+        while True:
+            hub.sleep(self.TABLE_STATS_INTERVAL)
+            for datapath in list(self.datapaths.values()):
+                datapath.send_msg(datapath.ofproto_parser.OFPTableStatsRequest(datapath, 0))
+
+    @set_ev_cls(ofp_event.EventOFPTableStatsReply, MAIN_DISPATCHER)
+    def _table_stats_reply_handler(self, ev):
+        dp_id = ev.msg.datapath.id
+        occupancy = {stat.table_id: stat.active_count for stat in ev.msg.body if stat.active_count}
+        if occupancy != self.flow_table_occupancy.get(dp_id):
+            self.logger.info("Flow table occupancy of switch %d: %s flows (%s), %d hosts learned",
+                             dp_id, sum(occupancy.values()),
+                             ', '.join(f"table {table}: {count}" for table, count in sorted(occupancy.items())),
+                             len(self.mac_port_map.get(dp_id, ())))
+        self.flow_table_occupancy[dp_id] = occupancy
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        self.flow_installer.error(ev.msg)
+
+    # Packet-in rate limits, see common/packet_in_limiter.py
+    @set_ev_cls(ofp_event.EventOFPMeterFeaturesStatsReply, MAIN_DISPATCHER)
+    def _meter_features_reply_handler(self, ev):
+        self.packet_in_limiter.meter_features_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def _meter_stats_reply_handler(self, ev):
+        self.packet_in_limiter.meter_stats_reply(ev.msg)
 
-        # Construct flow_mod message and send it
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                match=match, instructions=inst)
-        datapath.send_msg(mod)
+    # Table sizes and the ARP buffer, read when the metrics are requested
+    def _collect_metrics(self):
+        samples = component_samples(self.flow_installer, self.packet_in_limiter, self.packet_buffering)
+        for dp_id, table in list(self.mac_port_map.items()):
+            samples.append(('mac_table_entries', 'gauge', {'dpid': dpid_label(dp_id)}, len(table)))
+        for dp_id, occupancy in list(self.flow_table_occupancy.items()):
+            for table_id, count in occupancy.items():
+                samples.append(('flow_table_entries', 'gauge', {'dpid': dpid_label(dp_id), 'table': table_id}, count))
+        samples.append(('arp_table_entries', 'gauge', {}, len(self.router_arp_table)))
+        samples.append(('arp_pending_packets', 'gauge', {}, len(self.arp_pending)))
+        samples.append(('arp_pending_destinations', 'gauge', {}, len(self.arp_pending.entries)))
+        for reason, count in self.arp_pending.drops.items():
+            samples.append(('arp_pending_dropped_total', 'counter', {'reason': reason}, count))
+        return samples
@@ -0,0 +1,163 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Compare the packet-in decoding and the reply generation of the controller
+# before and after the header fast path and the reply templates
+# Run with: python3 bench_packet_in.py [number of packets]
+
+import os
+import sys
+import time
+
+from ryu.lib.packet import packet, ethernet, ether_types, ipv4, arp, icmp, tcp
+from ryu.utils import hex_array
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from packet_headers import parse_headers, ReplyTemplates
+
+
+def build(*protocols):
+    pkt = packet.Packet()
+    for proto in protocols:
+        pkt.add_protocol(proto)
+    pkt.serialize()
+    return bytes(pkt.data)
+
+
+# Typical packet-ins of the lab network
+PACKETS = {
+    'arp request': build(
+        ethernet.ethernet(dst='ff:ff:ff:ff:ff:ff', src='00:00:00:00:00:01', ethertype=ether_types.ETH_TYPE_ARP),
+        arp.arp(opcode=arp.ARP_REQUEST, src_mac='00:00:00:00:00:01', src_ip='10.0.1.2',
+                dst_mac='00:00:00:00:00:00', dst_ip='10.0.1.1')),
+    'icmp echo': build(
+        ethernet.ethernet(dst='00:00:00:00:01:01', src='00:00:00:00:00:01'),
+        ipv4.ipv4(src='10.0.1.2', dst='10.0.2.2', proto=ipv4.inet.IPPROTO_ICMP),
+        icmp.icmp(data=icmp.echo(id_=1, seq=1, data=b'x' * 56))),
+    'tcp syn': build(
+        ethernet.ethernet(dst='00:00:00:00:01:01', src='00:00:00:00:00:01'),
+        ipv4.ipv4(src='10.0.1.2', dst='10.0.2.2', proto=ipv4.inet.IPPROTO_TCP),
+        tcp.tcp(src_port=40000, dst_port=5001, bits=tcp.TCP_SYN)),
+}
+
+
+# What the handlers did per packet-in before: format the debug dump and parse every protocol
+def decode_full(data):
+    hex_array(data)
+    pkt = packet.Packet(data)
+    eth = pkt.get_protocol(ethernet.ethernet)
+    if eth.ethertype == ether_types.ETH_TYPE_IP:
+        ip_pkt = pkt.get_protocol(ipv4.ipv4)
+        return eth.src, eth.dst, ip_pkt.src, ip_pkt.dst
+    elif eth.ethertype == ether_types.ETH_TYPE_ARP:
+        arp_pkt = pkt.get_protocol(arp.arp)
+        return eth.src, eth.dst, arp_pkt.src_ip, arp_pkt.dst_ip
+    return eth.src, eth.dst, None, None
+
+
+# What they do now: read the header fields from the buffer
+def decode_fast(data):
+    hdr = parse_headers(data)
+    if hdr.ethertype == ether_types.ETH_TYPE_IP:
+        return hdr.eth_src, hdr.eth_dst, hdr.ip_src, hdr.ip_dst
+    elif hdr.ethertype == ether_types.ETH_TYPE_ARP:
+        return hdr.eth_src, hdr.eth_dst, hdr.arp_src_ip, hdr.arp_dst_ip
+    return hdr.eth_src, hdr.eth_dst, None, None
+
+
+# Replies built from ryu packet objects, as the router did before
+def reply_full(data):
+    pkt = packet.Packet(data)
+    eth = pkt.get_protocol(ethernet.ethernet)
+    if eth.ethertype == ether_types.ETH_TYPE_ARP:
+        arp_pkt = pkt.get_protocol(arp.arp)
+        out_pkt = packet.Packet()
+        out_pkt.add_protocol(ethernet.ethernet(ethertype=ether_types.ETH_TYPE_ARP, dst=eth.src, src=ROUTER_MAC))
+        out_pkt.add_protocol(arp.arp(opcode=arp.ARP_REPLY, src_mac=ROUTER_MAC, src_ip=arp_pkt.dst_ip,
+                                     dst_mac=arp_pkt.src_mac, dst_ip=arp_pkt.src_ip))
+    else:
+        ip_pkt = pkt.get_protocol(ipv4.ipv4)
+        echo_req = pkt.get_protocol(icmp.icmp).data
+        out_pkt = packet.Packet()
+        out_pkt.add_protocol(ethernet.ethernet(dst=eth.src, src=eth.dst, ethertype=ether_types.ETH_TYPE_IP))
+        out_pkt.add_protocol(ipv4.ipv4(dst=ip_pkt.src, src=ip_pkt.dst, proto=ipv4.inet.IPPROTO_ICMP))
+        out_pkt.add_protocol(icmp.icmp(type_=icmp.ICMP_ECHO_REPLY, code=0, csum=0,
+                                       data=icmp.echo(id_=echo_req.id, seq=echo_req.seq, data=echo_req.data)))
+    out_pkt.serialize()
+    return out_pkt.data
+
+
+# ARP request of the router built from ryu packet objects, as before
+def request_full(dst_ip):
+    return build(
+        ethernet.ethernet(ethertype=ether_types.ETH_TYPE_ARP, dst='ff:ff:ff:ff:ff:ff', src=ROUTER_MAC),
+        arp.arp(opcode=arp.ARP_REQUEST, src_mac=ROUTER_MAC, dst_mac='ff:ff:ff:ff:ff:ff',
+                src_ip='10.0.1.1', dst_ip=dst_ip))
+
+
+# Replies patched into the pre-built frames of the router port
+def reply_fast(data):
+    hdr = parse_headers(data)
+    if hdr.ethertype == ether_types.ETH_TYPE_ARP:
+        return TEMPLATES.build_arp_reply(hdr.arp_src_mac, hdr.arp_src_ip)
+    return TEMPLATES.build_echo_reply(data, hdr)
+
+
+def measure(func, data, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func(data)
+    return count / (time.perf_counter() - start)
+
+
+ROUTER_MAC = '00:00:00:00:01:01'
+TEMPLATES = ReplyTemplates(ROUTER_MAC, '10.0.1.1')
+REQUESTS = {
+    'arp request': PACKETS['arp request'],
+    'icmp echo': build(
+        ethernet.ethernet(dst=ROUTER_MAC, src='00:00:00:00:00:01'),
+        ipv4.ipv4(src='10.0.1.2', dst='10.0.1.1', proto=ipv4.inet.IPPROTO_ICMP),
+        icmp.icmp(data=icmp.echo(id_=1, seq=1, data=b'x' * 56))),
+}
+
+
+def run(count):
+    print(f"{'packet':>12} {'full parse [pkt/s]':>19} {'fast path [pkt/s]':>18} {'speedup':>8}")
+    for name, data in PACKETS.items():
+        assert decode_full(data) == decode_fast(data)
+        full = measure(decode_full, data, count)
+        fast = measure(decode_fast, data, count)
+        print(f"{name:>12} {full:>19,.0f} {fast:>18,.0f} {fast / full:>7.1f}x")
+
+    print()
+    assert bytes(TEMPLATES.build_arp_request('10.0.1.3')) == request_full('10.0.1.3')
+    print(f"{'reply to':>12} {'ryu packet [pkt/s]':>19} {'template [pkt/s]':>18} {'speedup':>8}")
+    for name, data in REQUESTS.items():
+        assert bytes(reply_full(data)) == bytes(reply_fast(data))
+        full = measure(reply_full, data, count)
+        fast = measure(reply_fast, data, count)
+        print(f"{name:>12} {full:>19,.0f} {fast:>18,.0f} {fast / full:>7.1f}x")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,63 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+
+#!/usr/bin/env python3
+
+# Compare the fat-tree generators of topo.Fattree for growing k
+# Run with: python3 bench_topo.py [k ...]
+
+import sys
+import time
+
+from topo import Fattree
+
+
+def measure(func, repeat=3):
+    # Best of a few runs to filter out noise
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(ks):
+    print(f"{'k':>4} {'nodes':>8} {'objects [s]':>12} {'compact [s]':>12} "
+          f"{'vectorized [s]':>15} {'lazy view [s]':>14} {'speedup':>8} {'CSR [MB]':>9}")
+    for k in ks:
+        t_objects, _ = measure(lambda: Fattree(k))
+        t_compact, _ = measure(lambda: Fattree(k, compact=True))
+        t_vectorized, ft = measure(lambda: Fattree(k, vectorized=True))
+        # Time the on-demand object view separately, it is only built when a caller needs it
+        t_lazy, _ = measure(lambda: Fattree(k, vectorized=True).servers, repeat=1)
+        t_lazy -= t_vectorized
+        print(f"{k:>4} {len(ft.graph):>8} {t_objects:>12.4f} {t_compact:>12.4f} "
+              f"{t_vectorized:>15.4f} {t_lazy:>14.4f} {t_objects / t_vectorized:>7.1f}x "
+              f"{ft.graph.memory_size() / 1e6:>9.2f}")
+
+
+if __name__ == '__main__':
+    ks = [int(arg) for arg in sys.argv[1:]] or [4, 8, 16, 24, 32, 48, 64]
+    run(ks)
@@ -0,0 +1,188 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Fast bring-up of large Mininet networks
+#
+# Mininet creates every veth pair, brings up every interface and configures every host
+# with separate shell commands, one after the other, so a k=8 fat-tree needs thousands of
+# round trips before the first switch starts. FastMininet creates all veth pairs with one
+# `ip -batch` run, configures every host with a single command while all hosts run theirs
+# in parallel, starts the OVS switches with one batched ovs-vsctl call and then waits until
+# all switches are connected to the controller. The time of every phase is recorded.
+# Only plain links are supported, TCLink parameters would need tc commands per interface.
+
+import subprocess
+import time
+from contextlib import contextmanager
+from logging import WARNING
+
+from mininet.link import Intf, Link
+from mininet.log import error, info, lg
+from mininet.net import Mininet
+
+
+class BatchIntf(Intf):
+    """
+    Interface that does not configure itself, FastMininet brings it up with all others
+    """
+
+    def config(self, mac=None, ip=None, ifconfig=None, up=True, **_params):
+        return {}
+
+
+class BatchLink(Link):
+    """
+    veth link whose pair is created by FastMininet.create_links together with all others
+    """
+
+    def __init__(self, node1, node2, **params):
+        params['intf'] = BatchIntf
+        params['fast'] = True
+        Link.__init__(self, node1, node2, **params)
+
+    @classmethod
+    def makeIntfPair(cls, intfname1, intfname2, addr1=None, addr2=None,
+                     node1=None, node2=None, deleteIntfs=True):
+        pass
+
+
+@contextmanager
+def quiet():
+    # Mininet logs every node and link it adds
+    level = lg.getEffectiveLevel()
+    lg.setLevel(WARNING)
+    try:
+        yield
+    finally:
+        lg.setLevel(level)
+
+
+class FastMininet(Mininet):
+
+    # Seconds to wait for the switches to connect when the network starts
+    CONNECT_TIMEOUT = 60
+
+    def __init__(self, *args, **kwargs):
+        self.timings = [] # [(phase, seconds)]
+        kwargs['link'] = BatchLink
+        kwargs['intf'] = BatchIntf
+        Mininet.__init__(self, *args, **kwargs)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        yield
+        self.timings.append((name, time.perf_counter() - start))
+
+    def build(self):
+        if self.inNamespace:
+            raise Exception('FastMininet does not support a control network in a namespace')
+        info(f"*** Creating network: {len(self.topo.hosts())} hosts, {len(self.topo.switches())} switches, "
+             f"{len(self.topo.links())} links\n")
+        with self.phase('nodes'), quiet():
+            self.buildFromTopo(self.topo)
+        with self.phase('links'):
+            self.create_links()
+        with self.phase('hosts'):
+            self.configHosts()
+        if self.autoStaticArp:
+            with self.phase('static arp'), quiet():
+                self.staticArp()
+        self.built = True
+
+    # All veth pairs are created straight in the namespaces of their nodes (pid 1 is the root
+    # namespace of the switches), the switch ports are brought up in the same run
+    def create_links(self):
+        intfs = [intf for link in self.links for intf in (link.intf1, link.intf2)]
+        lines = []
+        for link in self.links:
+            ends = [f"name {intf.name} address {intf.mac} netns {intf.node.pid if intf.node.inNamespace else 1}"
+                    for intf in (link.intf1, link.intf2)]
+            lines.append(f"link add {ends[0]} type veth peer {ends[1]}")
+        lines += [f"link set dev {intf.name} up" for intf in intfs if not intf.node.inNamespace]
+        result = subprocess.run(['ip', '-batch', '-'], input='\n'.join(lines) + '\n',
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        if result.returncode:
+            raise Exception(f"Error creating the links: {result.stdout}")
+
+    # What Node.config does with one command per setting, as a single command line
+    def host_config(self, host):
+        params = host.params
+        cmds = ['ip link set dev lo up']
+        default = host.defaultIntf()
+        for intf in host.intfList():
+            if intf is default:
+                if params.get('mac'):
+                    intf.mac = params['mac']
+                    cmds.append(f"ip link set dev {intf} address {intf.mac}")
+                if params.get('ip'):
+                    ip, _, prefix_len = params['ip'].partition('/')
+                    intf.ip, intf.prefixLen = ip, int(prefix_len or 8)
+                    cmds.append(f"ip addr add {ip}/{intf.prefixLen} dev {intf}")
+            cmds.append(f"ip link set dev {intf} up")
+        route = params.get('defaultRoute')
+        if route:
+            cmds.append(f"ip route add default {route if ' ' in str(route) else f'dev {route}'}")
+        return '; '.join(cmds)
+
+    # The commands of all hosts are sent first and run in parallel, then collected
+    def configHosts(self):
+        for host in self.hosts:
+            host.sendCmd(self.host_config(host))
+        for host in self.hosts:
+            output = host.waitOutput()
+            if output.strip():
+                error(f"Error configuring {host}: {output}")
+
+    def start(self):
+        if not self.built:
+            self.build()
+        wait = self.waitConn
+        self.waitConn = False
+        # Mininet already starts all OVS switches with one batched ovs-vsctl call
+        with self.phase('switches'), quiet():
+            Mininet.start(self)
+        self.waitConn = wait
+        if wait and self.controllers:
+            with self.phase('controller connection'):
+                self.waitConnected(self.CONNECT_TIMEOUT)
+
+    # One ovs-vsctl call for all switches, Mininet asks every switch separately
+    def waitConnected(self, timeout=None, delay=.1):
+        expected = len(self.switches) * len(self.controllers)
+        start = time.perf_counter()
+        while True:
+            result = subprocess.run(['ovs-vsctl', '--columns=is_connected', '--format=csv', '--no-headings',
+                                     'list', 'Controller'], stdout=subprocess.PIPE, universal_newlines=True)
+            connected = result.stdout.split().count('true')
+            if connected >= expected:
+                return True
+            if timeout is not None and time.perf_counter() - start > timeout:
+                error(f"Timed out after {timeout} s, {connected} of {expected} controller connections are up\n")
+                return False
+            time.sleep(delay)
+
+    def report(self):
+        total = sum(seconds for _, seconds in self.timings)
+        info('*** Startup time: ' + ', '.join(f"{name} {seconds:.2f} s" for name, seconds in self.timings) +
+             f", total {total:.2f} s\n")
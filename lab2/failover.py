@@ -0,0 +1,99 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+#!/usr/bin/env python3
+
+# Link state and fast-failover groups shared by the routing apps of the fat-tree.
+# See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#ryu.ofproto.ofproto_v1_3_parser.OFPGroupMod
+
+from collections import deque
+
+
+class SwitchGraph:
+    """
+    Switch-to-switch links of a Fattree (from its port map) and which of them are down
+
+    A link is down as soon as one of its two ports is reported down, distances
+    and neighbors only consider links that are up.
+    """
+
+    def __init__(self, ft_topo):
+        index = ft_topo.index
+        self.adjacency = {} # {dpid: {port: (neighbor_dpid, neighbor_port)}}
+        self.hosts = {} # {host_ip: (dpid, port)}
+        self.down = set() # {(dpid, port)} of links that are down, both ends
+        for lnode, lport, rnode, rport in ft_topo.port_map.links:
+            left = index.get_by_id(lnode)
+            right = index.get_by_id(rnode)
+            if left.type == 'server':
+                self.hosts[left.ip] = (right.dpid, rport)
+                continue
+            self.adjacency.setdefault(left.dpid, {})[lport] = (right.dpid, rport)
+            self.adjacency.setdefault(right.dpid, {})[rport] = (left.dpid, lport)
+
+    # (neighbor_dpid, neighbor_port) behind a switch port, None for host ports
+    def get_neighbor(self, dpid, port):
+        return self.adjacency.get(dpid, {}).get(port)
+
+    def is_up(self, dpid, port):
+        return (dpid, port) not in self.down
+
+    # Mark the link behind a port down, returns the far end (neighbor_dpid, neighbor_port)
+    # or None if the port is no switch link or the link already was down
+    def link_down(self, dpid, port):
+        neighbor = self.get_neighbor(dpid, port)
+        if neighbor is None or (dpid, port) in self.down:
+            return None
+        self.down.add((dpid, port))
+        self.down.add(neighbor)
+        return neighbor
+
+    def link_up(self, dpid, port):
+        neighbor = self.get_neighbor(dpid, port)
+        if neighbor is None or (dpid, port) not in self.down:
+            return None
+        self.down.discard((dpid, port))
+        self.down.discard(neighbor)
+        return neighbor
+
+    # Hops from every switch to dst_dpid over links that are up
+    def distances_to(self, dst_dpid):
+        distances = {dst_dpid: 0}
+        queue = deque([dst_dpid])
+        while queue:
+            node = queue.popleft()
+            for port, (neighbor, _) in self.adjacency[node].items():
+                if neighbor not in distances and (node, port) not in self.down:
+                    distances[neighbor] = distances[node] + 1
+                    queue.append(neighbor)
+        return distances
+
+
+# Group whose first live bucket forwards the packets, the switch falls over to the next
+# port as soon as a watched port goes down, without asking the controller
+def failover_group_mod(datapath, group_id, ports, command=None):
+    ofproto = datapath.ofproto
+    parser = datapath.ofproto_parser
+    buckets = [parser.OFPBucket(watch_port=port, watch_group=ofproto.OFPG_ANY,
+                                actions=[parser.OFPActionOutput(port)])
+               for port in ports]
+    return parser.OFPGroupMod(datapath, command=ofproto.OFPGC_ADD if command is None else command,
+                              type_=ofproto.OFPGT_FF, group_id=group_id, buckets=buckets)
@@ -35,6 +35,7 @@ from mininet.node import Node, OVSKernelSwitch, RemoteController
 from mininet.topo import Topo
 from mininet.util import waitListening, custom
 
+from bringup import FastMininet
 from topo import Fattree
 
 
@@ -43,65 +44,48 @@ class FattreeNet(Topo):
     Create a fat-tree network in Mininet
     """
 
-    def __init__(self, ft_topo):
+    def __init__(self, ft_topo, bw=None):
 
         Topo.__init__(self)
 		# topology idea: [upperlayer_switches_pod1, lower_layer_switches_pod1, ...,upperlayer_switches_podk, lower_layer_switches_podk, core_switches] for number of switches in pod
         switches = ft_topo.switches
         servers = ft_topo.servers
-        for switch in switches:
-            print(f"Adding switch {switch.id} with dpid {switch.id}")
-        
-        for server in servers:
-            print(f"Adding server {server.id} with dpid {server.id}")
-            #{server.dpid}")
+        index = ft_topo.index
 
         for switch in switches:
-            if switch.type == 'core_level_switch':
-                id = switch.id
-                pod_id = id[3]
-                switch_id = id[5]
-                num_id = id[7]
-                ip = f"10.{pod_id}.{switch_id}.{num_id}/24"
-                s = self.addSwitch(switch.id)
-                #s.cmd('ifconfig %s 10.0.0.100/24', switch.id)
-            else:
-                # pod switches
-                id = switch.id
-                pod_id = id[3]
-                switch_id = id[5]
-                num_id = id[7]
-                ip = f"10.{pod_id}.{switch_id}.{num_id}/24"
-                s = self.addSwitch(switch.id)
-
-        hosts = []
+            # Mininet would derive the dpid from the digits in the name, which is not unique
+            # (usp0s2n1 and lsp0s2n1), so the dpid is derived from the switch address instead
+            self.addSwitch(switch.id, dpid='%016x' % index.get_by_id(switch.id).dpid)
+
         for server in servers:
-            id = server.id
-            # Extracting the pod, switch, and host IDs from the server ID
-            # A bit primitive, but works for the given format for the moment 
-            # TODO: Make it a bit prettier :D --> Shit, the names from topo are allowed to be named after "pod_switch_host" with lower bindings...
-            pod_id = id[4]
-            switch_id = id[6]
-            host_id = id[8]
-            new_ip = f"10.{pod_id}.{switch_id}.{host_id}/24" 
-            # TODO: Default Route???
-            hosts.append(self.addHost(server.id, ip=new_ip, defaultRoute='via 10.0.1.1'))
-            
-        for host, server in zip(hosts, servers):
-            # create links of hosts
-            pass
-        # TODO: Verbindungen zwischen den Switches und Hosts erstellen
-        # TODO: Richtige Ip-Adressen und Subnetze für die Hosts setzen und berechenn
-        # TODO: please complete the network generation logic here
-
-
-
-def make_mininet_instance(graph_topo):
-
-    net_topo = FattreeNet(graph_topo)
-    net = Mininet(topo=net_topo, controller=None, autoSetMacs=True)
+            # All servers share 10.0.0.0/8, forwarding is done by the two-level routing tables.
+            # The MAC is derived from the address, so the controllers can resolve it without ARP.
+            address = index.get_by_id(server.id)
+            self.addHost(server.id, ip=f"{address.ip}/8", mac=address.mac)
+
+        # Links are created in the order of the port map of the topology and with its port
+        # numbers, so the controllers can install forwarding state without LLDP discovery.
+        # bw [Mbit/s] limits every link, it needs TCLink links
+        link_opts = {'bw': bw} if bw else {}
+        for lnode, lport, rnode, rport in ft_topo.port_map.links:
+            self.addLink(lnode, rnode, port1=lport, port2=rport, **link_opts)
+
+
+
+# fast creates the links and configures the hosts in batches (see bringup.py) and waits
+# until all switches are connected to the controller. Links limited to bw Mbit/s are
+# TCLinks, which the batched bring-up does not support.
+def make_mininet_instance(graph_topo, fast=True, controller_ip="127.0.0.1", controller_port=6653, bw=None):
+
+    net_topo = FattreeNet(graph_topo, bw=bw)
+    if bw:
+        net = Mininet(topo=net_topo, controller=None, autoSetMacs=True, link=TCLink)
+    elif fast:
+        net = FastMininet(topo=net_topo, controller=None, autoSetMacs=True, build=False, waitConnected=True)
+    else:
+        net = Mininet(topo=net_topo, controller=None, autoSetMacs=True)
     net.addController('c0', controller=RemoteController,
-                      ip="127.0.0.1", port=6653)
+                      ip=controller_ip, port=controller_port)
     return net
 
 
@@ -109,11 +93,15 @@ def run(graph_topo):
 
     # Run the Mininet CLI with a given topology
     lg.setLogLevel('info')
+    start = time.perf_counter()
     mininet.clean.cleanup()
+    cleanup_time = time.perf_counter() - start
     net = make_mininet_instance(graph_topo)
 
     info('*** Starting network ***\n')
     net.start()
+    net.timings.insert(0, ('cleanup', cleanup_time))
+    net.report()
     info('*** Running CLI ***\n')
     CLI(net)
     info('*** Stopping network ***\n')
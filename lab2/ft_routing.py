@@ -31,62 +31,357 @@ from ryu.lib.mac import haddr_to_bin
 from ryu.lib.packet import packet
 from ryu.lib.packet import ipv4
 from ryu.lib.packet import arp
+from ryu.lib.packet import ether_types
 
 from ryu.topology import event, switches
-from ryu.topology.api import get_switch, get_link
-from ryu.app.wsgi import ControllerBase
+from ryu.app.wsgi import WSGIApplication
+
+import os
+import socket
+import sys
+import time
+
+# Shared controller components are in common/ at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from flow_installer import FlowInstaller
+from packet_in_limiter import PacketInLimiter
+from packet_buffering import PacketBuffering
+from controller_metrics import ControllerMetrics, component_samples, dpid_label, timed
 
 import topo
+from failover import SwitchGraph, failover_group_mod
+
+
+# Priorities of the two-level lookup: terminating prefixes win over the suffix table
+PREFIX_PRIORITY = 20
+SUFFIX_PRIORITY = 10
+# Host routes around failed links win over both
+REPAIR_PRIORITY = 30
+
+
+class TwoLevelRoutingTables:
+    """
+    Two-level prefix/suffix routing tables of Al-Fares et al. for every switch of a Fattree
+
+    The tables name the next node, the output ports are taken from the port map of the topology.
+    """
+
+    def __init__(self, ft_topo):
+        self.k = ft_topo.num_ports
+        self.index = ft_topo.index
+        self.port_map = ft_topo.port_map
+        self.tables = {} # {dpid: [(priority, ipv4_dst, out_port)]}, ipv4_dst as (address, mask)
+        self.uplinks = {} # {dpid: [out_port]}, ports to the next higher layer by uplink number
+        for address in self.index.by_dpid.values():
+            self.tables[address.dpid] = self._compute_table(address)
+        # Entries as integers for lookup(), in the order the switch matches them
+        self._lookup = {dpid: sorted(((priority, _to_int(mask), _to_int(addr), out_port)
+                                      for priority, (addr, mask), out_port in table), reverse=True)
+                        for dpid, table in self.tables.items()}
+
+    def _port_to(self, address, pod, switch, host):
+        return self.port_map.get_port(address.id, self.index.get_by_coords(pod, switch, host).id)
+
+    def _compute_table(self, address):
+        half = self.k // 2
+        pod, sw = address.pod, address.switch
+        host_ids = range(2, half + 2)
+        table = []
+
+        if address.type == 'core_level_switch':
+            # One /16 prefix per pod, core switch 10.k.j.i connects to upper layer switch k/2+j-1 of every pod
+            for p in range(self.k):
+                out_port = self._port_to(address, p, half + sw - 1, 1)
+                table.append((PREFIX_PRIORITY, (f'10.{p}.0.0', '255.255.0.0'), out_port))
+            return table
+
+        if address.type == 'lower_level_switch':
+            # Terminating /32 prefixes for the directly connected servers
+            for host_id in host_ids:
+                out_port = self._port_to(address, pod, sw, host_id)
+                table.append((PREFIX_PRIORITY, (f'10.{pod}.{sw}.{host_id}', '255.255.255.255'), out_port))
+        else:
+            # Terminating /24 prefixes for the subnets of the lower layer switches in the pod
+            for subnet in range(half):
+                out_port = self._port_to(address, pod, subnet, 1)
+                table.append((PREFIX_PRIORITY, (f'10.{pod}.{subnet}.0', '255.255.255.0'), out_port))
+
+        if address.type == 'lower_level_switch':
+            uplinks = [self._port_to(address, pod, half + uplink, 1) for uplink in range(half)]
+        else:
+            # upper layer switch k/2+a connects to core switches 10.k.(a+1).*
+            uplinks = [self._port_to(address, self.k, sw - half + 1, uplink + 1) for uplink in range(half)]
+        self.uplinks[address.dpid] = uplinks
+
+        # Suffix table spreads upward traffic by the host id of the destination:
+        # host id x leaves on uplink (x - 2 + sw) mod k/2
+        for host_id in host_ids:
+            uplink = (host_id - 2 + sw) % half
+            table.append((SUFFIX_PRIORITY, (f'0.0.0.{host_id}', '0.0.0.255'), uplinks[uplink]))
+        return table
+
+    def get_table(self, dpid):
+        return self.tables.get(dpid, [])
+
+    def get_uplinks(self, dpid):
+        return self.uplinks.get(dpid, [])
+
+    # Output port the table of a switch selects for a destination IP, None if no entry matches
+    def lookup(self, dpid, ip):
+        ip = _to_int(ip)
+        for _, mask, addr, out_port in self._lookup.get(dpid, []):
+            if ip & mask == addr:
+                return out_port
+        return None
+
+
+def _to_int(ip):
+    return int.from_bytes(socket.inet_aton(ip), 'big')
 
 
 class FTRouter(app_manager.RyuApp):
 
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _CONTEXTS = {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super(FTRouter, self).__init__(*args, **kwargs)
+
+        # Counters and handler latencies, served on http://<controller>:8080/metrics
+        self.metrics = ControllerMetrics()
+        self.metrics.add_collector(self._collect_metrics)
+        self.metrics.serve(kwargs['wsgi'])
         
         # Initialize the topology with #ports=4
         self.topo_net = topo.Fattree(4)
 
-    # Topology discovery
-    @set_ev_cls(event.EventSwitchEnter)
-    def get_topology_data(self, ev):
+        # Precompute the routing tables of all switches, they are installed proactively
+        self.routing_tables = TwoLevelRoutingTables(self.topo_net)
+
+        # Uplinks fail over in the switch through fast-failover groups, routes that
+        # cannot be saved locally are repaired with host routes around the failed link
+        self.graph = SwitchGraph(self.topo_net)
+        self.repairs = {} # {(dpid, host_ip): out_port}
+        self.datapaths = {} # {dpid: datapath}
+
+        # Flow-mods are queued per switch and sent in batches closed by a barrier
+        self.flow_installer = FlowInstaller(self.logger)
+
+        # Table misses are metered in the switch and limited per source MAC in the controller,
+        # budgets={dpid: (packets/s, burst)} overrides the packet-in budget of single switches
+        self.packet_in_limiter = PacketInLimiter(self.logger, self.flow_installer)
+
+        # With miss_send_len=128 the switches buffer table misses and only send the headers,
+        # which is all the controller needs to drop them. None sends full frames.
+        self.packet_buffering = PacketBuffering(self.logger, self.packet_in_limiter, miss_send_len=None)
 
-        # Switches and links in the network
-        switches = get_switch(self, None)
-        links = get_link(self, None)
+    # Forwarding only relies on the port map of the topology. If LLDP discovery is
+    # enabled (ryu-manager --observe-links), discovered links are checked against it.
+    @set_ev_cls(event.EventLinkAdd)
+    @timed
+    def _link_add_handler(self, ev):
+        src, dst = ev.link.src, ev.link.dst
+        src_node = self.topo_net.index.get_by_dpid(src.dpid)
+        dst_node = self.topo_net.index.get_by_dpid(dst.dpid)
+        if src_node is None or dst_node is None or \
+                not self.topo_net.port_map.matches(src_node.id, src.port_no, dst_node.id):
+            self.logger.warning("Discovered link %016x:%d -> %016x does not match the port map",
+                                src.dpid, src.port_no, dst.dpid)
+            return
+        self._link_changed(src.dpid, src.port_no, up=True)
+
+    @set_ev_cls(event.EventLinkDelete)
+    @timed
+    def _link_delete_handler(self, ev):
+        self._link_changed(ev.link.src.dpid, ev.link.src.port_no, up=False)
+
+    # Port state changes are reported by the switch itself, faster than LLDP notices them
+    # See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#port-status-message
+    @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
+    @timed
+    def _port_status_handler(self, ev):
+        msg = ev.msg
+        ofproto = msg.datapath.ofproto
+        up = msg.reason != ofproto.OFPPR_DELETE and not msg.desc.state & ofproto.OFPPS_LINK_DOWN
+        self._link_changed(msg.datapath.id, msg.desc.port_no, up)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    @timed
     def switch_features_handler(self, ev):
         datapath = ev.msg.datapath
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
+        self.datapaths[datapath.id] = datapath
+
+        # One fast-failover group per uplink, it falls back to the following uplinks in turn.
+        # Groups left over from an earlier connection are deleted first.
+        self.flow_installer.add_msg(datapath, parser.OFPGroupMod(
+            datapath, command=ofproto.OFPGC_DELETE, type_=ofproto.OFPGT_FF, group_id=ofproto.OFPG_ALL))
+        uplinks = self.routing_tables.get_uplinks(datapath.id)
+        uplink_groups = {}
+        for i, port in enumerate(uplinks):
+            uplink_groups[port] = i + 1
+            self.flow_installer.add_msg(datapath, failover_group_mod(datapath, i + 1, uplinks[i:] + uplinks[:i]))
+
         # Install entry-miss flow entry
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, match, actions)
+        self.packet_buffering.install_miss_flow(datapath)
 
-    # Add a flow entry to the flow-table
-    def add_flow(self, datapath, priority, match, actions):
+        # Install the two-level routing table of the switch, IPv4 packets are routed on
+        # ipv4_dst and ARP packets on arp_tpa, so ARP never reaches the controller either
+        table = self.routing_tables.get_table(datapath.id)
+        for priority, dst, out_port in table:
+            if out_port in uplink_groups:
+                actions = [parser.OFPActionGroup(uplink_groups[out_port])]
+            else:
+                actions = [parser.OFPActionOutput(out_port)]
+            match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=dst)
+            self.add_flow(datapath, priority, match, actions)
+            match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_ARP, arp_tpa=dst)
+            self.add_flow(datapath, priority, match, actions)
+
+        # Repairs that are still needed after a reconnect
+        for (dpid, host_ip), out_port in self.repairs.items():
+            if dpid == datapath.id:
+                self._add_repair_flows(datapath, host_ip, out_port)
+        self.flow_installer.flush(datapath)
+        self.logger.info("Installed %d routing entries on switch %016x", len(table), datapath.id)
+
+    # Output port a switch uses for a host without repairs: the routing table entry,
+    # or the first live uplink of its fast-failover group
+    def _table_next_hop(self, dpid, host_ip):
+        out_port = self.routing_tables.lookup(dpid, host_ip)
+        uplinks = self.routing_tables.get_uplinks(dpid)
+        if out_port in uplinks:
+            i = uplinks.index(out_port)
+            for port in uplinks[i:] + uplinks[:i]:
+                if self.graph.is_up(dpid, port):
+                    return port
+        return out_port
+
+    def _next_hop(self, dpid, host_ip):
+        out_port = self.repairs.get((dpid, host_ip))
+        return out_port if out_port is not None else self._table_next_hop(dpid, host_ip)
+
+    # Only the hosts whose routes cross the changed link are repaired
+    def _link_changed(self, dpid, port, up):
+        neighbor = self.graph.get_neighbor(dpid, port)
+        if neighbor is None or self.graph.is_up(dpid, port) == up:
+            return
+        start = time.time()
+        if up:
+            self.graph.link_up(dpid, port)
+            # Repairs may not be needed anymore
+            hosts = {host_ip for (_, host_ip) in self.repairs}
+        else:
+            hosts = [host_ip for host_ip in self.graph.hosts
+                     if self._next_hop(dpid, host_ip) == port or self._next_hop(neighbor[0], host_ip) == neighbor[1]]
+            self.graph.link_down(dpid, port)
+
+        changed = set()
+        for host_ip in hosts:
+            changed |= self._repair_host(host_ip)
+        for changed_dpid in changed:
+            self.flow_installer.flush(self.datapaths[changed_dpid])
+        self.logger.info("Link %016x:%d %s: %d routes repaired on %d switches in %.1f ms",
+                         dpid, port, 'up' if up else 'down', len(hosts), len(changed), (time.time() - start) * 1000)
+
+    # Every switch must forward towards the host to a neighbor that is closer to it,
+    # otherwise a host route to the closest live neighbor is installed.
+    # Returns the dpids whose flows changed.
+    def _repair_host(self, host_ip):
+        dst_dpid, _ = self.graph.hosts[host_ip]
+        distances = self.graph.distances_to(dst_dpid)
+        changed = set()
+        for dpid, ports in self.graph.adjacency.items():
+            if dpid == dst_dpid:
+                continue
+            dist = distances.get(dpid)
+            repair = None
+            out_port = self._table_next_hop(dpid, host_ip)
+            neighbor = self.graph.get_neighbor(dpid, out_port)
+            if dist is not None and (neighbor is None or not self.graph.is_up(dpid, out_port) or
+                                     distances.get(neighbor[0], dist) >= dist):
+                closer = [(distances[n], port) for port, (n, _) in ports.items()
+                          if self.graph.is_up(dpid, port) and distances.get(n, dist) < dist]
+                repair = min(closer)[1] if closer else None
+
+            old = self.repairs.get((dpid, host_ip))
+            if repair == old:
+                continue
+            datapath = self.datapaths.get(dpid)
+            if old is not None:
+                del self.repairs[(dpid, host_ip)]
+                if datapath is not None:
+                    self._delete_repair_flows(datapath, host_ip)
+            if repair is not None:
+                self.repairs[(dpid, host_ip)] = repair
+                if datapath is not None:
+                    self._add_repair_flows(datapath, host_ip, repair)
+            if datapath is not None:
+                changed.add(dpid)
+        return changed
+
+    def _add_repair_flows(self, datapath, host_ip, out_port):
+        parser = datapath.ofproto_parser
+        actions = [parser.OFPActionOutput(out_port)]
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=host_ip)
+        self.add_flow(datapath, REPAIR_PRIORITY, match, actions)
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_ARP, arp_tpa=host_ip)
+        self.add_flow(datapath, REPAIR_PRIORITY, match, actions)
+
+    def _delete_repair_flows(self, datapath, host_ip):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
+        for match in (parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=host_ip),
+                      parser.OFPMatch(eth_type=ether_types.ETH_TYPE_ARP, arp_tpa=host_ip)):
+            self.flow_installer.add_msg(datapath, parser.OFPFlowMod(
+                datapath=datapath, command=ofproto.OFPFC_DELETE_STRICT, priority=REPAIR_PRIORITY,
+                out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY, match=match))
+
+    # Add a flow entry to the flow-table, it is sent with the next flush of the datapath
+    def add_flow(self, datapath, priority, match, actions):
+        self.flow_installer.add_flow(datapath, priority, match, actions)
 
-        # Construct flow_mod message and send it
-        inst = [parser.OFPInstructionActions(
-            ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                match=match, instructions=inst)
-        datapath.send_msg(mod)
+    # Flow-mods are confirmed by the barrier that closes each batch
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _barrier_reply_handler(self, ev):
+        self.flow_installer.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        self.flow_installer.error(ev.msg)
+
+    # Packet-in rate limits, see common/packet_in_limiter.py
+    @set_ev_cls(ofp_event.EventOFPMeterFeaturesStatsReply, MAIN_DISPATCHER)
+    def _meter_features_reply_handler(self, ev):
+        self.packet_in_limiter.meter_features_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def _meter_stats_reply_handler(self, ev):
+        self.packet_in_limiter.meter_stats_reply(ev.msg)
+
+    # Routing table sizes and repairs, read when the metrics are requested
+    def _collect_metrics(self):
+        samples = component_samples(self.flow_installer, self.packet_in_limiter, self.packet_buffering)
+        for dpid in list(self.datapaths):
+            samples.append(('routing_table_entries', 'gauge', {'dpid': dpid_label(dpid)},
+                            len(self.routing_tables.get_table(dpid))))
+        repairs = {}
+        for dpid, _ in list(self.repairs):
+            repairs[dpid] = repairs.get(dpid, 0) + 1
+        for dpid, count in repairs.items():
+            samples.append(('repair_routes', 'gauge', {'dpid': dpid_label(dpid)}, count))
+        return samples
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @timed
     def _packet_in_handler(self, ev):
+        self.metrics.packet_in(ev)
         msg = ev.msg
-        datapath = msg.datapath
-        dpid = datapath.id
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
+        if not (self.packet_buffering.packet_in(msg) and self.packet_in_limiter.allow(msg)):
+            return
 
-        # TODO: handle new packets at the controller
\ No newline at end of file
+        # All IPv4 and ARP traffic is forwarded by the proactive routing tables,
+        # only unsupported traffic (e.g. IPv6 neighbor discovery) ends up here and is dropped
+        self.logger.debug("Dropping unmatched packet on switch %016x port %d", msg.datapath.id, msg.match['in_port'])
\ No newline at end of file
@@ -22,6 +22,10 @@
 
 #!/usr/bin/env python3
 
+# Start the controller with: ryu-manager --observe-links sp_routing.py
+
+from collections import deque
+
 from ryu.base import app_manager
 from ryu.controller import mac_to_port
 from ryu.controller import ofp_event
@@ -30,66 +34,625 @@ from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
 from ryu.lib.mac import haddr_to_bin
 from ryu.lib.packet import packet
+from ryu.lib.packet import ethernet
+from ryu.lib.packet import ether_types
 from ryu.lib.packet import ipv4
 from ryu.lib.packet import arp
 
 from ryu.topology import event, switches
-from ryu.topology.api import get_switch, get_link
-from ryu.app.wsgi import ControllerBase
+from ryu.app.wsgi import WSGIApplication
+
+import os
+import sys
+import time
+
+# Shared controller components are in common/ at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from flow_installer import FlowInstaller
+from packet_in_limiter import PacketInLimiter
+from packet_buffering import PacketBuffering
+from controller_metrics import ControllerMetrics, component_samples, dpid_label, timed
+from traffic_monitor import TrafficMonitor
 
 import topo
+from failover import SwitchGraph, failover_group_mod
+
+
+class ShortestPathCache:
+    """
+    All-pairs next-hop table over the switch graph, updated incrementally
+
+    Every topology change only recomputes the BFS trees of the sources whose
+    shortest paths can be affected by the change, so lookups from the
+    packet-in handler are plain dictionary hits.
+    """
+
+    def __init__(self):
+        self.adjacency = {} # {dpid: {neighbor_dpid: out_port}}
+        self.distances = {} # {src_dpid: {dst_dpid: hops}}
+        self.next_hops = {} # {src_dpid: {dst_dpid: (out_port, next_dpid)}}
+        self.ecmp_hops = {} # {src_dpid: {dst_dpid: ((out_port, next_dpid), ...)}}, all equal-cost first hops
+
+    def add_switch(self, dpid):
+        if dpid in self.adjacency:
+            return
+        self.adjacency[dpid] = {}
+        self._recompute([dpid])
+
+    def remove_switch(self, dpid):
+        if dpid not in self.adjacency:
+            return
+        for neighbor in list(self.adjacency[dpid]):
+            self.remove_link(dpid, neighbor)
+        for src in list(self.adjacency):
+            if dpid in self.adjacency[src]:
+                self.remove_link(src, dpid)
+        del self.adjacency[dpid]
+        del self.distances[dpid]
+        del self.next_hops[dpid]
+        del self.ecmp_hops[dpid]
+
+    # Add many directed links (src, src_port, dst) at once and recompute all sources a single time
+    def load_links(self, links):
+        for src, src_port, dst in links:
+            self.adjacency.setdefault(src, {})
+            self.adjacency.setdefault(dst, {})
+            self.adjacency[src][dst] = src_port
+        self._recompute(list(self.adjacency))
+
+    # Links are directed, ryu reports one link per direction.
+    # add_link() and remove_link() return the sources whose paths were recomputed.
+    def add_link(self, src, src_port, dst):
+        self.add_switch(src)
+        self.add_switch(dst)
+        if self.adjacency[src].get(dst) == src_port:
+            return []
+        self.adjacency[src][dst] = src_port
+
+        # Only sources that reach dst at least as fast through the new link can change
+        affected = [s for s, dist in self.distances.items()
+                    if src in dist and (dst not in dist or dist[src] + 1 <= dist[dst])]
+        self._recompute(affected)
+        return affected
+
+    def remove_link(self, src, dst):
+        if dst not in self.adjacency.get(src, {}):
+            return []
+        del self.adjacency[src][dst]
+
+        # Only sources with a shortest path over the removed link can change
+        affected = [s for s, dist in self.distances.items()
+                    if src in dist and dist.get(dst) == dist[src] + 1]
+        self._recompute(affected)
+        return affected
+
+    def _recompute(self, sources):
+        # Breadth-first search from every source, remembering the first hops of all shortest paths.
+        # A node is dequeued only after all nodes one hop closer, so its first hops are complete by then.
+        for src in sources:
+            distances = {src: 0}
+            first_hops = {}
+            queue = deque([src])
+            while queue:
+                node = queue.popleft()
+                hops = first_hops.get(node)
+                for neighbor, out_port in self.adjacency[node].items():
+                    reached = {(out_port, neighbor)} if node == src else hops
+                    if neighbor not in distances:
+                        distances[neighbor] = distances[node] + 1
+                        first_hops[neighbor] = set(reached)
+                        queue.append(neighbor)
+                    elif distances[neighbor] == distances[node] + 1:
+                        first_hops[neighbor] |= reached
+            ecmp_hops = {dst: tuple(sorted(hops)) for dst, hops in first_hops.items()}
+            self.distances[src] = distances
+            self.ecmp_hops[src] = ecmp_hops
+            self.next_hops[src] = {dst: hops[0] for dst, hops in ecmp_hops.items()}
+
+    # (out_port, next_dpid) of the shortest path from src to dst, None if unreachable
+    def get_next_hop(self, src, dst):
+        return self.next_hops.get(src, {}).get(dst)
+
+    # All (out_port, next_dpid) on a shortest path from src to dst, () if unreachable
+    def get_next_hops(self, src, dst):
+        return self.ecmp_hops.get(src, {}).get(dst, ())
+
+    # Inter-switch ports of a switch
+    def get_switch_ports(self, dpid):
+        return set(self.adjacency.get(dpid, {}).values())
+
 
 class SPRouter(app_manager.RyuApp):
 
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _CONTEXTS = {'wsgi': WSGIApplication}
+
+    # Seconds an elephant flow stays on the port it was moved to before it may move again
+    REROUTE_HOLD_TIME = 10.0
 
     def __init__(self, *args, **kwargs):
         super(SPRouter, self).__init__(*args, **kwargs)
+
+        # Counters and handler latencies, served on http://<controller>:8080/metrics
+        self.metrics = ControllerMetrics()
+        self.metrics.add_collector(self._collect_metrics)
+        self.metrics.serve(kwargs['wsgi'])
         
         # Initialize the topology with #ports=4
         self.topo_net = topo.Fattree(4)
+        self.addresses = self.topo_net.index
+
+        # Shortest paths between all switches, kept up to date by the topology events
+        self.paths = ShortestPathCache()
+
+        # Flow-mods are queued per switch and sent in batches closed by a barrier
+        self.flow_installer = FlowInstaller(self.logger)
+
+        # Table misses are metered in the switch and limited per source MAC in the controller,
+        # budgets={dpid: (packets/s, burst)} overrides the packet-in budget of single switches
+        self.packet_in_limiter = PacketInLimiter(self.logger, self.flow_installer)
+
+        # With miss_send_len=128 the switches buffer table misses and only send the headers,
+        # packet-outs reference the buffer. None sends full frames.
+        self.packet_buffering = PacketBuffering(self.logger, self.packet_in_limiter, miss_send_len=None)
+
+        # Link load and flow rates from port and flow statistics,
+        # elephant flows are moved from their select group to the least loaded equal-cost port
+        self.monitor = TrafficMonitor(self.logger,
+                                      flow_match=lambda parser: parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP))
+        self.pinned = {} # {(dpid, host_ip): (out_port, time)}
+        # The elephant is the flow entry of a destination host on a switch, moving it moves all
+        # flows towards that host, mice included. Off until the skewed test of bench/netbench.py
+        # shows a gain over ECMP alone (see README.md), False leaves all routes in their groups.
+        self.reroute_elephants = False
+
+        self.datapaths = {} # {dpid: datapath}
+        self.groups = {} # {dpid: {(group_type, (out_port, ...)): group_id}}
+        self.routes = {} # {(dpid, host_ip): ((out_port, ...), backup_port)} as installed
+        # Port state of the switch links, port numbers come from the port map
+        self.graph = SwitchGraph(self.topo_net)
+        self.switch_ports = {} # {dpid: {port_no}}
+        self.host_locations = {} # {host_ip: (dpid, port)}
+
+        # The port map of the topology already knows every link and where every server
+        # is connected, so paths exist before any switch connects and LLDP is optional
+        self.port_map = self.topo_net.port_map
+        links = []
+        for lnode, lport, rnode, rport in self.port_map.links:
+            left = self.addresses.get_by_id(lnode)
+            right = self.addresses.get_by_id(rnode)
+            if left.type == 'server':
+                self.host_locations[left.ip] = (right.dpid, rport)
+            else:
+                links.append((left.dpid, lport, right.dpid))
+                links.append((right.dpid, rport, left.dpid))
+            for address, port in ((left, lport), (right, rport)):
+                if address.dpid is not None:
+                    self.switch_ports.setdefault(address.dpid, set()).add(port)
+        self.paths.load_links(links)
 
 
     # Topology discovery
     @set_ev_cls(event.EventSwitchEnter)
-    def get_topology_data(self, ev):
+    @timed
+    def _switch_enter_handler(self, ev):
+        dpid = ev.switch.dp.id
+        self.switch_ports.setdefault(dpid, set()).update(port.port_no for port in ev.switch.ports)
+        self.paths.add_switch(dpid)
+
+    @set_ev_cls(event.EventSwitchLeave)
+    @timed
+    def _switch_leave_handler(self, ev):
+        dpid = ev.switch.dp.id
+        self.switch_ports.pop(dpid, None)
+        self.paths.remove_switch(dpid)
+        self.monitor.remove_datapath(dpid)
+        self.packet_in_limiter.remove_datapath(dpid)
+        self.packet_buffering.remove_datapath(dpid)
+        for key in [key for key in self.pinned if key[0] == dpid]:
+            del self.pinned[key]
+
+    # remove_switch() drops the links of a switch that left. When it connects again, the links of the
+    # port map whose far end is still known and up are loaded again, LLDP would only report them
+    # with --observe-links. The other switches move their routes back onto the new shortest paths.
+    def _restore_links(self, dpid):
+        if dpid in self.paths.adjacency:
+            return
+        links = []
+        for port, (neighbor, neighbor_port) in self.graph.adjacency.get(dpid, {}).items():
+            if neighbor in self.paths.adjacency and self.graph.is_up(dpid, port):
+                links.append((dpid, port, neighbor))
+                links.append((neighbor, neighbor_port, dpid))
+        self.paths.add_switch(dpid)
+        if links:
+            self.paths.load_links(links)
+            self._repair_routes(list(self.paths.adjacency))
 
-        # Switches and links in the network
-        switches = get_switch(self, None)
-        links = get_link(self, None)
+    # Only reported with LLDP discovery enabled (ryu-manager --observe-links)
+    @set_ev_cls(event.EventLinkAdd)
+    @timed
+    def _link_add_handler(self, ev):
+        link = ev.link
+        src_node = self.addresses.get_by_dpid(link.src.dpid)
+        dst_node = self.addresses.get_by_dpid(link.dst.dpid)
+        if src_node is None or dst_node is None or \
+                not self.port_map.matches(src_node.id, link.src.port_no, dst_node.id):
+            self.logger.warning("Discovered link %016x:%d -> %016x does not match the port map",
+                                link.src.dpid, link.src.port_no, link.dst.dpid)
+        affected = self.paths.add_link(link.src.dpid, link.src.port_no, link.dst.dpid)
+        self._repair_routes(affected)
+
+    @set_ev_cls(event.EventLinkDelete)
+    @timed
+    def _link_delete_handler(self, ev):
+        link = ev.link
+        affected = self.paths.remove_link(link.src.dpid, link.dst.dpid)
+        self._repair_routes(affected)
+
+    # Port state changes are reported by the switch itself, faster than LLDP notices them.
+    # The select and fast-failover groups already skip the dead port, the controller
+    # then moves the affected routes to the new shortest paths.
+    # See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#port-status-message
+    @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
+    @timed
+    def _port_status_handler(self, ev):
+        msg = ev.msg
+        dpid = msg.datapath.id
+        port = msg.desc.port_no
+        ofproto = msg.datapath.ofproto
+        up = msg.reason != ofproto.OFPPR_DELETE and not msg.desc.state & ofproto.OFPPS_LINK_DOWN
+        if up:
+            neighbor = self.graph.link_up(dpid, port)
+            if neighbor is None:
+                return
+            affected = self.paths.add_link(dpid, port, neighbor[0])
+            affected += self.paths.add_link(neighbor[0], neighbor[1], dpid)
+        else:
+            neighbor = self.graph.link_down(dpid, port)
+            if neighbor is None:
+                return
+            affected = self.paths.remove_link(dpid, neighbor[0])
+            affected += self.paths.remove_link(neighbor[0], dpid)
+        self._repair_routes(affected)
+
+    # Reinstall the routes of the switches whose shortest paths changed, and of their
+    # neighbors whose backup ports depend on them. Other routes are left alone.
+    def _repair_routes(self, sources):
+        if not sources:
+            return
+        start = time.time()
+        to_repair = set(sources)
+        for src in sources:
+            to_repair.update(self.paths.adjacency.get(src, {}))
+
+        repaired = 0
+        changed = set()
+        for (dpid, host_ip), installed in list(self.routes.items()):
+            if dpid not in to_repair:
+                continue
+            dst_dpid, _ = self.host_locations[host_ip]
+            out_ports = tuple(port for port, _ in self.paths.get_next_hops(dpid, dst_dpid))
+            if dpid == dst_dpid or not out_ports:
+                continue
+            if (out_ports, self._backup_port(dpid, dst_dpid, out_ports)) == installed:
+                continue
+            self._add_host_flows(self.datapaths[dpid], host_ip, out_ports)
+            self.pinned.pop((dpid, host_ip), None)
+            repaired += 1
+            changed.add(dpid)
+        for dpid in changed:
+            self.flow_installer.flush(self.datapaths[dpid])
+        self.logger.info("Topology change: %d routes repaired on %d switches in %.1f ms",
+                         repaired, len(changed), (time.time() - start) * 1000)
 
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    @timed
     def switch_features_handler(self, ev):
         datapath = ev.msg.datapath
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
+        self.datapaths[datapath.id] = datapath
+
+        self.monitor.add_datapath(datapath)
+
+        # Groups left over from an earlier connection would collide with the new group IDs
+        self.groups[datapath.id] = {}
+        for key in [key for key in self.pinned if key[0] == datapath.id]:
+            del self.pinned[key]
+        self.flow_installer.add_msg(datapath, parser.OFPGroupMod(
+            datapath, command=ofproto.OFPGC_DELETE, type_=ofproto.OFPGT_SELECT, group_id=ofproto.OFPG_ALL))
+
+        # Its routes are all installed again below, a switch that left also gets its links back
+        for key in [key for key in self.routes if key[0] == datapath.id]:
+            del self.routes[key]
+        self._restore_links(datapath.id)
+
         # Install entry-miss flow entry
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, match, actions)
+        self.packet_buffering.install_miss_flow(datapath)
 
+        # Install the next hops towards every known server right away
+        installed = 0
+        for host_ip, (dst_dpid, dst_port) in self.host_locations.items():
+            if datapath.id == dst_dpid:
+                out_ports = (dst_port,)
+            else:
+                out_ports = tuple(port for port, _ in self.paths.get_next_hops(datapath.id, dst_dpid))
+                if not out_ports:
+                    continue
+            self._add_host_flows(datapath, host_ip, out_ports)
+            installed += 1
+        self.flow_installer.flush(datapath)
+        self.logger.info("Installed routes to %d hosts on switch %016x", installed, datapath.id)
 
-    # Add a flow entry to the flow-table
+
+    # Add a flow entry to the flow-table, it is sent with the next flush of the datapath
     def add_flow(self, datapath, priority, match, actions):
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
+        self.flow_installer.add_flow(datapath, priority, match, actions)
+
+    # Flow-mods are confirmed by the barrier that closes each batch
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _barrier_reply_handler(self, ev):
+        self.flow_installer.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        self.flow_installer.error(ev.msg)
+
+    # Packet-in rate limits, see common/packet_in_limiter.py
+    @set_ev_cls(ofp_event.EventOFPMeterFeaturesStatsReply, MAIN_DISPATCHER)
+    def _meter_features_reply_handler(self, ev):
+        self.packet_in_limiter.meter_features_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def _meter_stats_reply_handler(self, ev):
+        self.packet_in_limiter.meter_stats_reply(ev.msg)
 
-        # Construct flow_mod message and send it
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                match=match, instructions=inst)
-        datapath.send_msg(mod)
+    # Routes, groups and hosts, read when the metrics are requested
+    def _collect_metrics(self):
+        samples = component_samples(self.flow_installer, self.packet_in_limiter, self.packet_buffering)
+        routes = {}
+        for dpid, _ in list(self.routes):
+            routes[dpid] = routes.get(dpid, 0) + 1
+        for dpid, count in routes.items():
+            samples.append(('host_routes', 'gauge', {'dpid': dpid_label(dpid)}, count))
+        for dpid, groups in list(self.groups.items()):
+            samples.append(('groups', 'gauge', {'dpid': dpid_label(dpid)}, len(groups)))
+        samples.append(('known_hosts', 'gauge', {}, len(self.host_locations)))
+        samples.append(('pinned_elephants', 'gauge', {}, len(self.pinned)))
+        return samples
 
 
+    # Statistics replies, see: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#port-statistics
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def _port_stats_reply_handler(self, ev):
+        self.monitor.port_stats_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    @timed
+    def _flow_stats_reply_handler(self, ev):
+        datapath = ev.msg.datapath
+        elephants = self.monitor.flow_stats_reply(ev.msg)
+        if not self.reroute_elephants:
+            return
+        for _, stat, bps in elephants:
+            self._reroute_elephant(datapath, stat, bps)
+        self._release_elephants(datapath)
+        self.flow_installer.flush(datapath)
+
+    # Move the flow of an elephant from its select group to the least loaded equal-cost port.
+    # It only moves if that relieves the busiest port by more than the elephant adds to the other one.
+    def _reroute_elephant(self, datapath, stat, bps):
+        dpid = datapath.id
+        host_ip = stat.match.get('ipv4_dst')
+        if host_ip is None or stat.table_id != 0 or stat.priority != 1 or host_ip not in self.host_locations:
+            return
+        dst_dpid, _ = self.host_locations[host_ip]
+        out_ports = [port for port, _ in self.paths.get_next_hops(dpid, dst_dpid)]
+        if len(out_ports) < 2:
+            return
+
+        loads = {port: self.monitor.get_tx_bps(dpid, port) for port in out_ports}
+        best = min(out_ports, key=loads.get)
+        now = time.time()
+        pinned = self.pinned.get((dpid, host_ip))
+        if pinned is not None:
+            current, since = pinned
+            if current == best or now - since < self.REROUTE_HOLD_TIME or loads[current] - loads[best] <= bps:
+                return
+        elif max(loads.values()) - loads[best] <= bps:
+            return
+
+        parser = datapath.ofproto_parser
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=host_ip)
+        self.add_flow(datapath, 1, match, [parser.OFPActionOutput(best)])
+        self.pinned[(dpid, host_ip)] = (best, now)
+        self.logger.info("Elephant to %s (%.1f Mbit/s) on switch %016x moved to port %d (%.1f Mbit/s load)",
+                         host_ip, bps / 1e6, dpid, best, loads[best] / 1e6)
+
+    # Give flows that are no elephant anymore back to their select group
+    def _release_elephants(self, datapath):
+        dpid = datapath.id
+        parser = datapath.ofproto_parser
+        now = time.time()
+        for (pinned_dpid, host_ip), (_, since) in list(self.pinned.items()):
+            if pinned_dpid != dpid or now - since < self.REROUTE_HOLD_TIME:
+                continue
+            match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=host_ip)
+            bps = self.monitor.get_flow_bps(dpid, 0, 1, match)
+            if bps is not None and bps >= self.monitor.elephant_bps / 2:
+                continue
+            del self.pinned[(dpid, host_ip)]
+            dst_dpid, _ = self.host_locations[host_ip]
+            out_ports = tuple(port for port, _ in self.paths.get_next_hops(dpid, dst_dpid))
+            if out_ports:
+                self._add_host_flows(datapath, host_ip, out_ports)
+                self.logger.info("Flow to %s on switch %016x back to equal-cost balancing", host_ip, dpid)
+
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
+        self.metrics.packet_in(ev)
+        if self.packet_buffering.packet_in(ev.msg) and self.packet_in_limiter.allow(ev.msg):
+            self._process_packet_in(ev)
+
+    @timed
+    def _process_packet_in(self, ev):
         msg = ev.msg
         datapath = msg.datapath
         dpid = datapath.id
+
+        in_port = msg.match['in_port']
+        pkt = packet.Packet(msg.data)
+        eth = pkt.get_protocol(ethernet.ethernet)
+
+        if eth.ethertype == ether_types.ETH_TYPE_ARP:
+            arp_pkt = pkt.get_protocol(arp.arp)
+            self._learn_host(arp_pkt.src_ip, dpid, in_port)
+            self._forward_arp(dpid, in_port, arp_pkt.dst_ip, msg.data)
+
+        elif eth.ethertype == ether_types.ETH_TYPE_IP:
+            ip_pkt = pkt.get_protocol(ipv4.ipv4)
+            self._learn_host(ip_pkt.src, dpid, in_port)
+            if ip_pkt.dst not in self.host_locations:
+                self.logger.info("Location of %s unknown, dropping packet", ip_pkt.dst)
+                return
+
+            actions = self._install_path(dpid, ip_pkt.dst)
+            # The flows along the path must be sent before the packet
+            self.flow_installer.flush_all()
+            if actions is None:
+                self.logger.info("No path from switch %016x to %s", dpid, ip_pkt.dst)
+                return
+            self.packet_buffering.packet_out(msg, actions, in_port)
+
+    # Remember where a host is connected, packets arriving on inter-switch ports are ignored
+    def _learn_host(self, host_ip, dpid, in_port):
+        if in_port in self.paths.get_switch_ports(dpid):
+            return
+        self.host_locations[host_ip] = (dpid, in_port)
+
+    # Install the flows for dst_ip on all switches of the shortest paths from src_dpid to the
+    # destination host and return the actions for the packet at src_dpid, None without a path.
+    # Equal-cost paths fan out, so every switch a packet can reach gets its flows.
+    def _install_path(self, src_dpid, dst_ip):
+        dst_dpid, dst_port = self.host_locations[dst_ip]
+        first_actions = None
+        visited = {src_dpid}
+        queue = deque([src_dpid])
+        while queue:
+            node = queue.popleft()
+            if node == dst_dpid:
+                out_ports, next_nodes = (dst_port,), ()
+            else:
+                next_hops = self.paths.get_next_hops(node, dst_dpid)
+                if not next_hops:
+                    return None
+                out_ports = tuple(port for port, _ in next_hops)
+                next_nodes = [next_node for _, next_node in next_hops]
+
+            datapath = self.datapaths.get(node)
+            if datapath is None:
+                return None
+            actions = self._add_host_flows(datapath, dst_ip, out_ports)
+            if first_actions is None:
+                first_actions = actions
+
+            for next_node in next_nodes:
+                if next_node not in visited:
+                    visited.add(next_node)
+                    queue.append(next_node)
+        return first_actions
+
+    # Forward IPv4 and ARP packets for a host, ARP is matched on the target address.
+    # IPv4 is spread over equal-cost ports by a select group, the switch hashes each
+    # flow onto one bucket so the packets of a connection stay in order. A single
+    # next hop is protected by a fast-failover group if a loop-free backup port exists.
+    # Returns the actions of the IPv4 flow.
+    def _add_host_flows(self, datapath, host_ip, out_ports):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
+        dst_dpid, _ = self.host_locations[host_ip]
+        backup = self._backup_port(datapath.id, dst_dpid, out_ports)
+        self.routes[(datapath.id, host_ip)] = (out_ports, backup)
+        if len(out_ports) > 1:
+            actions = [parser.OFPActionGroup(self._get_group(datapath, ofproto.OFPGT_SELECT, out_ports))]
+            arp_actions = [parser.OFPActionOutput(out_ports[0])]
+        elif backup is not None:
+            actions = [parser.OFPActionGroup(self._get_group(datapath, ofproto.OFPGT_FF, out_ports + (backup,)))]
+            arp_actions = actions
+        else:
+            actions = [parser.OFPActionOutput(out_ports[0])]
+            arp_actions = actions
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=host_ip)
+        self.add_flow(datapath, 1, match, actions)
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_ARP, arp_tpa=host_ip)
+        self.add_flow(datapath, 1, match, arp_actions)
+        return actions
+
+    # Loop-free alternate of a single next hop: a neighbor whose own shortest path to
+    # dst_dpid does not lead back through dpid. None for the last hop or if there is none.
+    def _backup_port(self, dpid, dst_dpid, out_ports):
+        if len(out_ports) != 1 or dpid == dst_dpid:
+            return None
+        distances = self.paths.distances
+        own = distances.get(dpid, {}).get(dst_dpid)
+        if own is None:
+            return None
+        candidates = []
+        for neighbor, port in self.paths.adjacency.get(dpid, {}).items():
+            to_dst = distances.get(neighbor, {}).get(dst_dpid)
+            to_self = distances.get(neighbor, {}).get(dpid)
+            if port != out_ports[0] and to_dst is not None and to_self is not None and to_dst < to_self + own:
+                candidates.append((to_dst, port))
+        return min(candidates)[1] if candidates else None
+
+    # Group ID of the select or fast-failover group over out_ports, the group is created on first use
+    # See: https://ryu.readthedocs.io/en/latest/ofproto_v1_3_ref.html#ryu.ofproto.ofproto_v1_3_parser.OFPGroupMod
+    def _get_group(self, datapath, group_type, out_ports):
+        groups = self.groups.setdefault(datapath.id, {})
+        group_id = groups.get((group_type, out_ports))
+        if group_id is not None:
+            return group_id
+
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        group_id = len(groups) + 1
+        groups[(group_type, out_ports)] = group_id
+        # Queued before the flows that use it, the switch processes the batch in order
+        if group_type == ofproto.OFPGT_FF:
+            mod = failover_group_mod(datapath, group_id, out_ports)
+        else:
+            buckets = [parser.OFPBucket(weight=1, watch_port=port, watch_group=ofproto.OFPG_ANY,
+                                        actions=[parser.OFPActionOutput(port)])
+                       for port in out_ports]
+            mod = parser.OFPGroupMod(datapath, command=ofproto.OFPGC_ADD, type_=ofproto.OFPGT_SELECT,
+                                     group_id=group_id, buckets=buckets)
+        self.flow_installer.add_msg(datapath, mod)
+        return group_id
+
+    # ARP is sent straight to the target host if its location is known. Otherwise it is
+    # flooded on the host ports of the lower layer switch the address belongs to, or of
+    # all switches for unknown addresses; flooding on inter-switch ports would loop
+    def _forward_arp(self, src_dpid, in_port, dst_ip, data):
+        if dst_ip in self.host_locations:
+            targets = [self.host_locations[dst_ip]]
+        else:
+            candidates = self.switch_ports.items()
+            server = self.addresses.get_by_ip(dst_ip)
+            if server is not None:
+                switch = self.addresses.get_by_coords(server.pod, server.switch, 1)
+                candidates = [(switch.dpid, self.switch_ports.get(switch.dpid, []))]
+            targets = [(dpid, port)
+                       for dpid, ports in candidates
+                       for port in ports
+                       if port not in self.paths.get_switch_ports(dpid) and (dpid, port) != (src_dpid, in_port)]
 
-        # TODO: handle new packets at the controller
\ No newline at end of file
+        for dpid, port in targets:
+            datapath = self.datapaths[dpid]
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            out = parser.OFPPacketOut(datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER,
+                                      in_port=ofproto.OFPP_CONTROLLER,
+                                      actions=[parser.OFPActionOutput(port)], data=data)
+            datapath.send_msg(out)
@@ -19,8 +19,14 @@
  CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
  """
 
+from array import array
+from bisect import bisect_left
+import sys
+
 # Class for an edge in the graph
 class Edge:
+	__slots__ = ('lnode', 'rnode')
+
 	def __init__(self):
 		self.lnode = None
 		self.rnode = None
@@ -33,10 +39,14 @@ class Edge:
 
 # Class for a node in the graph
 class Node:
-	def __init__(self, id, type):
+	__slots__ = ('edges', 'id', 'type', 'ip')
+
+	def __init__(self, id, type, ip=None):
 		self.edges = []
 		self.id = id
 		self.type = type
+		# Al-Fares address of the node (10.pod.switch.id)
+		self.ip = ip
 
 	# Add an edge connected to another node
 	def add_edge(self, node):
@@ -51,6 +61,10 @@ class Node:
 	def remove_edge(self, edge):
 		self.edges.remove(edge)
 
+	# Get the node at the other end of an edge of this node
+	def get_neighbor(self, edge):
+		return edge.rnode if edge.lnode is self else edge.lnode
+
 	# Decide if another node is a neighbor
 	def is_neighbor(self, node):
 		for edge in self.edges:
@@ -59,16 +73,304 @@ class Node:
 		return False
 
 
+# Node types of the compact graph, a node stores the index of its type in this tuple
+NODE_TYPES = ('server', 'lower_level_switch', 'upper_level_switch', 'core_level_switch')
+SERVER, LOWER_LEVEL_SWITCH, UPPER_LEVEL_SWITCH, CORE_LEVEL_SWITCH = range(len(NODE_TYPES))
+
+
+class CompactGraph:
+	"""
+	Compressed sparse row (CSR) representation of an undirected graph
+
+	Nodes are numbered 0..n-1, the neighbors of node i are stored in ascending
+	order in neighbors[offsets[i]:offsets[i+1]]. No per-node objects are kept,
+	so large fat-trees only cost a few bytes per node and edge.
+	"""
+	__slots__ = ('ids', 'ips', 'types', 'offsets', 'neighbors', '_index')
+
+	def __init__(self, ids, types, lnodes, rnodes, ips=None):
+		num_nodes = len(ids)
+		self.ids = ids
+		self.ips = ips
+		self.types = array('B', types)
+		self._index = None
+
+		# count the degree of every node and turn the counts into row offsets
+		offsets = array('I', [0]) * (num_nodes + 1)
+		for u, v in zip(lnodes, rnodes):
+			offsets[u + 1] += 1
+			offsets[v + 1] += 1
+		for i in range(num_nodes):
+			offsets[i + 1] += offsets[i]
+
+		# fill the rows, every edge is stored in both directions
+		neighbors = array('I', [0]) * offsets[num_nodes]
+		free = offsets[:-1]
+		for u, v in zip(lnodes, rnodes):
+			neighbors[free[u]] = v
+			free[u] += 1
+			neighbors[free[v]] = u
+			free[v] += 1
+		for i in range(num_nodes):
+			start, end = offsets[i], offsets[i + 1]
+			neighbors[start:end] = array('I', sorted(neighbors[start:end]))
+
+		self.offsets = offsets
+		self.neighbors = neighbors
+
+	# Create the graph from already computed CSR arrays, e.g. by the vectorized generator
+	@classmethod
+	def from_csr(cls, ids, types, offsets, neighbors, ips=None):
+		graph = cls.__new__(cls)
+		graph.ids = ids
+		graph.ips = ips
+		graph.types = types
+		graph.offsets = offsets
+		graph.neighbors = neighbors
+		graph._index = None
+		return graph
+
+	def __len__(self):
+		return len(self.ids)
+
+	def get_type(self, node):
+		return NODE_TYPES[self.types[node]]
+
+	def degree(self, node):
+		return self.offsets[node + 1] - self.offsets[node]
+
+	def get_neighbors(self, node):
+		return self.neighbors[self.offsets[node]:self.offsets[node + 1]]
+
+	# Binary search in the sorted row of the node
+	def is_neighbor(self, node, other):
+		start, end = self.offsets[node], self.offsets[node + 1]
+		pos = bisect_left(self.neighbors, other, start, end)
+		return pos < end and self.neighbors[pos] == other
+
+	# Integer id of a node by its name, the lookup table is only built on first use
+	def get_index(self, id):
+		if self._index is None:
+			self._index = {node_id: i for i, node_id in enumerate(self.ids)}
+		return self._index[id]
+
+	# Approximate memory footprint in bytes
+	def memory_size(self):
+		size = 0
+		for names in (self.ids, self.ips or []):
+			size += sys.getsizeof(names) + sum(sys.getsizeof(name) for name in names)
+		for arr in (self.types, self.offsets, self.neighbors):
+			size += arr.itemsize * len(arr)
+		return size
+
+
+# Derive the datapath ID of a switch from its 10.x.y.z address,
+# e.g. 10.4.1.2 -> 0x040102. Unique as long as k < 256.
+def dpid_from_ip(ip):
+	_, x, y, z = (int(octet) for octet in ip.split('.'))
+	return (x << 16) | (y << 8) | z
+
+
+# Derive the MAC address of a node from its 10.x.y.z address, e.g. 10.4.1.2 -> 00:00:0a:04:01:02
+def mac_from_ip(ip):
+	return '00:00:' + ':'.join('%02x' % int(octet) for octet in ip.split('.'))
+
+
+# Identity of a fat-tree node. pod/switch/host are the three last octets of the
+# address, for core switches pod is k. dpid is None for servers.
+class NodeAddress:
+	__slots__ = ('index', 'id', 'type', 'pod', 'switch', 'host', 'ip', 'dpid', 'mac')
+
+	def __init__(self, index, id, type, ip):
+		_, pod, switch, host = (int(octet) for octet in ip.split('.'))
+		self.index = index # position in switches + servers, the node id of the compact graph
+		self.id = id
+		self.type = type
+		self.pod = pod
+		self.switch = switch
+		self.host = host
+		self.ip = ip
+		self.dpid = None if type == 'server' else (pod << 16) | (switch << 8) | host
+		self.mac = mac_from_ip(ip)
+
+
+class AddressIndex:
+	"""
+	Bidirectional index of all fat-tree nodes: name <-> (pod, switch, host) <-> ip <-> dpid <-> mac
+
+	All lookups are plain dictionary hits and return a NodeAddress (or None).
+	"""
+
+	def __init__(self, entries):
+		self.by_id = {}
+		self.by_coords = {}
+		self.by_ip = {}
+		self.by_dpid = {}
+		self.by_mac = {}
+		for entry in entries:
+			self.by_id[entry.id] = entry
+			self.by_coords[(entry.pod, entry.switch, entry.host)] = entry
+			self.by_ip[entry.ip] = entry
+			self.by_mac[entry.mac] = entry
+			if entry.dpid is not None:
+				self.by_dpid[entry.dpid] = entry
+
+	def __len__(self):
+		return len(self.by_id)
+
+	def get_by_id(self, id):
+		return self.by_id.get(id)
+
+	def get_by_coords(self, pod, switch, host):
+		return self.by_coords.get((pod, switch, host))
+
+	def get_by_ip(self, ip):
+		return self.by_ip.get(ip)
+
+	def get_by_dpid(self, dpid):
+		return self.by_dpid.get(dpid)
+
+	def get_by_mac(self, mac):
+		return self.by_mac.get(mac)
+
+
+class PortMap:
+	"""
+	Deterministic port numbers of all links of a topology
+
+	Ports are handed out per node in link order, like Mininet does: switch ports
+	start at 1, server interfaces at 0. FattreeNet creates its links with exactly
+	these ports, so the controllers know the ports without LLDP discovery.
+	"""
+
+	def __init__(self, links):
+		self.links = [] # [(lnode_id, lport, rnode_id, rport)] in creation order
+		self.ports = {} # {node_id: {port: (neighbor_id, neighbor_port)}}
+		self.by_neighbor = {} # {node_id: {neighbor_id: port}}
+		for lnode, rnode in links:
+			lport = self._next_port(lnode)
+			rport = self._next_port(rnode)
+			self.links.append((lnode.id, lport, rnode.id, rport))
+			self.ports[lnode.id][lport] = (rnode.id, rport)
+			self.ports[rnode.id][rport] = (lnode.id, lport)
+			self.by_neighbor.setdefault(lnode.id, {})[rnode.id] = lport
+			self.by_neighbor.setdefault(rnode.id, {})[lnode.id] = rport
+
+	def _next_port(self, node):
+		ports = self.ports.setdefault(node.id, {})
+		return len(ports) + (0 if node.type == 'server' else 1)
+
+	# Port of node_id that connects to neighbor_id, None if they are not connected
+	def get_port(self, node_id, neighbor_id):
+		return self.by_neighbor.get(node_id, {}).get(neighbor_id)
+
+	# (neighbor_id, neighbor_port) behind a port, None if the port is not used
+	def get_neighbor(self, node_id, port):
+		return self.ports.get(node_id, {}).get(port)
+
+	def get_ports(self, node_id):
+		return self.ports.get(node_id, {})
+
+	# Check a discovered link (e.g. by LLDP) against the port map
+	def matches(self, node_id, port, neighbor_id):
+		neighbor = self.get_neighbor(node_id, port)
+		return neighbor is not None and neighbor[0] == neighbor_id
+
+
 class Fattree:
 
-	def __init__(self, num_ports):
-		self.servers = []
-		self.switches = []
-		self.generate(num_ports)
+	# compact=True only builds self.graph (a CompactGraph), vectorized=True does the same
+	# with NumPy. The Node/Edge objects of these modes are only created on first access.
+	def __init__(self, num_ports, compact=False, vectorized=False):
+		self.num_ports = num_ports
+		self.graph = None
+		self._index = None
+		self._port_map = None
+		if vectorized:
+			self._servers = None
+			self._switches = None
+			self.generate_vectorized(num_ports)
+		elif compact:
+			self._servers = None
+			self._switches = None
+			self.generate_compact(num_ports)
+		else:
+			self._servers = []
+			self._switches = []
+			self.generate(num_ports)
+
+	@property
+	def servers(self):
+		if self._servers is None:
+			self._build_objects()
+		return self._servers
+
+	@property
+	def switches(self):
+		if self._switches is None:
+			self._build_objects()
+		return self._switches
+
+	# Address index of all nodes, built once on first use from either representation
+	@property
+	def index(self):
+		if self._index is None:
+			if self.graph is not None:
+				graph = self.graph
+				entries = (NodeAddress(i, graph.ids[i], graph.get_type(i), graph.ips[i]) for i in range(len(graph)))
+			else:
+				entries = (NodeAddress(i, node.id, node.type, node.ip)
+						   for i, node in enumerate(self.switches + self.servers))
+			self._index = AddressIndex(entries)
+		return self._index
+
+	# Links in the order FattreeNet creates them: lower layer switches to servers, lower
+	# to upper layer switches and upper layer to core switches. Within a layer the links
+	# follow the switch and edge order, so ports 1..k/2 of a pod switch face down,
+	# ports k/2+1..k face up and port p+1 of a core switch faces pod p.
+	def get_links(self):
+		lower_switches = [switch for switch in self.switches if switch.type == 'lower_level_switch']
+		upper_switches = [switch for switch in self.switches if switch.type == 'upper_level_switch']
+		links = []
+		for layer, neighbor_type in ((lower_switches, 'server'),
+									 (lower_switches, 'upper_level_switch'),
+									 (upper_switches, 'core_level_switch')):
+			for switch in layer:
+				for edge in switch.edges:
+					neighbor = switch.get_neighbor(edge)
+					if neighbor.type != neighbor_type:
+						continue
+					links.append((neighbor, switch) if neighbor_type == 'server' else (switch, neighbor))
+		return links
+
+	# Port numbers of all links, derived once on first use
+	@property
+	def port_map(self):
+		if self._port_map is None:
+			self._port_map = PortMap(self.get_links())
+		return self._port_map
+
+	# Node object of an index entry
+	def get_node(self, address):
+		num_switches = len(self.switches)
+		if address.index < num_switches:
+			return self.switches[address.index]
+		return self.servers[address.index - num_switches]
+
+	# Build the Node/Edge object view from the compact graph
+	def _build_objects(self):
+		graph = self.graph
+		nodes = [Node(id=graph.ids[i], type=graph.get_type(i), ip=graph.ips[i] if graph.ips else None)
+				 for i in range(len(graph))]
+		for u, node in enumerate(nodes):
+			for v in graph.get_neighbors(u):
+				if u < v:
+					node.add_edge(nodes[v])
+		self._switches = [node for node in nodes if node.type != 'server']
+		self._servers = [node for node in nodes if node.type == 'server']
 
 	def generate(self, num_ports):
 		# claculate number of switches for overview
-		print(type(num_ports))
 		pods = num_ports
 		switches_per_pod = num_ports
 		num_core_switches = num_ports**2 // 4
@@ -86,7 +388,8 @@ class Fattree:
 		core_switches = []
 		for i in range(num_core_switches):
 			
-			switch = Node(id=f'csp{num_ports}s{(i//subnets)+1}n{(i%subnets)+1}', type='core_level_switch')
+			switch = Node(id=f'csp{num_ports}s{(i//subnets)+1}n{(i%subnets)+1}', type='core_level_switch',
+						  ip=f'10.{num_ports}.{(i//subnets)+1}.{(i%subnets)+1}')
 			core_switches.append(switch)
 
         # TODO: Changwe names (servers;switches) to our style???
@@ -99,10 +402,12 @@ class Fattree:
 			# create upper layer switches:
 			for i in range(switches_per_pod//2):
 				# upper layer switches naming: usp1s1, usp1s2, ...
-				upper_switch = Node(id=f'usp{pod}s{subnets+i}n{1}', type='upper_level_switch')
+				upper_switch = Node(id=f'usp{pod}s{subnets+i}n{1}', type='upper_level_switch',
+									ip=f'10.{pod}.{subnets+i}.1')
 				# connect upper layer switches to core switches
+				# the i-th upper switch of every pod connects to the i-th group of k/2 core switches
 				for j in range(num_ports//2):
-					upper_switch.add_edge(core_switches[j*i])
+					upper_switch.add_edge(core_switches[i*subnets + j])
 				upper_layer_switches.append(upper_switch)
 			
 			# seperated for readability (could be done in one loop)
@@ -110,9 +415,13 @@ class Fattree:
 			for i in range(switches_per_pod // 2):
 				# lower layer switches naming: ls1, ls2, ...
 				# alternatively maybe: lsp1s(i*2+1) ??? --> ask tobi and niklas
-				lower_switch = Node(id=f'lsp{pod}s{subnets+i}n{1}', type='lower_level_switch')
+				# lower layer switches are numbered 0..k/2-1 in the pod, upper layer k/2..k-1
+				lower_switch = Node(id=f'lsp{pod}s{i}n{1}', type='lower_level_switch',
+									ip=f'10.{pod}.{i}.1')
 				for host in range(num_ports//2):
-					server = Node(id=f'serp{pod}s{i+1}h{host+1}', type='server')
+					# host ids start at 2 (10.pod.switch.2 ... 10.pod.switch.k/2+1)
+					server = Node(id=f'serp{pod}s{i}h{host+2}', type='server',
+								  ip=f'10.{pod}.{i}.{host+2}')
 					server.add_edge(lower_switch)
 					server_in_pod.append(server)
 				# connnect lower and upper layer switches in pod
@@ -125,4 +434,114 @@ class Fattree:
 			self.switches.extend(lower_layer_switches)
 		self.switches.extend(core_switches)
 
+	# Generate the fat-tree straight into a CompactGraph. Nodes are numbered like the
+	# object lists: switches (per pod upper then lower layer, then core) followed by servers
+	def generate_compact(self, num_ports):
+		k = num_ports
+		half = k // 2
+		num_switches = k * k + half * half
+		ids = []
+		ips = []
+		types = []
+		for pod in range(k):
+			for i in range(half):
+				ids.append(f'usp{pod}s{half+i}n1')
+				ips.append(f'10.{pod}.{half+i}.1')
+				types.append(UPPER_LEVEL_SWITCH)
+			for i in range(half):
+				ids.append(f'lsp{pod}s{i}n1')
+				ips.append(f'10.{pod}.{i}.1')
+				types.append(LOWER_LEVEL_SWITCH)
+		for i in range(half * half):
+			ids.append(f'csp{k}s{(i//half)+1}n{(i%half)+1}')
+			ips.append(f'10.{k}.{(i//half)+1}.{(i%half)+1}')
+			types.append(CORE_LEVEL_SWITCH)
+		for pod in range(k):
+			for i in range(half):
+				for host in range(half):
+					ids.append(f'serp{pod}s{i}h{host+2}')
+					ips.append(f'10.{pod}.{i}.{host+2}')
+					types.append(SERVER)
+
+		lnodes = array('I')
+		rnodes = array('I')
+		for pod in range(k):
+			for i in range(half):
+				upper = pod * k + i
+				lower = pod * k + half + i
+				for j in range(half):
+					# upper switch - core switch, server - lower switch, lower switch - upper switch
+					lnodes.extend((upper, num_switches + (pod * half + i) * half + j, lower))
+					rnodes.extend((k * k + i * half + j, lower, pod * k + j))
+
+		self.graph = CompactGraph(ids, types, lnodes, rnodes, ips=ips)
+
+	# Same graph as generate_compact, but all node names, addresses and edge endpoints
+	# are computed in bulk with NumPy instead of per node in Python loops
+	def generate_vectorized(self, num_ports):
+		# NumPy is only needed for this generator, the Mininet and Ryu scripts work without it
+		import numpy as np
+
+		k = num_ports
+		half = k // 2
+		num_pod_switches = k * k
+		num_switches = num_pod_switches + half * half
+		num_nodes = num_switches + k * half * half
+
+		# Converting integer arrays with astype(str) is slow, all numbers are at most k+1,
+		# so they are looked up in a small table of decimal strings instead
+		numbers = np.array([str(i) for i in range(k + 2)])
+
+		def text(part):
+			return numbers[part] if isinstance(part, np.ndarray) and part.dtype.kind in 'iu' else part
+
+		def join(*parts):
+			result = text(parts[0])
+			for part in parts[1:]:
+				result = np.char.add(result, text(part))
+			return result
+
+		# pod switches: per pod the upper layer (switch numbers k/2..k-1), then the lower layer (0..k/2-1)
+		pod = np.repeat(np.arange(k), k)
+		position = np.tile(np.arange(k), k)
+		is_upper = position < half
+		switch_num = np.where(is_upper, position + half, position - half)
+		pod_ids = join(np.where(is_upper, 'usp', 'lsp'), pod, 's', switch_num, 'n1')
+		pod_ips = join('10.', pod, '.', switch_num, '.1')
+		pod_types = np.where(is_upper, UPPER_LEVEL_SWITCH, LOWER_LEVEL_SWITCH)
+
+		# core switches
+		core = np.arange(half * half)
+		core_ids = join(f'csp{k}s', core // half + 1, 'n', core % half + 1)
+		core_ips = join(f'10.{k}.', core // half + 1, '.', core % half + 1)
+
+		# servers: per pod, per lower layer switch, host ids 2..k/2+1
+		server_pod, server_switch, server_host = np.indices((k, half, half)).reshape(3, -1)
+		server_ids = join('serp', server_pod, 's', server_switch, 'h', server_host + 2)
+		server_ips = join('10.', server_pod, '.', server_switch, '.', server_host + 2)
+
+		ids = np.concatenate((pod_ids, core_ids, server_ids)).tolist()
+		ips = np.concatenate((pod_ips, core_ips, server_ips)).tolist()
+		types = np.concatenate((pod_types, np.full(len(core), CORE_LEVEL_SWITCH),
+								np.full(len(server_ids), SERVER))).astype(np.uint8)
+
+		# edge endpoints: upper - core, server - lower, lower - upper
+		p, i, j = np.indices((k, half, half)).reshape(3, -1)
+		upper = p * k + i
+		lower = p * k + half + i
+		lnodes = np.concatenate((upper, num_switches + (p * half + i) * half + j, lower))
+		rnodes = np.concatenate((num_pod_switches + i * half + j, lower, p * k + j))
+
+		# CSR: both directions of every edge, sorted by source and then by neighbor
+		sources = np.concatenate((lnodes, rnodes))
+		targets = np.concatenate((rnodes, lnodes))
+		order = np.lexsort((targets, sources))
+		offsets = np.zeros(num_nodes + 1, dtype=np.uint32)
+		np.cumsum(np.bincount(sources, minlength=num_nodes), out=offsets[1:])
+		neighbors = targets[order].astype(np.uint32)
+
+		self.graph = CompactGraph.from_csr(ids, array('B', types.tobytes()),
+										   array('I', offsets.tobytes()), array('I', neighbors.tobytes()),
+										   ips=ips)
+
 	# TODO: code for generating the fat-tree topology
\ No newline at end of file
@@ -91,5 +91,6 @@ sudo pip install eventlet==0.30.2
 
 # Install needed Python libraries
 pip install networkx
+pip install numpy
 pip install matplotlib
 